@@ -26,7 +26,7 @@ def search():
     if results:
         for r in results:
             item = r.copy()
-            content = engine.get_document_content(r['doc_id'])
+            content = engine.get_document_summary(r['doc_id'])
             if content:
                 item['snippet'] = content['abstract'][:150] + "..."
             else:
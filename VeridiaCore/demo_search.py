@@ -27,7 +27,7 @@ def main():
             for r in results:
                 print(f"  [{r['score']}] {r['title']} ({r['filename']})")
                 # Optional: Print snippet if available
-                content = engine.get_document_content(r['doc_id'])
+                content = engine.get_document_summary(r['doc_id'])
                 if content:
                     print(f"     Snippet: {content['abstract'][:100]}...")
         else:
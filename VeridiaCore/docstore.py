@@ -0,0 +1,293 @@
+"""
+Veridia Search Engine - Document Store
+Block-compressed copies of the documents, with the fields a result page
+shows kept apart from the full text
+"""
+import os
+import json
+import mmap
+import zlib
+import struct
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+import numpy as np
+
+# Two stores, each a pair of files:
+#   docstore_summary   title, authors and the abstract preview of every document
+#   docstore_text      the full text
+# and, written afterwards from them and the metadata, an optional third:
+#   docstore_results   each document's search result fields as ready-made JSON
+# <store>.bin is a run of zlib-compressed blocks, each holding consecutive
+# documents; <store>.idx has one (first doc ID, byte offset) per block. A
+# decompressed block is: document count n, n doc IDs, n + 1 record offsets
+# (relative to the records), then the records back to back.
+SUMMARY_STORE = "docstore_summary"
+TEXT_STORE = "docstore_text"
+RESULT_STORE = "docstore_results"
+DOCSTORE_FILES = tuple(store + ext for store in (SUMMARY_STORE, TEXT_STORE) for ext in (".bin", ".idx"))
+RESULT_FILES = (RESULT_STORE + ".bin", RESULT_STORE + ".idx")
+INDEX_ENTRY = struct.Struct('<QQ')
+INDEX_DTYPE = np.dtype([('doc_id', '<u8'), ('offset', '<u8')])
+SUMMARY_FIELDS = struct.Struct('<III')  # byte lengths of title, authors, abstract
+
+# Uncompressed bytes gathered per block. Summary blocks stay small because a
+# result page reads one record out of each; text is read one document at a
+# time but compresses better in bigger blocks.
+SUMMARY_BLOCK_BYTES = 4 * 1024
+TEXT_BLOCK_BYTES = 64 * 1024
+
+# Decompressed blocks kept per store, for documents read again soon
+BLOCK_CACHE_SIZE = 256
+
+# Characters of the abstract shown on the result page
+ABSTRACT_PREVIEW = 500
+
+
+def document_fields(data):
+    """(title, authors, abstract preview, text) of a decoded dataset.jsonl record, as the engine shows them"""
+    title = data.get('title', 'No Title')
+    authors = data.get('authors', 'Unknown')
+    abstract = data.get('abstract', '')[:ABSTRACT_PREVIEW]
+    text = data.get('text', data.get('abstract', 'No content available'))
+    return tuple(value if isinstance(value, str) else str(value)
+                 for value in (title, authors, abstract, text))
+
+
+class _BlockWriter:
+    """Appends records to one store, a block at a time"""
+
+    def __init__(self, path, block_bytes, level, mode):
+        self.data_file = open(path + ".bin", mode)
+        self.index_file = open(path + ".idx", mode)
+        self.block_bytes = block_bytes
+        self.level = level
+        self.doc_ids = []
+        self.records = []
+        self.size = 0
+
+    def add(self, doc_id, record):
+        self.doc_ids.append(doc_id)
+        self.records.append(record)
+        self.size += len(record)
+        if self.size >= self.block_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write the documents gathered so far as a (possibly short) block"""
+        if not self.doc_ids:
+            return
+        n = len(self.doc_ids)
+        ends = np.cumsum([0] + [len(record) for record in self.records], dtype=np.uint32)
+        block = b''.join([struct.pack('<I', n), np.array(self.doc_ids, dtype='<u4').tobytes(),
+                          ends.astype('<u4').tobytes()] + self.records)
+        self.index_file.write(INDEX_ENTRY.pack(self.doc_ids[0], self.data_file.tell()))
+        self.data_file.write(zlib.compress(block, self.level))
+        self.doc_ids = []
+        self.records = []
+        self.size = 0
+
+    def files(self):
+        return self.data_file, self.index_file
+
+    def close(self):
+        self.flush()
+        for f in self.files():
+            f.close()
+
+
+class DocStoreWriter:
+    """
+    Writes the summary and text stores of the documents added, in doc ID
+    order, into directory. With append, adds to the stores already there
+    (after cutting them back to a consistent size, see BuildCheckpoint).
+    """
+
+    def __init__(self, directory, append=False, level=6):
+        mode = 'ab' if append else 'wb'
+        self.summary = _BlockWriter(os.path.join(directory, SUMMARY_STORE), SUMMARY_BLOCK_BYTES, level, mode)
+        self.text = _BlockWriter(os.path.join(directory, TEXT_STORE), TEXT_BLOCK_BYTES, level, mode)
+
+    def add(self, doc_id, data):
+        """Store one decoded dataset.jsonl record"""
+        title, authors, abstract, text = (value.encode('utf-8', errors='replace')
+                                          for value in document_fields(data))
+        self.summary.add(doc_id, SUMMARY_FIELDS.pack(len(title), len(authors), len(abstract))
+                         + title + authors + abstract)
+        self.text.add(doc_id, text)
+
+    def flush(self):
+        """Finish the open blocks and write out the files (before a checkpoint records their sizes)"""
+        for store in (self.summary, self.text):
+            store.flush()
+            for f in store.files():
+                f.flush()
+                os.fsync(f.fileno())
+
+    def sizes(self):
+        """Bytes written to each file, in DOCSTORE_FILES order"""
+        return [f.tell() for store in (self.summary, self.text) for f in store.files()]
+
+    def close(self):
+        self.summary.close()
+        self.text.close()
+
+
+def encode_result(title, filename, abstract=None, authors=None):
+    """
+    JSON members (without braces) of a search result's display fields, to be
+    spliced after its doc_id and score; abstract and authors are left out
+    when the document's content is unavailable
+    """
+    fields = {"title": title, "filename": filename}
+    if abstract is not None:
+        fields["abstract"] = abstract
+        fields["authors"] = authors
+    return json.dumps(fields, separators=(',', ':')).encode('ascii')[1:-1]
+
+
+def write_results(directory, metadata, level=6):
+    """
+    Write the result store of the documents in metadata ({doc_id: {"title",
+    "filename"}}, or a MetadataTable) from the summary store in directory
+    """
+    store = DocStore(directory)
+    tmp_path = os.path.join(directory, RESULT_STORE + ".tmp")
+    writer = _BlockWriter(tmp_path, SUMMARY_BLOCK_BYTES, level, 'wb')
+    try:
+        for doc_id in sorted(metadata):
+            row = metadata[doc_id]
+            summary = store.summary(doc_id)
+            if summary is None:
+                writer.add(doc_id, encode_result(row["title"], row["filename"]))
+            else:
+                writer.add(doc_id, encode_result(row["title"], row["filename"],
+                                                 summary["abstract"], summary["authors"]))
+    finally:
+        writer.close()
+        store.close()
+    for ext in (".bin", ".idx"):
+        os.replace(tmp_path + ext, os.path.join(directory, RESULT_STORE + ext))
+
+
+def move_docstore(source_dir, target_dir):
+    """
+    Move finished stores into target_dir, replacing its (possibly mapped)
+    old ones file by file. An old result store is deleted if none was
+    written, as it no longer matches.
+    """
+    for name in DOCSTORE_FILES + RESULT_FILES:
+        source, target = os.path.join(source_dir, name), os.path.join(target_dir, name)
+        if name in DOCSTORE_FILES or os.path.exists(source):
+            os.replace(source, target)
+        elif os.path.exists(target):
+            os.remove(target)
+
+
+class _BlockReader:
+    """Random access to the records of one store"""
+
+    def __init__(self, path):
+        self.index = np.fromfile(path + ".idx", dtype=INDEX_DTYPE)
+        self.first_ids = self.index['doc_id'].tolist()
+        self.offsets = self.index['offset'].tolist()
+        self.file = open(path + ".bin", 'rb')
+        self.mm = None
+        try:
+            size = os.path.getsize(path + ".bin")
+            if size:
+                self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.close()
+            raise
+        self.offsets.append(size)
+        self.cache = OrderedDict()  # block number -> (doc IDs, record ends, block), least recently used first
+        self.lock = threading.Lock()
+
+    def _block(self, i):
+        with self.lock:
+            block = self.cache.get(i)
+            if block is not None:
+                self.cache.move_to_end(i)
+                return block
+        data = zlib.decompress(self.mm[self.offsets[i]:self.offsets[i + 1]])
+        n = struct.unpack_from('<I', data)[0]
+        header = struct.unpack_from(f'<{2 * n + 1}I', data, 4)
+        block = (header[:n], header[n:], memoryview(data)[8 + 8 * n:])
+        with self.lock:
+            self.cache[i] = block
+            if len(self.cache) > BLOCK_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return block
+
+    def get(self, doc_id):
+        """The record of doc_id, or None"""
+        i = bisect_right(self.first_ids, doc_id) - 1
+        if i < 0 or self.mm is None:
+            return None
+        doc_ids, ends, records = self._block(i)
+        j = bisect_right(doc_ids, doc_id) - 1
+        if j < 0 or doc_ids[j] != doc_id:
+            return None
+        return records[ends[j]:ends[j + 1]]
+
+    def close(self):
+        for obj in (self.mm, self.file):
+            try:
+                if obj is not None: obj.close()
+            except Exception: pass
+
+
+class DocStore:
+    """
+    Read side of the document stores in directory. summary() decompresses
+    only a small block of summaries, so a result page never touches the
+    full text; text() reads the full text of one document, and result() a
+    ready-made JSON fragment if the result store was written.
+    """
+
+    def __init__(self, directory):
+        self.summaries = _BlockReader(os.path.join(directory, SUMMARY_STORE))
+        self.texts = None
+        self.results = None
+        try:
+            self.texts = _BlockReader(os.path.join(directory, TEXT_STORE))
+            if all(os.path.exists(os.path.join(directory, name)) for name in RESULT_FILES):
+                self.results = _BlockReader(os.path.join(directory, RESULT_STORE))
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def exists(directory):
+        return all(os.path.exists(os.path.join(directory, name)) for name in DOCSTORE_FILES)
+
+    def summary(self, doc_id):
+        """{"title", "authors", "abstract"} of a document, or None"""
+        record = self.summaries.get(doc_id)
+        if record is None:
+            return None
+        title_len, authors_len, abstract_len = SUMMARY_FIELDS.unpack_from(record)
+        start = SUMMARY_FIELDS.size
+        fields = []
+        for length in (title_len, authors_len, abstract_len):
+            fields.append(str(record[start:start + length], 'utf-8'))
+            start += length
+        return dict(zip(("title", "authors", "abstract"), fields))
+
+    def text(self, doc_id):
+        """Full text of a document, or None"""
+        record = self.texts.get(doc_id)
+        return None if record is None else str(record, 'utf-8')
+
+    def result(self, doc_id):
+        """The document's encode_result() fragment as bytes, or None"""
+        if self.results is None:
+            return None
+        record = self.results.get(doc_id)
+        return None if record is None else bytes(record)
+
+    def close(self):
+        for store in (self.summaries, self.texts, self.results):
+            if store is not None:
+                store.close()
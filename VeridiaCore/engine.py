@@ -2,93 +2,268 @@ import os
 import json
 import re
 import struct
-import mmap
 import time
-import sqlite3
+import threading
+import functools
+import numpy as np
+from bisect import bisect_left
 from .vector_model import VectorModel
+from .postings import (
+    SLOT, SLOT_SIZE, decode_posting_list, read_raw_posting_list, bm25_tf_weights,
+    find_postings, find_raw_postings, find_positions, find_decoded_postings
+)
+from .posting_cache import PostingCache
+from .result_cache import ResultCache
+from .segments import SEGMENTS_DIR, Segment, read_manifest, commit_segment
+from .snapshot import BaseIndex, IndexReader, Handle, current_snapshot
+from .docstore import encode_result
+from .wal import WriteAheadLog
+from .memory_index import MemoryIndex, NO_DOCS, DYNAMIC_DOC_ID_START
+from .wand import BlockMaxCursor, block_max_wand
+from .query_parser import compile_query, is_advanced, Term, Phrase, And
+from .executor import QueryExecutor, union_scores
+
+# The vectorized scorer touches every posting but costs only tens of ns each;
+# block-max WAND runs per candidate in Python and pays off only on huge lists.
+WAND_MIN_POSTINGS = 4000000
+
+# Memory for decoded posting lists of hot terms
+POSTING_CACHE_BYTES = 256 * 1024 * 1024
+
+# Finished searches kept for repeated queries
+RESULT_CACHE_SIZE = 1000
+
+# Uploads are logged here (in the data directory) until flushed to a segment
+WAL_FILE = "dynamic.wal"
+
+# Uploads kept in memory before a background flush folds them into a segment
+WAL_FLUSH_DOCS = 1000
+
+QUERY_STOP_WORDS = frozenset({
+    "a", "an", "the", "and", "or", "but", "if", "of", "at", "by", "for", "with",
+    "about", "in", "on", "is", "it", "to"
+})
+
+
+def top_k_scores(doc_ids, scores, k):
+    """
+    Top-k of parallel (doc_ids, scores) arrays as {doc_id: score}.
+    Ties at the cut-off are resolved by lower doc ID, like the WAND path.
+    """
+    if doc_ids.size > k:
+        kth = np.partition(scores, doc_ids.size - k)[doc_ids.size - k]
+        keep = scores >= kth
+        doc_ids, scores = doc_ids[keep], scores[keep]
+    order = np.lexsort((doc_ids, -scores))[:k]
+    return dict(zip(doc_ids[order].tolist(), scores[order].tolist()))
+
+
+def rank_scores(doc_scores, k):
+    """Best k of a {doc_id: score} dict as a list, ties going to the lower doc ID"""
+    return sorted(doc_scores.items(), key=lambda x: (-x[1], x[0]))[:k]
+
+
+def contains_phrase(tokens, phrase_tokens):
+    n = len(phrase_tokens)
+    return any(tokens[i:i + n] == phrase_tokens for i in range(len(tokens) - n + 1))
+
+
+def _from_reader(name):
+    """Engine attribute served by the IndexReader the current query runs on"""
+    return property(lambda self: getattr(self.active_reader(), name))
+
+
+def pinned(method):
+    """Run an engine entry point on one pinned IndexReader from start to end"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._local, "reader", None) is not None:
+            return method(self, *args, **kwargs)
+        reader = self.acquire_reader()
+        self._local.reader = reader
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._local.reader = None
+            reader.unpin()
+    return wrapper
+
 
 class SearchEngine:
-    def __init__(self, data_dir):
+    # Index state lives in the pinned IndexReader (see snapshot.py)
+    metadata = _from_reader("metadata")
+    barrels = _from_reader("barrels")
+    positions = _from_reader("positions")
+    barrel_formats = _from_reader("barrel_formats")
+    doc_lengths = _from_reader("doc_lengths")
+    num_docs = _from_reader("num_docs")
+    avg_doc_len = _from_reader("avg_doc_len")
+    index_format = _from_reader("index_format")
+    offsets_mmap = _from_reader("offsets_mmap")
+    lexicon = _from_reader("lexicon")
+    synonyms = _from_reader("synonyms")
+    conn = _from_reader("conn")
+    dataset_mmap = _from_reader("dataset_mmap")
+    doc_offsets_mmap = _from_reader("doc_offsets_mmap")
+    docstore = _from_reader("docstore")
+    segments = _from_reader("segments")
+    segment_of = _from_reader("segment_of")
+    segment_doc_ids = _from_reader("segment_doc_ids")
+    segment_barrels = _from_reader("segment_barrels")
+    dynamic_index = _from_reader("dynamic_index")
+    field_indexes = _from_reader("field_indexes")
+    cache_tag = _from_reader("cache_tag")
+
+    def __init__(self, data_dir, k1=1.2, b=0.75, tokenizer=None,
+                 posting_cache_bytes=POSTING_CACHE_BYTES, result_cache_size=RESULT_CACHE_SIZE,
+                 wal_flush_docs=WAL_FLUSH_DOCS):
         self.data_dir = data_dir
-        self.metadata = {}
+        
+        # Phrase tokenizer: must match the one that built the forward index,
+        # since stored positions count its tokens
+        self.tokenizer = tokenizer
+        
+        # BM25 parameters: k1 = tf saturation, b = length normalization
+        self.bm25_k1 = k1
+        self.bm25_b = b
+        self.wand_min_postings = WAND_MIN_POSTINGS
         self.word_offsets = {}
-        self.barrels = {}
-        self.barrel_files = {}
+        self.posting_cache = PostingCache(posting_cache_bytes)
+        self.result_cache = ResultCache(result_cache_size)  # bumped on every index change
         
-        self.dataset_file = None
-        self.dataset_mmap = None
-        self.doc_offsets_file = None
-        self.doc_offsets_mmap = None
+        # Current IndexReader; swapped (never mutated) by load_indices / load_segments
+        self.reader = None
+        self.snapshot_name = None
+        self.segment_handles = {}  # segment name -> Handle, shared by the readers using it
+        self.swap_lock = threading.Lock()  # serializes swaps; searches never take it
+        self._local = threading.local()  # reader pinned by the running query, per thread
         
         self.vector_model = VectorModel(os.path.join(self.data_dir, "glove.txt"))
         
-        self.offsets_dense_path = os.path.join(self.data_dir, "word_offsets_dense.bin")
-        self.offsets_mmap = None
-        self.offsets_file_handle = None
-
-        # Connect to SQLite Lexicon (Memory Efficient)
-        self.db_path = os.path.join(self.data_dir, "lexicon.db")
-        self.conn = None
-        if os.path.exists(self.db_path):
-            try:
-                self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-                self.conn.row_factory = sqlite3.Row
-                print(f"  [OK] Connected to SQLite lexicon at {self.db_path}")
-            except Exception as e:
-                print(f"  [ERR] Failed to connect to DB: {e}")
-        else:
-            print(f"  [ERR] Lexicon DB not found at {self.db_path}. Please run build_sqlite.py")
+        # --- DYNAMIC MEMORY INDEX (For Instant Demo Uploads) ---
+        # Readers pin the memory index current when they were made; a flush
+        # replaces it instead of emptying it, so they keep its documents
+        self.memory_index = MemoryIndex(self.tokenize)
+        self.dynamic_doc_id_counter = DYNAMIC_DOC_ID_START # Start high to avoid collision
+        self.dynamic_lock = threading.Lock()  # doc ID allocation, in log order
+        self.wal_flush_docs = wal_flush_docs
+        self.flush_lock = threading.Lock()  # one flush at a time
+        self.flush_thread = None
 
         self.load_indices()
+        self.wal = WriteAheadLog(os.path.join(self.data_dir, WAL_FILE))
+        self._replay_wal()
         self.vector_model.load_model()
-        
-        # --- DYNAMIC MEMORY INDEX (For Instant Demo Uploads) ---
-        self.dynamic_index = {} # word -> set(doc_id)
-        self.dynamic_metadata = {} # doc_id -> {title, filename, text, authors}
-        self.dynamic_doc_id_counter = 10000000 # Start high to avoid collision
 
     def add_document_dynamic(self, title, text, filename):
-        """Add a document instantly to memory-only index"""
-        doc_id = self.dynamic_doc_id_counter
-        self.dynamic_doc_id_counter += 1
+        """
+        Add a document instantly to the memory index. Returns once it is
+        in the write-ahead log on disk, so it survives a restart.
+        """
+        with self.dynamic_lock:
+            doc_id = self.dynamic_doc_id_counter
+            self.dynamic_doc_id_counter += 1
+            seq = self.wal.append({"doc_id": doc_id, "title": title, "filename": filename, "text": text})
+        self.wal.sync(seq)  # batched with concurrent uploads
         
-        # storage
-        self.dynamic_metadata[doc_id] = {
-            "title": title,
-            "filename": filename,
-            "text": text,
-            "authors": "Uploaded User",
-            "abstract": text[:300] + "..."
-        }
-        self.metadata[doc_id] = {"title": title, "filename": filename} # consistency
-        
-        # index
-        words = re.findall(r'[a-z0-9]+', text.lower())
-        for word in words:
-            if len(word) < 2: continue
-            if word not in self.dynamic_index:
-                self.dynamic_index[word] = set()
-            self.dynamic_index[word].add(doc_id)
-            
+        self._apply_dynamic(doc_id, title, text, filename)
+        self.result_cache.bump_generation()
         print(f"  [DYNAMIC] Added '{filename}' (ID: {doc_id}) to memory index.")
+        if len(self.memory_index) >= self.wal_flush_docs:
+            self.start_flush()
         return doc_id
 
+    def _apply_dynamic(self, doc_id, title, text, filename):
+        """Index a logged upload in memory; False if a flush already put it in a segment"""
+        # Under swap_lock, so a concurrent flush either sees the doc or has
+        # already swapped in the segment holding it
+        with self.swap_lock:
+            if doc_id in self.reader.segment_of or doc_id in self.memory_index:
+                return False
+            self.memory_index.add(doc_id, title, text, filename)
+        return True
+
+    def _replay_wal(self):
+        """Restore the uploads logged before the last shutdown (or crash)"""
+        replayed = 0
+        for record in self.wal.replay():
+            if self._apply_dynamic(record["doc_id"], record["title"], record["text"], record["filename"]):
+                replayed += 1
+        used = [d for d in list(self.reader.segment_of) + self.memory_index.doc_ids.tolist()
+                if d >= DYNAMIC_DOC_ID_START]
+        self.dynamic_doc_id_counter = max(used, default=DYNAMIC_DOC_ID_START - 1) + 1
+        if replayed:
+            self.result_cache.bump_generation()
+            print(f"  [OK] Replayed {replayed} uploaded documents from the write-ahead log")
+        if replayed or os.path.exists(self.wal.rotated_path):
+            self.start_flush()
+
+    def start_flush(self):
+        """Flush the logged uploads in a background thread, unless one is already running"""
+        with self.dynamic_lock:
+            if self.flush_thread is None or not self.flush_thread.is_alive():
+                self.flush_thread = threading.Thread(target=self._flush_in_background, daemon=True)
+                self.flush_thread.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush_dynamic()
+        except Exception as e:
+            print(f"  [ERR] Flushing uploaded documents failed: {e}")
+
+    def flush_dynamic(self):
+        """
+        Write the logged uploads as an on-disk segment, then drop them from
+        memory and truncate the log. Uploads arriving meanwhile go to a
+        fresh log and wait for the next flush. Returns the documents flushed.
+        """
+        with self.flush_lock:
+            records = self.wal.rotate()
+            flushed = self.reader.segment_of
+            documents = {}
+            for record in records:
+                doc_id = record["doc_id"]
+                if doc_id not in flushed and doc_id not in documents:
+                    documents[doc_id] = ({"title": record["title"], "authors": "Uploaded User",
+                                          "text": record["text"], "filename": record["filename"]},
+                                         self.tokenize(record["text"]))
+            if documents:
+                start = time.time()
+                commit_segment(os.path.join(self.data_dir, SEGMENTS_DIR),
+                               [(doc_id, record, tokens) for doc_id, (record, tokens) in documents.items()],
+                               True, self.bm25_k1, self.bm25_b,
+                               on_commit=lambda: self._fold_dynamic(set(documents)))
+                print(f"  [OK] Flushed {len(documents)} uploaded documents to a segment "
+                      f"in {time.time() - start:.2f}s")
+            # Only now, with the segment and the manifest fsynced, is the log
+            # redundant: a crash before this line replays it
+            self.wal.remove_rotated()
+            return len(documents)
+
+    def _fold_dynamic(self, doc_ids):
+        """Swap the flushed uploads' segment in and drop them from memory, in one step"""
+        # Copy the unflushed rest outside swap_lock, so uploads carry on
+        with self.swap_lock:
+            live = self.memory_index
+            rows = len(live)
+        remaining = live.without(doc_ids, rows)
+        with self.swap_lock:
+            # Only the few uploads indexed during the copy are added again
+            for doc_id in live.doc_ids[rows:].tolist():
+                if doc_id not in doc_ids:
+                    remaining.add(doc_id, live.title(doc_id), live.text(doc_id), live.filename(doc_id))
+            self.memory_index = remaining
+            self._install(self.reader.base_handle.retain(), self._open_segments())
+
     def __del__(self):
         try:
-            if self.conn: self.conn.close()
-            if self.dataset_mmap: self.dataset_mmap.close()
-            if self.dataset_file: self.dataset_file.close()
-            if self.doc_offsets_mmap: self.doc_offsets_mmap.close()
-            if self.doc_offsets_file: self.doc_offsets_file.close()
-            if self.offsets_mmap: self.offsets_mmap.close()
-            if self.offsets_file_handle: self.offsets_file_handle.close()
-            for f in self.barrel_files.values():
-                try: f.close()
-                except: pass
+            if self.reader: self.reader.retire()
         except: pass
 
     def get_word_id(self, word):
-        """Get ID for a word from SQLite"""
+        """Get ID for a word from the lexicon (SQLite for indexes without lexicon.bin)"""
+        if self.lexicon is not None:
+            return self.lexicon.word_id(word)
         if not self.conn: return None
         try:
             cursor = self.conn.cursor()
@@ -98,81 +273,435 @@ class SearchEngine:
         except: return None
 
     def load_indices(self):
+        """
+        Open the published index snapshot (or the data directory itself when
+        none was published) and swap it in. Safe under live traffic: queries
+        already running finish on the previous reader, which is closed after
+        the last of them.
+        """
         print("Loading indices...")
-        
-        # Load Offsets (Dense Mmap)
-        if os.path.exists(self.offsets_dense_path):
-            try:
-                self.offsets_file_handle = open(self.offsets_dense_path, 'rb')
-                self.offsets_mmap = mmap.mmap(self.offsets_file_handle.fileno(), 0, access=mmap.ACCESS_READ)
-                print(f"  [OK] Mapped offsets ({len(self.offsets_mmap)//16:,} records)")
-            except Exception as e:
-                print(f"  [ERR] Failed to map offsets: {e}")
+        name, directory = current_snapshot(self.data_dir)
+        if name:
+            print(f"  [OK] Snapshot {name}")
+        base = Handle(BaseIndex(directory, name)).retain()
+        with self.swap_lock:
+            self.snapshot_name = name
+            self._install(base, self._open_segments())
+        if self.use_block_max():
+            print(f"  [OK] Block-max WAND enabled (k1={self.bm25_k1}, b={self.bm25_b})")
+        print("[OK] READY")
 
-        # Load Barrels
-        max_barrel = 0
-        for filename in os.listdir(self.data_dir):
-            if filename.startswith("barrel_") and filename.endswith(".bin"):
+    def load_segments(self):
+        """
+        Swap in a reader over the same barrels and the segments the segments
+        manifest lists now. Called by the indexer after every commit or merge;
+        segments already open are shared with the previous reader.
+        """
+        with self.swap_lock:
+            self._install(self.reader.base_handle.retain(), self._open_segments())
+
+    def _open_segments(self):
+        """Retained Handles of the live segments, oldest first (caller holds swap_lock)"""
+        segments_dir = os.path.join(self.data_dir, SEGMENTS_DIR)
+        try:
+            names = read_manifest(segments_dir)["segments"] if os.path.isdir(segments_dir) else []
+        except Exception as e:
+            print(f"  [ERR] Segment manifest load failed: {e}")
+            names = list(self.segment_handles)
+        handles = {}
+        for name in names:
+            handle = self.segment_handles.get(name)
+            if handle is None:
                 try:
-                    bid = int(filename.split('_')[1].split('.')[0])
-                    max_barrel = max(max_barrel, bid)
-                except: pass
-        
-        print(f"  [OK] Barrels: 0 to {max_barrel}")
-        for i in range(max_barrel + 1):
-            path = os.path.join(self.data_dir, f"barrel_{i}.bin")
-            if os.path.exists(path) and os.path.getsize(path) > 0:
-                f = open(path, 'rb')
-                self.barrel_files[i] = f
-                self.barrels[i] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-            else:
-                self.barrels[i] = None
+                    handle = Handle(Segment(os.path.join(segments_dir, name)))
+                except Exception as e:
+                    print(f"  [ERR] Segment {name} load failed: {e}")
+                    continue
+            handles[name] = handle.retain()
+        if handles or self.segment_handles:
+            print(f"  [OK] Segments: {len(handles)} "
+                  f"({sum(len(h.resource.table['id']) for h in handles.values()):,} documents)")
+        # Dropped segments stay open until the readers still using them close
+        self.segment_handles = handles
+        return list(handles.values())
 
-        # Load Metadata
-        meta_path = os.path.join(self.data_dir, "document_metadata.txt")
-        if os.path.exists(meta_path):
-            try:
-                with open(meta_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        parts = line.strip().split('||')
-                        if len(parts) >= 2:
-                            doc_id = int(parts[0])
-                            title = parts[1][:200] if len(parts[1]) > 200 else parts[1]
-                            filename = parts[2] if len(parts) > 2 else "unknown.txt"
-                            self.metadata[doc_id] = {"title": title, "filename": filename}
-                print(f"  [OK] Loaded {len(self.metadata):,} documents metadata")
-            except Exception as e:
-                print(f"  [ERR] Metadata load failed: {e}")
-        
-        # Load Dataset for content retrieval
-        jsonl_path = os.path.join(self.data_dir, "dataset.jsonl")
-        offsets_path = os.path.join(self.data_dir, "doc_offsets.bin")
-        
-        if os.path.exists(jsonl_path) and os.path.exists(offsets_path):
-            try:
-                self.dataset_file = open(jsonl_path, 'rb')
-                if os.path.getsize(jsonl_path) > 0:
-                    self.dataset_mmap = mmap.mmap(self.dataset_file.fileno(), 0, access=mmap.ACCESS_READ)
-                
-                self.doc_offsets_file = open(offsets_path, 'rb')
-                if os.path.getsize(offsets_path) > 0:
-                    self.doc_offsets_mmap = mmap.mmap(self.doc_offsets_file.fileno(), 0, access=mmap.ACCESS_READ)
-                print("  [OK] Dataset mapped for content retrieval")
-            except Exception as e:
-                print(f"  [WARN] Dataset mapping failed: {e}")
-        
-        print("[OK] READY")
+    def _install(self, base, segments):
+        """Make a reader over base + segments current and retire the previous one (caller holds swap_lock)"""
+        reader = IndexReader(base, segments, self.memory_index)
+        previous, self.reader = self.reader, reader
+        if previous is None or previous.cache_tag != reader.cache_tag:
+            self.posting_cache.clear()
+        self.result_cache.bump_generation()
+        if previous is not None:
+            previous.retire()
+
+    def acquire_reader(self):
+        """Pin and return the current reader (lock-free, see IndexReader)"""
+        while True:
+            reader = self.reader
+            reader.pin()
+            if not reader.retired:
+                return reader
+            reader.unpin()
+
+    def active_reader(self):
+        """The reader pinned by this thread's query, else the current one"""
+        return getattr(self._local, "reader", None) or self.reader
+
+    @pinned
+    def lexicon_size(self):
+        """Number of words in the lexicon"""
+        if self.lexicon is not None:
+            return len(self.lexicon)
+        if not self.conn: return 0
+        try:
+            return self.conn.execute("SELECT COUNT(*) FROM lexicon").fetchone()[0]
+        except Exception: return 0
+
+    @pinned
+    def offsets_size(self):
+        """Number of word slots in the dense offsets file"""
+        if not self.offsets_mmap: return 0
+        return len(self.offsets_mmap) // SLOT_SIZE - self.index_format.header_slots
+
+    @pinned
+    def similar_words(self, word, top_n=2):
+        """
+        Semantic expansions of word, as VectorModel.find_similar_words: read
+        from the synonym table when it holds the word's row, else computed
+        over the whole vector matrix
+        """
+        model = self.vector_model
+        table = self.synonyms
+        if (model.loaded and table is not None and top_n <= table.top_n
+                and table.vocab_crc == model.vocab_crc):
+            word_lower = word.lower()
+            word_id = self.get_word_id(word_lower)
+            neighbours = table.get(word_id, word_lower) if word_id is not None else None
+            if neighbours is not None:
+                return [model.words[i] for i in neighbours[:top_n]]
+        return model.find_similar_words(word, top_n=top_n)
+
+    def get_term(self, word):
+        """(word_id, (barrel_id, offset, count)) of a word of the barrels, or None"""
+        if self.lexicon is not None:
+            found = self.lexicon.get(word)
+            return (found[0], found[1:]) if found else None
+        word_id = self.get_word_id(word)
+        if word_id is None: return None
+        return word_id, self.get_word_info(word_id)
 
     def get_word_info(self, word_id):
         """Get barrel info for a word ID"""
         if not self.offsets_mmap: return None
-        start = word_id * 16
-        if start + 16 > len(self.offsets_mmap): return None
-        return struct.unpack_from('<IQI', self.offsets_mmap, start)
+        start = (word_id + self.index_format.header_slots) * SLOT_SIZE
+        if start + SLOT_SIZE > len(self.offsets_mmap): return None
+        return SLOT.unpack_from(self.offsets_mmap, start)
+
+    def barrel_format(self, barrel_id):
+        return self.barrel_formats.get(barrel_id, self.index_format)
+
+    def read_postings(self, barrel_id, offset, count):
+        """
+        Decode a posting list from its barrel.
+        Returns (doc_ids, freqs) arrays; freqs is None if the index has no tf.
+        """
+        mm = self.barrels.get(barrel_id)
+        if not mm: return None
+        fmt = self.barrel_format(barrel_id)
+        if fmt.compressed:
+            if offset >= len(mm): return None
+            key = (self.cache_tag, barrel_id, offset)
+            postings = self.posting_cache.get(key)
+            if postings is None:
+                postings = decode_posting_list(mm, offset, count, fmt)
+                self.posting_cache.put(key, postings)
+            return postings
+        # Raw lists are zero-copy views of the mmap: nothing to cache
+        if offset + count * 4 > len(mm): return None
+        return read_raw_posting_list(mm, offset, count), None
+
+    def lookup_postings(self, info, doc_ids):
+        """
+        Probe a term's posting list for a sorted array of doc IDs.
+        Returns (found mask, freqs) aligned with doc_ids; freqs may be None.
+        """
+        barrel_id, offset, count = info
+        mm = self.barrels.get(barrel_id)
+        fmt = self.barrel_format(barrel_id)
+        if fmt.compressed:
+            if mm and offset < len(mm):
+                cached = self.posting_cache.peek((self.cache_tag, barrel_id, offset))
+                if cached is not None:
+                    return find_decoded_postings(cached[0], cached[1], doc_ids)
+                return find_postings(mm, offset, count, fmt, doc_ids)
+        elif mm and offset + count * 4 <= len(mm):
+            return find_raw_postings(mm, offset, count, doc_ids)
+        return np.zeros(len(doc_ids), dtype=bool), None
+
+    def lookup_positions(self, info, doc_ids):
+        """
+        Token positions of a term in each of the sorted doc_ids.
+        Returns (index into doc_ids, position) arrays, one entry per occurrence.
+        """
+        barrel_id, offset, count = info
+        mm = self.barrels.get(barrel_id)
+        pos_mm = self.positions.get(barrel_id)
+        if not mm or not pos_mm or offset >= len(mm):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return find_positions(mm, offset, count, self.barrel_format(barrel_id), pos_mm, doc_ids)
+
+    def tokenize(self, text):
+        if self.tokenizer:
+            return self.tokenizer(text)
+        return re.findall(r'[a-z0-9]+', text.lower())
+
+    def _match_phrase(self, word_infos, doc_ids):
+        """
+        Mask of the sorted doc_ids in which the phrase's words occur at
+        consecutive positions. word_infos holds, per word in phrase order,
+        its posting locations (one per index source: barrels, segments).
+        A doc lives in exactly one source, so it is checked against that
+        source's lists only. Sources without positions degrade to AND.
+        """
+        matched = np.zeros(len(doc_ids), dtype=bool)
+        in_segment = np.isin(doc_ids, self.segment_doc_ids)
+        sources = [(None, ~in_segment)]
+        if in_segment.any():
+            sources += [(segment.barrel_id, np.isin(doc_ids, segment.doc_ids))
+                        for segment in self.segments]
+        for source, mask in sources:
+            if not mask.any(): continue
+            infos = []
+            for locations in word_infos:
+                found = [info for info in locations if self._source(info[0]) == source]
+                if not found: break
+                infos.append(found[0])
+            else:
+                if self.barrel_format(infos[0][0]).has_positions:
+                    matched[mask] = self._match_phrase_in(infos, doc_ids[mask])
+                else:
+                    matched[mask] = True
+        return matched
 
+    def _source(self, barrel_id):
+        """Segment barrel key, or None for the main barrels"""
+        return barrel_id if barrel_id in self.barrel_formats else None
+
+    def _match_phrase_in(self, infos, doc_ids):
+        """_match_phrase within one source: infos is one location per word"""
+        keys = None
+        # Rarest word first, so the candidate starts shrink as fast as possible
+        for j in sorted(range(len(infos)), key=lambda j: infos[j][2]):
+            index, positions = self.lookup_positions(infos[j], doc_ids)
+            # (doc, where the phrase would start) per occurrence; already sorted
+            term_keys = (index << 32) + (positions - j)
+            if keys is None:
+                keys = term_keys[positions >= j]
+            else:
+                at = np.searchsorted(term_keys, keys)
+                hit = at < term_keys.size
+                hit[hit] = term_keys[at[hit]] == keys[hit]
+                keys = keys[hit]
+            if not keys.size: break
+        matched = np.zeros(len(doc_ids), dtype=bool)
+        matched[keys >> 32] = True
+        return matched
+
+    def _dynamic_phrase_match(self, doc_id, phrase_tokens):
+        return contains_phrase(self.tokenize(self.dynamic_index.text(doc_id)), phrase_tokens)
+
+    def idf(self, df):
+        """BM25 inverse document frequency (non-negative variant)"""
+        n = max(self.num_docs + len(self.dynamic_index), df)
+        return float(np.log(1.0 + (n - df + 0.5) / (df + 0.5)))
+
+    def bm25(self, doc_ids, freqs, idf, barrel_id=None):
+        """BM25 term scores for a posting list of barrel_id (tf = 1 when the index has no tf)"""
+        segment = self.segment_barrels.get(barrel_id)
+        if segment is not None:
+            # Segment docs: lengths from the segment's own table, aligned with doc_ids
+            lengths = segment.doc_lengths[np.searchsorted(segment.doc_ids, doc_ids)]
+            return idf * bm25_tf_weights(np.arange(len(doc_ids)), freqs, lengths, self.avg_doc_len,
+                                         self.bm25_k1, self.bm25_b)
+        return idf * bm25_tf_weights(doc_ids, freqs, self.doc_lengths, self.avg_doc_len,
+                                     self.bm25_k1, self.bm25_b)
+
+    def use_block_max(self):
+        """Stored block maxima are valid bounds only for the BM25 settings they were built with"""
+        fmt = self.index_format
+        return (fmt.has_block_max and self.doc_lengths is not None
+                and np.float32(fmt.k1) == np.float32(self.bm25_k1)
+                and np.float32(fmt.b) == np.float32(self.bm25_b))
+
+    def _score_exhaustive(self, disk_terms, top_k):
+        """
+        Vectorized BM25 over every posting of every query term.
+        Postings are decoded straight from the barrel mmaps, scores are
+        accumulated into a dense float32 array indexed by doc ID, and the
+        top-k is selected with argpartition instead of sorting every doc.
+        Segment postings are merged sparsely instead: their doc IDs can lie
+        far past the barrels', and would size the dense array by them.
+        """
+        term_postings = []
+        segment_parts = []
+        size = 0
+        for weight, idf, (barrel_id, offset, count) in disk_terms:
+            postings = self.read_postings(barrel_id, offset, count)
+            if postings is None or not len(postings[0]): continue
+            doc_ids, freqs = postings
+            if barrel_id in self.segment_barrels:
+                segment_parts.append((doc_ids.astype(np.int64), weight * self.bm25(doc_ids, freqs, idf, barrel_id)))
+                continue
+            term_postings.append((weight, idf, postings))
+            size = max(size, int(doc_ids[-1]) + 1)
+        if not term_postings and not segment_parts:
+            return {}
+
+        acc = np.zeros(size, dtype=np.float32)
+        for weight, idf, (doc_ids, freqs) in term_postings:
+            # doc IDs are unique within a list, so fancy-index += is safe
+            acc[doc_ids] += weight * self.bm25(doc_ids, freqs, idf)
+
+        nonzero = np.flatnonzero(acc)
+        scores = acc[nonzero]
+        if segment_parts:
+            # Segments never share docs with the barrels: the two sets just concatenate
+            segment_docs, segment_scores = union_scores(segment_parts)
+            kept = segment_scores != 0
+            nonzero = np.concatenate([nonzero, segment_docs[kept]])
+            scores = np.concatenate([scores, segment_scores[kept]])
+        return top_k_scores(nonzero, scores, top_k)
+
+    def _score_block_max_wand(self, disk_terms, top_k):
+        """Top-k BM25 via block-max WAND, skipping blocks that cannot enter the top-k"""
+        cursors = []
+        for weight, idf, (barrel_id, offset, count) in disk_terms:
+            mm = self.barrels.get(barrel_id)
+            if not mm or offset >= len(mm): continue
+            scale = weight * idf
+            score_block = lambda docs, freqs, scale=scale: scale * bm25_tf_weights(
+                docs, freqs, self.doc_lengths, self.avg_doc_len, self.bm25_k1, self.bm25_b)
+            cursors.append(BlockMaxCursor(mm, offset, count, self.index_format, scale, score_block))
+        return dict(block_max_wand(cursors, top_k))
+
+    def _score_disjunctive(self, groups, top_k):
+        """OR semantics: every doc matching any query term is a candidate"""
+        disk_terms = [(weight, idf, info) for group in groups
+                      for weight, idf, info, _ in group if info]
+
+        # Disk postings: block-max WAND only when bounds are available and the
+        # lists are long enough for skipping to beat a vectorized full pass
+        total_postings = sum(info[2] for _, _, info in disk_terms)
+        # (segments store no bounds, so a query touching one is scored exhaustively)
+        if (self.use_block_max() and total_postings >= self.wand_min_postings
+                and not any(self._source(info[0]) for _, _, info in disk_terms)):
+            doc_scores = self._score_block_max_wand(disk_terms, top_k)
+        else:
+            doc_scores = self._score_exhaustive(disk_terms, top_k)
+
+        # Dynamic memory index
+        # Uploaded docs have no tf / length stats: score as tf=1, dl=avg
+        for group in groups:
+            for weight, idf, _, dynamic_docs in group:
+                for doc_id in dynamic_docs.tolist():
+                    if doc_id not in doc_scores: doc_scores[doc_id] = 0
+                    doc_scores[doc_id] += weight * idf * 2.0 # Boost fresh content
+        return doc_scores
+
+    def _score_conjunctive(self, groups, top_k, required=None, phrases=()):
+        """
+        AND semantics: a doc must match every required keyword group (the word
+        itself or one of its synonyms); optional groups only add to its score.
+        Required groups are intersected rarest-first and every further list is
+        only probed for the surviving candidates through its block directory,
+        so the cost follows the rarest keyword, not the common ones. Phrases
+        ((tokens, group index per token) pairs) are then checked for adjacency
+        on the survivors only. Stops as soon as the intersection is empty.
+        """
+        if required is None:
+            required = [True] * len(groups)
+        doc_scores = {}
+
+        # 1. Disk index: intersect rarest-first, scoring terms as they are probed
+        disk_groups = [[(i, term) for i, term in enumerate(group) if term[2]] for group in groups]
+        needed = [g for g in range(len(groups)) if required[g]]
+        if needed and all(disk_groups[g] for g in needed):
+            order = sorted(needed, key=lambda g: sum(term[2][2] for _, term in disk_groups[g]))
+            lists = [self.read_postings(*term[2]) for _, term in disk_groups[order[0]]]
+            lists = [postings[0] for postings in lists if postings is not None]
+            if len(lists) == 1:
+                candidates = lists[0]
+            else:
+                candidates = np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=np.uint32)
+
+            term_scores = {}  # (group, term) -> scores aligned with candidates
+
+            def probe(g):
+                matched = np.zeros(candidates.size, dtype=bool)
+                for i, (weight, idf, info, _) in disk_groups[g]:
+                    found, freqs = self.lookup_postings(info, candidates)
+                    scores = np.zeros(candidates.size, dtype=np.float32)
+                    if freqs is not None: freqs = freqs[found]
+                    scores[found] = weight * self.bm25(candidates[found], freqs, idf, info[0])
+                    term_scores[g, i] = scores
+                    matched |= found
+                return matched
+
+            def narrow(matched):
+                if matched.all():
+                    return candidates, term_scores
+                return candidates[matched], {key: scores[matched] for key, scores in term_scores.items()}
+
+            for g in order:
+                if not candidates.size: break
+                candidates, term_scores = narrow(probe(g))
+
+            # Phrase adjacency, for docs that contain all of the phrase's words
+            for _, phrase_groups in phrases:
+                if not candidates.size: break
+                word_infos = [[term[2] for _, term in disk_groups[g]] for g in phrase_groups]
+                candidates, term_scores = narrow(self._match_phrase(word_infos, candidates))
+
+            # Optional keywords only add to the scores of the survivors
+            for g in range(len(groups)):
+                if not required[g] and candidates.size:
+                    probe(g)
+
+            if candidates.size:
+                # Summed in query term order, exactly like the OR scorer
+                total = np.zeros(candidates.size, dtype=np.float32)
+                for g, group in enumerate(disk_groups):
+                    for i, _ in group:
+                        total += term_scores[g, i]
+                doc_scores = top_k_scores(candidates, total, top_k)
+
+        # 2. Dynamic memory index
+        dynamic = None
+        for g, group in enumerate(groups):
+            if not required[g]: continue
+            matched = np.unique(np.concatenate([term[3] for term in group]))
+            dynamic = matched if dynamic is None else np.intersect1d(dynamic, matched, assume_unique=True)
+            if not dynamic.size: break
+        dynamic = dynamic.tolist() if dynamic is not None else []
+        for tokens, _ in phrases:
+            dynamic = [doc_id for doc_id in dynamic if self._dynamic_phrase_match(doc_id, tokens)]
+        for doc_id in dynamic:
+            doc_scores[doc_id] = 0
+            for group in groups:
+                for weight, idf, _, dynamic_docs in group:
+                    if doc_id in dynamic_docs:
+                        doc_scores[doc_id] += weight * idf * 2.0 # Boost fresh content
+
+        return doc_scores
+
+    @pinned
     def get_suggestions(self, prefix):
-        """Get autocomplete suggestions from SQLite"""
-        if not prefix or not self.conn: return []
+        """Get autocomplete suggestions from the lexicon"""
+        if not prefix: return []
+        if self.lexicon is not None:
+            return [found[0] for found in self.lexicon.prefix(prefix.lower(), 10)]
+        if not self.conn: return []
         try:
             cursor = self.conn.cursor()
             query = prefix.lower()
@@ -184,58 +713,250 @@ class SearchEngine:
             print(f"Autocomplete error: {e}")
             return []
 
-    def search(self, query, use_semantic=True):
-        STOP_WORDS = {
-            "a", "an", "the", "and", "or", "but", "if", "of", "at", "by", "for", "with",
-            "about", "in", "on", "is", "it", "to"
-        }
+    @pinned
+    def expand_prefix(self, prefix, limit):
+        """Up to limit indexed words starting with prefix, most frequent first"""
+        df = self.dynamic_index.prefix_df(prefix)
+        if self.lexicon is not None and prefix:
+            for word, _, _, _, count in self.lexicon.prefix(prefix):
+                df[word] = df.get(word, 0) + count
+        elif self.conn and prefix:
+            try:
+                # Range scan on the word index; the upper bound bumps the last character
+                upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT word, id FROM lexicon WHERE word >= ? AND word < ?", (prefix, upper))
+                for row in cursor.fetchall():
+                    info = self.get_word_info(row['id'])
+                    df[row['word']] = df.get(row['word'], 0) + (info[2] if info else 0)
+            except Exception as e:
+                print(f"  [ERR] Prefix expansion failed: {e}")
+        if prefix:
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            for segment in self.segments:
+                for word in segment.words[bisect_left(segment.words, prefix):bisect_left(segment.words, upper)]:
+                    df[word] = df.get(word, 0) + segment.terms[word][1]
+        return sorted(df, key=lambda w: (-df[w], w))[:limit]
+
+    def all_doc_ids(self):
+        """Every searchable doc ID, sorted (the universe for pure NOT queries)"""
+        return self.metadata.sorted_ids()
+
+    def _field_text(self, field, doc_id):
+        if doc_id in self.dynamic_index:
+            return self.dynamic_index.document(doc_id)["authors" if field == "author" else "title"]
+        if field == "title":
+            return self.metadata[doc_id]["title"]
+        authors = self.metadata.authors(doc_id)
+        if authors is not None:
+            return authors
+        if self._in_docstore(doc_id):
+            record = self.get_document_summary(doc_id)
+        else:
+            record = self._read_dataset_record(doc_id)
+        authors = record.get('authors', '') if record else ''
+        return authors if isinstance(authors, str) else ' '.join(map(str, authors))
+
+    def _field_index(self, field):
+        """Inverted index over one metadata field (title or author), built on first use"""
+        if field not in self.field_indexes:
+            start = time.time()
+            postings = {}
+            for doc_id in self.metadata.sorted_ids().tolist():
+                if doc_id in self.dynamic_index: continue
+                for word in set(self.tokenize(self._field_text(field, doc_id))):
+                    postings.setdefault(word, []).append(doc_id)
+            index = {w: np.array(docs, dtype=np.int64) for w, docs in postings.items()}
+            self.field_indexes[field] = (index, sorted(index))
+            print(f"  [OK] Built {field} index ({len(index):,} words) in {time.time() - start:.2f}s")
+        return self.field_indexes[field]
+
+    def field_postings(self, field, word, prefix=False):
+        """Sorted doc IDs whose field contains word (or a word starting with it)"""
+        index, words = self._field_index(field)
+        if prefix:
+            lo = bisect_left(words, word)
+            hi = bisect_left(words, word[:-1] + chr(ord(word[-1]) + 1)) if word else len(words)
+            parts = [index[w] for w in words[lo:hi]]
+            docs = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        else:
+            docs = index.get(word, np.empty(0, dtype=np.int64))
+        # Uploaded docs are few: check them directly
+        dynamic = [d for d in self.dynamic_index.doc_ids.tolist()
+                   if any(t == word or (prefix and t.startswith(word))
+                          for t in self.tokenize(self._field_text(field, d)))]
+        if dynamic:
+            docs = np.union1d(docs, np.array(dynamic, dtype=np.int64))
+        return docs
+
+    def field_phrase_match(self, field, doc_id, phrase_tokens):
+        return contains_phrase(self.tokenize(self._field_text(field, doc_id)), phrase_tokens)
+
+    def _resolve_term(self, term, weight):
+        """
+        [(weight, idf, posting location or None, dynamic docs)] for one query
+        term: one entry per index source holding it (the barrels, then each
+        segment). Sources hold disjoint docs, so their scores simply add up;
+        the dynamic docs ride on the first entry only.
+        """
+        dynamic_docs = self.dynamic_index.docs(term)
+        
+        # Resolve term in Main Disk Index, then in the segments
+        infos = []
+        found = self.get_term(term)
+        if found is not None:
+            info = found[1]
+            if info and info[2] > 0:
+                infos.append(info)
+        for segment in self.segments:
+            info = segment.location(term)
+            if info:
+                infos.append(info)
+        idf = self.idf(sum(info[2] for info in infos) + len(dynamic_docs))
+        if not infos:
+            return [(weight, idf, None, dynamic_docs)]
+        return [(weight, idf, info, dynamic_docs if i == 0 else NO_DOCS) for i, info in enumerate(infos)]
+
+    def _query_keywords(self, query):
+        """(keywords, tokens of each quoted phrase) of a plain query"""
+        # Quoted phrases, tokenized like the indexed text
+        phrase_tokens = [self.tokenize(p) for p in re.findall(r'"([^"]*)"', query)]
+        phrase_tokens = [tokens for tokens in phrase_tokens if tokens]
+        query = re.sub(r'"[^"]*"', ' ', query)
         
         # Allow both letters and numbers
         all_words = re.findall(r'[a-z0-9]+', query.lower())
-        if not all_words: return []
         
-        # Relaxed filtering
-        keywords = [w for w in all_words if w not in STOP_WORDS]
+        # Only words the indexing tokenizer keeps: one it drops (a stop word,
+        # a short word, digits) is in no document and would empty an AND
+        keywords = [w for w in self.tokenize(query) if w not in QUERY_STOP_WORDS]
         keywords = [w for w in keywords if len(w) >= 2 or w.isdigit()]
         
         if not keywords: keywords = all_words
+        return keywords, phrase_tokens
+
+    @pinned
+    def search(self, query, use_semantic=True, top_k=50, conjunctive=False):
+        """
+        Ranked BM25 search. By default any keyword may match (OR);
+        with conjunctive=True every keyword must match (AND).
+        Quoted phrases ("dark matter") must always match, word for word.
+        """
+        keywords, phrase_tokens = self._query_keywords(query)
+        if not keywords and not phrase_tokens: return []
         
-        print(f"  Searching for keywords: {keywords}")
-        doc_scores = {}
+        print(f"  Searching for keywords: {keywords}" +
+              (f", phrases: {phrase_tokens}" if phrase_tokens else ""))
+        # Per keyword: (weight, idf, barrel location or None, dynamic docs) per term
+        groups = []
         
         for word in keywords:
             terms = {word}
             if use_semantic:
-                synonyms = self.vector_model.find_similar_words(word, top_n=2)
-                terms.update(synonyms)
-            
-            for term in terms:
-                # 1. Search Main Disk Index
-                word_id = self.get_word_id(term)
-                if word_id is not None:
-                    info = self.get_word_info(word_id)
-                    if info:
-                        barrel_id, offset, count = info
-                        if barrel_id in self.barrels and self.barrels[barrel_id]:
-                            mm = self.barrels[barrel_id]
-                            if offset + count * 4 <= len(mm):
-                                doc_ids = struct.unpack_from(f'<{count}I', mm, offset)
-                                weight = 1.0 if term == word else 0.5
-                                for doc_id in doc_ids:
-                                    if doc_id not in doc_scores:
-                                        doc_scores[doc_id] = 0
-                                    doc_scores[doc_id] += weight
-                
-                # 2. Search Dynamic Memory Index
-                if term in self.dynamic_index:
-                    for doc_id in self.dynamic_index[term]:
-                        weight = 1.0 if term == word else 0.5
-                        if doc_id not in doc_scores: doc_scores[doc_id] = 0
-                        doc_scores[doc_id] += weight * 2.0 # Boost fresh content
-
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
+                terms.update(self.similar_words(word, top_n=2))
+            groups.append([entry for term in terms
+                           for entry in self._resolve_term(term, 1.0 if term == word else 0.5)])
+        required = [conjunctive] * len(groups)
+
+        # Phrase words are exact (no synonyms) and always required
+        phrases = []
+        for tokens in phrase_tokens:
+            phrase_groups = []
+            for token in tokens:
+                phrase_groups.append(len(groups))
+                groups.append(self._resolve_term(token, 1.0))
+                required.append(True)
+            if len(tokens) > 1:
+                phrases.append((tokens, phrase_groups))
+
+        if any(required):
+            doc_scores = self._score_conjunctive(groups, top_k, required, phrases)
+        else:
+            doc_scores = self._score_disjunctive(groups, top_k)
+        return self._format_results(rank_scores(doc_scores, top_k))
+
+    @pinned
+    def search_staged(self, query, use_semantic=True, top_k=50, correct_word=None):
+        """
+        The /api/search pipeline in a single pass:
+          1. Strict: every keyword must match (AND)
+          2. Correction: under 5 hits, retry with correct_word(word) applied to
+             every word longer than 2 characters; new hits are appended
+          3. Fallback: under 3 hits, the top hits of each word (3+ characters)
+             are merged in, at half their score
+        All stages share one QueryExecutor, so every word is resolved (SQLite,
+        synonyms) and every posting list decoded at most once per request.
+        """
+        executor = QueryExecutor(self, use_semantic)
+
+        def strict(text):
+            keywords, phrase_tokens = self._query_keywords(text)
+            nodes = [Term(w) for w in keywords] + [Phrase(' '.join(t)) for t in phrase_tokens]
+            if not nodes: return []
+            doc_ids, scores = executor.evaluate(And(nodes))
+            return rank_scores(top_k_scores(doc_ids, scores, top_k), top_k)
+
+        # Stage 1: Strict AND
+        ranked = strict(query)
+        print(f"  Stage 1 (Strict): Found {len(ranked)} results")
+
+        # Stage 2: Correction
+        words = query.split()
+        if len(ranked) < 5 and correct_word:
+            corrected = [correct_word(w) if len(w) > 2 else w for w in words]
+            if [w.lower() for w in corrected] != [w.lower() for w in words]:
+                corrected_query = " ".join(corrected)
+                print(f"  Stage 2 (Correction): Retrying with '{corrected_query}'")
+                corrected_ranked = strict(corrected_query)
+                print(f"    Found {len(corrected_ranked)} results")
+                seen = {doc_id for doc_id, _ in ranked}
+                ranked += [(doc_id, score) for doc_id, score in corrected_ranked if doc_id not in seen]
+
+        # Stage 3: OR fallback, each word searched on its own without synonyms
+        if len(ranked) < 3 and len(words) > 1:
+            print(f"  Stage 3 (Fallback OR): searching words individually")
+            merged = dict(ranked)
+            for word in words:
+                if len(word) < 3: continue
+                keywords, _ = self._query_keywords(word)
+                doc_ids, scores = union_scores([executor.evaluate(Term(w), exact=True) for w in keywords])
+                for doc_id, score in top_k_scores(doc_ids, scores, top_k).items():
+                    merged[doc_id] = merged.get(doc_id, 0.0) + score * 0.5
+            ranked = rank_scores(merged, top_k)
+            print(f"    After OR-Merge: {len(merged)} total results")
+
+        return self._format_results(ranked[:top_k])
+
+    def normalize_query(self, query):
+        """
+        Result cache key for a query: the compiled plan for boolean syntax,
+        otherwise the lowercased words (plain queries are case-insensitive)
+        """
+        plan = self.parse_query(query)
+        if plan is not None and is_advanced(plan):
+            return repr(plan)
+        return ' '.join(query.lower().split())
+
+    def parse_query(self, query, default_operator='AND'):
+        """Compiled (cached) boolean plan for a query, or None if it has no terms"""
+        return compile_query(query, default_operator, QUERY_STOP_WORDS, self.tokenizer)
+
+    @pinned
+    def search_boolean(self, query, use_semantic=False, top_k=50, default_operator='AND'):
+        """
+        Ranked search with the boolean query language: AND / OR / NOT (or -word),
+        parentheses, "quoted phrases", title: / author: fields and prefix* terms.
+        Adjacent terms are joined with default_operator.
+        """
+        plan = self.parse_query(query, default_operator)
+        if plan is None: return []
+        print(f"  Query plan: {plan}")
+        doc_ids, scores = QueryExecutor(self, use_semantic).evaluate(plan)
+        return self._format_results(rank_scores(top_k_scores(doc_ids, scores, top_k), top_k))
+
+    def _format_results(self, ranked):
         results = []
-        for doc_id, score in sorted_docs[:50]:
+        for doc_id, score in ranked:
             if doc_id in self.metadata:
                 results.append({
                     "doc_id": doc_id,
@@ -247,17 +968,94 @@ class SearchEngine:
         print(f"  Found {len(results)} results")
         return results
 
+    @pinned
     def get_document_content(self, doc_id):
         # 1. Check Dynamic Index First
-        if hasattr(self, 'dynamic_metadata') and doc_id in self.dynamic_metadata:
-             return self.dynamic_metadata[doc_id]
+        if doc_id in self.dynamic_index:
+             return self.dynamic_index.document(doc_id)
 
-        # 2. Check Disk Index
+        # 2. Check Disk Index (barrels or segments)
         if doc_id not in self.metadata: 
             return None
+
+        if self._in_docstore(doc_id):
+            content = self.get_document_summary(doc_id)
+            if content is not None:
+                content["text"] = self.docstore.text(doc_id)
+            return content
+        
+        data = self._read_dataset_record(doc_id)
+        if data is None:
+            return None
+        return {
+            "title": data.get('title', 'No Title'),
+            "abstract": data.get('abstract', '')[:500],
+            "text": data.get('text', data.get('abstract', 'No content available')), 
+            "authors": data.get('authors', 'Unknown'),
+            "filename": self.metadata[doc_id]["filename"]
+        }
+
+    @pinned
+    def get_document_summary(self, doc_id):
+        """
+        What a result page shows of a document: get_document_content without
+        "text". With a document store this reads no full text.
+        """
+        if not self._in_docstore(doc_id):
+            content = self.get_document_content(doc_id)
+            if content is not None:
+                content.pop("text", None)
+            return content
+        summary = self.docstore.summary(doc_id)
+        if summary is not None:
+            summary["filename"] = self.metadata[doc_id]["filename"]
+        return summary
+
+    @pinned
+    def result_fragment(self, doc_id):
+        """
+        Display fields of a search result (title, filename, abstract,
+        authors) as pre-encoded JSON members, read as-is from the result
+        store when the document is in it. None if doc_id is unknown.
+        """
+        if doc_id not in self.metadata:
+            return None
+        if self._in_docstore(doc_id):
+            fragment = self.docstore.result(doc_id)
+            if fragment is not None:
+                return fragment
+        row = self.metadata[doc_id]
+        summary = self.get_document_summary(doc_id)
+        if summary is None:
+            return encode_result(row["title"], row["filename"])
+        return encode_result(row["title"], summary["filename"], summary["abstract"], summary["authors"])
+
+    @pinned
+    def render_results(self, results):
+        """
+        JSON array (bytes) of search results: each result's doc_id and score
+        spliced with its result_fragment, so nothing is decoded or re-encoded
+        """
+        parts = []
+        for res in results:
+            fragment = self.result_fragment(res["doc_id"])
+            if fragment is not None:
+                score = repr(float(res["score"])).encode()
+                parts.append(b'{"doc_id":%d,"score":%s,%s}' % (res["doc_id"], score, fragment))
+        return b'[' + b','.join(parts) + b']'
+
+    def _in_docstore(self, doc_id):
+        """Whether the document store holds this document (uploads and segments keep their own copy)"""
+        return (self.docstore is not None and doc_id in self.metadata
+                and doc_id not in self.segment_of and doc_id not in self.dynamic_index)
+
+    def _read_dataset_record(self, doc_id):
+        """Parsed dataset.jsonl record of a disk document (or its segment's copy), or None"""
+        segment = self.segment_of.get(doc_id)
+        if segment is not None:
+            return segment.read_doc(doc_id)
         if not self.dataset_mmap or not self.doc_offsets_mmap: 
             return None
-        
         try:
             off_pos = (doc_id - 1) * 8
             if off_pos + 8 > len(self.doc_offsets_mmap): 
@@ -271,14 +1069,7 @@ class SearchEngine:
             line_bytes = self.dataset_mmap[byte_offset:end_pos]
             line = line_bytes.decode('utf-8', errors='ignore')
             
-            data = json.loads(line)
-            return {
-                "title": data.get('title', 'No Title'),
-                "abstract": data.get('abstract', '')[:500],
-                "text": data.get('text', data.get('abstract', 'No content available')), 
-                "authors": data.get('authors', 'Unknown'),
-                "filename": self.metadata[doc_id]["filename"]
-            }
+            return json.loads(line)
         except Exception as e:
             print(f"  [ERROR] Content retrieval failed for doc {doc_id}: {e}")
             return None
@@ -0,0 +1,225 @@
+"""
+Veridia Search Engine - Query Plan Executor
+Evaluates compiled query plans (see query_parser) over the barrel postings
+"""
+import numpy as np
+from .query_parser import Term, Phrase, And, Or, Not
+from .postings import find_decoded_postings
+
+# A prefix* term expands to at most this many lexicon words, most frequent first
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def empty_result():
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+
+def union_scores(parts):
+    """Merge (doc_ids, scores) pairs into one sorted result, summing scores of shared docs"""
+    parts = [p for p in parts if p[0].size]
+    if not parts:
+        return empty_result()
+    if len(parts) == 1:
+        return parts[0]
+    docs = np.concatenate([p[0] for p in parts])
+    scores = np.concatenate([p[1] for p in parts])
+    order = np.argsort(docs, kind='stable')
+    docs, scores = docs[order], scores[order]
+    starts = np.flatnonzero(np.diff(docs, prepend=-1))
+    return docs[starts], np.add.reduceat(scores, starts)
+
+
+def _subset_mask(docs, subset):
+    """Mask over sorted docs of the entries in subset (a sorted subset of docs)"""
+    mask = np.zeros(docs.size, dtype=bool)
+    mask[np.searchsorted(docs, subset)] = True
+    return mask
+
+
+class QueryExecutor:
+    """
+    Evaluates one plan against a SearchEngine.
+
+    A node is either evaluated in full (every matching doc) or probed with a
+    sorted array of candidate docs, in which case only those are checked.
+    AND evaluates its cheapest child in full and probes the others with the
+    survivors, so long posting lists are skipped through their block
+    directories instead of being decoded. Results are (doc_ids, scores):
+    sorted int64 IDs and float32 BM25 scores.
+    """
+
+    def __init__(self, engine, use_semantic=False):
+        self.engine = engine
+        self.use_semantic = use_semantic
+        # Per-executor memos, so plans run on one executor (e.g. the stages
+        # of one request) look up each word and decode each list only once
+        self._words = {}
+        self._terms = {}
+        self._lists = {}
+
+    def evaluate(self, node, candidates=None, exact=False):
+        """Evaluate a plan node; exact disables synonym expansion of its words"""
+        if isinstance(node, Term):
+            if node.field:
+                return self._field_term(node, candidates)
+            return self._term(node, candidates, exact)
+        if isinstance(node, Phrase):
+            return self._phrase(node, candidates)
+        if isinstance(node, And):
+            return self._and(node, candidates, exact)
+        if isinstance(node, Or):
+            return union_scores([self.evaluate(c, candidates, exact) for c in node.children])
+        if isinstance(node, Not):
+            docs = self.engine.all_doc_ids() if candidates is None else candidates
+            return self._exclude(docs, np.zeros(docs.size, dtype=np.float32), [node.child])
+        raise TypeError(f"Unknown plan node: {node!r}")
+
+    # ============= COST ESTIMATES =============
+
+    def cost(self, node):
+        """Rough number of postings a full evaluation of node yields"""
+        if isinstance(node, Term):
+            if node.field:
+                return len(self.engine.field_postings(node.field, node.word, node.prefix))
+            return sum((info[2] if info else 0) + len(dynamic_docs)
+                       for _, _, info, dynamic_docs in self.resolve(node))
+        if isinstance(node, Phrase):
+            return min((self.cost(t) for t in self._phrase_terms(node)), default=0)
+        if isinstance(node, And):
+            if node.children:
+                return min(self.cost(c) for c in node.children)
+            return len(self.engine.metadata)
+        if isinstance(node, Or):
+            return sum(self.cost(c) for c in node.children)
+        return len(self.engine.metadata)
+
+    # ============= LEAVES =============
+
+    def resolve(self, node, exact=False):
+        """(weight, idf, barrel location or None, dynamic docs) per word a body Term expands to"""
+        key = (node.word, node.prefix, exact)
+        if key not in self._terms:
+            if node.prefix:
+                words = self.engine.expand_prefix(node.word, MAX_PREFIX_EXPANSIONS)
+            else:
+                words = {node.word}
+                if self.use_semantic and not exact:
+                    words.update(self.engine.similar_words(node.word, top_n=2))
+                words = sorted(words)
+            self._terms[key] = [(1.0 if node.prefix or w == node.word else 0.5,) + entry[1:]
+                                for w in words for entry in self.lookup(w)]
+        return self._terms[key]
+
+    def lookup(self, word):
+        if word not in self._words:
+            self._words[word] = self.engine._resolve_term(word, 1.0)
+        return self._words[word]
+
+    def postings(self, info):
+        """Decoded (doc_ids, freqs) of a whole posting list, or None"""
+        if info not in self._lists:
+            self._lists[info] = self.engine.read_postings(*info)
+        return self._lists[info]
+
+    def probe(self, info, candidates):
+        """(found mask, freqs) of a posting list for sorted candidates, like SearchEngine.lookup_postings"""
+        postings = self._lists.get(info)
+        if postings is None:
+            return self.engine.lookup_postings(info, candidates)
+        # Already decoded for this request: binary search instead of re-reading blocks
+        return find_decoded_postings(postings[0], postings[1], candidates)
+
+    def _term(self, node, candidates, exact=False):
+        engine = self.engine
+        parts = []
+        for weight, idf, info, dynamic_docs in self.resolve(node, exact):
+            if info:
+                if candidates is None:
+                    postings = self.postings(info)
+                    if postings is not None:
+                        docs, freqs = postings
+                        parts.append((docs.astype(np.int64),
+                                      weight * engine.bm25(docs, freqs, idf, info[0])))
+                else:
+                    found, freqs = self.probe(info, candidates)
+                    docs = candidates[found]
+                    freqs = freqs[found] if freqs is not None else None
+                    parts.append((docs, weight * engine.bm25(docs, freqs, idf, info[0])))
+            if dynamic_docs.size:
+                docs = dynamic_docs
+                if candidates is not None:
+                    docs = np.intersect1d(docs, candidates, assume_unique=True)
+                # Boost fresh content, as in SearchEngine.search
+                parts.append((docs, np.full(docs.size, weight * idf * 2.0, dtype=np.float32)))
+        return union_scores(parts)
+
+    def _field_term(self, node, candidates):
+        engine = self.engine
+        docs = engine.field_postings(node.field, node.word, node.prefix)
+        idf = engine.idf(len(docs))
+        if candidates is not None:
+            docs = np.intersect1d(docs, candidates, assume_unique=True)
+        return docs, np.full(docs.size, idf, dtype=np.float32)
+
+    def _phrase_terms(self, node):
+        return [Term(w, node.field) for w in self.engine.tokenize(node.text)]
+
+    def _phrase(self, node, candidates):
+        terms = self._phrase_terms(node)
+        if not terms:
+            return empty_result()
+        docs, scores = self._and(And(terms), candidates, exact=True)
+        if len(terms) < 2 or not docs.size:
+            return docs, scores
+
+        engine = self.engine
+        words = [t.word for t in terms]
+        if node.field:
+            keep = np.array([engine.field_phrase_match(node.field, d, words)
+                             for d in docs.tolist()], dtype=bool)
+        else:
+            dynamic = np.array([d in engine.dynamic_index for d in docs.tolist()], dtype=bool)
+            keep = np.zeros(docs.size, dtype=bool)
+            if (~dynamic).any():
+                word_infos = [[entry[2] for entry in self.resolve(t, exact=True) if entry[2]]
+                              for t in terms]
+                if all(word_infos):
+                    keep[~dynamic] = engine._match_phrase(word_infos, docs[~dynamic])
+            for i in np.flatnonzero(dynamic).tolist():
+                keep[i] = engine._dynamic_phrase_match(int(docs[i]), words)
+        return docs[keep], scores[keep]
+
+    # ============= OPERATORS =============
+
+    def _and(self, node, candidates, exact=False):
+        if node.children:
+            order = sorted(range(len(node.children)), key=lambda i: self.cost(node.children[i]))
+            docs, scores = self.evaluate(node.children[order[0]], candidates, exact)
+            child_scores = {order[0]: scores}
+            for i in order[1:]:
+                if not docs.size:
+                    break
+                hit_docs, hit_scores = self.evaluate(node.children[i], docs, exact)
+                keep = _subset_mask(docs, hit_docs)
+                if not keep.all():
+                    docs = docs[keep]
+                    child_scores = {j: s[keep] for j, s in child_scores.items()}
+                child_scores[i] = hit_scores
+            # Summed in query order, like SearchEngine.search
+            scores = np.zeros(docs.size, dtype=np.float32)
+            for i in sorted(child_scores):
+                scores += child_scores[i]
+        else:
+            # Only exclusions: subtract from every document
+            docs = self.engine.all_doc_ids() if candidates is None else candidates
+            scores = np.zeros(docs.size, dtype=np.float32)
+        return self._exclude(docs, scores, node.excluded)
+
+    def _exclude(self, docs, scores, excluded):
+        for child in excluded:
+            if not docs.size:
+                break
+            hit_docs, _ = self.evaluate(child, docs)
+            keep = ~_subset_mask(docs, hit_docs)
+            docs, scores = docs[keep], scores[keep]
+        return docs, scores
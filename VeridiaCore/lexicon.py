@@ -0,0 +1,159 @@
+"""
+Veridia Search Engine - Memory-Mapped Lexicon
+Immutable word -> (word ID, barrel location) table, shared read-only by every process
+"""
+import os
+import mmap
+import zlib
+import struct
+import numpy as np
+
+# lexicon.bin layout:
+#   header    magic, version, word count, hash slot count, string bytes
+#   slots     hash table of (CRC32 of the word, entry number + 1; 0 = empty),
+#             open addressing with linear probing, at most half full
+#   entries   one per word in UTF-8 byte order: string offset, string
+#             length, word ID, barrel ID, posting count, barrel offset
+#   strings   the words back to back, in entry order
+LEXICON_FILE = "lexicon.bin"
+MAGIC = b'VLEX'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIQ')
+SLOT_ENTRY = struct.Struct('<II')    # 8 bytes
+ENTRY = struct.Struct('<QIIIIQ')     # 32 bytes, same layout as ENTRY_DTYPE
+ENTRY_DTYPE = np.dtype([('string', '<u8'), ('length', '<u4'), ('word_id', '<u4'),
+                        ('barrel_id', '<u4'), ('count', '<u4'), ('offset', '<u8')])
+_unpack_slot = SLOT_ENTRY.unpack_from
+_unpack_entry = ENTRY.unpack_from
+
+
+def write_lexicon(path, lexicon, locations):
+    """
+    Write lexicon ({word: word_id}) to path with each word's barrel
+    location from locations ({word_id: (barrel_id, offset, count)}; words
+    missing there get a zero count). Written to a temporary file and
+    renamed, so readers never see a partial file.
+    """
+    keys = sorted(word.encode('utf-8') for word in lexicon)
+    nslots = 1
+    while nslots < 2 * len(keys):
+        nslots *= 2
+
+    entries = np.zeros(len(keys), dtype=ENTRY_DTYPE)
+    lengths = np.fromiter(map(len, keys), dtype=np.uint64, count=len(keys))
+    entries['length'] = lengths
+    entries['string'] = np.cumsum(lengths) - lengths
+    word_ids = [lexicon[key.decode('utf-8')] for key in keys]
+    entries['word_id'] = word_ids
+    located = [locations.get(word_id, (0, 0, 0)) for word_id in word_ids]
+    if located:
+        entries['barrel_id'], entries['offset'], entries['count'] = zip(*located)
+
+    slots = [0] * (2 * nslots)  # (hash, entry + 1) pairs
+    mask = nslots - 1
+    for i, key in enumerate(keys):
+        h = zlib.crc32(key)
+        slot = h & mask
+        while slots[2 * slot + 1]:
+            slot = (slot + 1) & mask
+        slots[2 * slot] = h
+        slots[2 * slot + 1] = i + 1
+    slots = np.array(slots, dtype='<u4')
+
+    strings = b''.join(keys)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), nslots, len(strings)))
+        f.write(slots.tobytes())
+        f.write(entries.tobytes())
+        f.write(strings)
+    os.replace(tmp_path, path)
+
+
+class Lexicon:
+    """
+    Read-only view of lexicon.bin. get() hashes the word once and probes the
+    mapped slots, usually one, so lookups take no lock and no query; every
+    process mapping the file shares its pages. The entries are sorted, so
+    prefix() is a binary search plus a slice.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.size, nslots, _ = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} lexicon")
+        except Exception:
+            self.close()
+            raise
+        self.mask = nslots - 1
+        self.slots_start = HEADER.size
+        self.entries_start = self.slots_start + nslots * SLOT_ENTRY.size
+        self.strings_start = self.entries_start + self.size * ENTRY.size
+
+    def __len__(self):
+        return self.size
+
+    def get(self, word):
+        """(word_id, barrel_id, offset, count) of word, or None"""
+        key = word.encode('utf-8')
+        h = zlib.crc32(key)
+        mm = self.mm
+        mask = self.mask
+        slot = h & mask
+        while True:
+            slot_hash, entry = _unpack_slot(mm, self.slots_start + SLOT_ENTRY.size * slot)
+            if not entry:
+                return None
+            if slot_hash == h:
+                string, length, word_id, barrel_id, count, offset = _unpack_entry(
+                    mm, self.entries_start + ENTRY.size * (entry - 1))
+                start = self.strings_start + string
+                if mm[start:start + length] == key:
+                    return word_id, barrel_id, offset, count
+            slot = (slot + 1) & mask
+
+    def word_id(self, word):
+        found = self.get(word)
+        return found[0] if found else None
+
+    def _key(self, i):
+        string, length = _unpack_entry(self.mm, self.entries_start + i * ENTRY.size)[:2]
+        start = self.strings_start + string
+        return self.mm[start:start + length]
+
+    def _bisect(self, key, right=False):
+        """First entry whose word (cut to len(key) bytes) is >= key, or > key if right"""
+        lo, hi = 0, self.size
+        n = len(key)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            word = self._key(mid)[:n]
+            if word < key or (right and word == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def prefix(self, prefix, limit=None):
+        """[(word, word_id, barrel_id, offset, count)] of the words starting with prefix, in order"""
+        key = prefix.encode('utf-8')
+        lo = self._bisect(key)
+        hi = self._bisect(key, right=True)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        found = []
+        for i in range(lo, hi):
+            string, length, word_id, barrel_id, count, offset = _unpack_entry(
+                self.mm, self.entries_start + i * ENTRY.size)
+            start = self.strings_start + string
+            found.append((self.mm[start:start + length].decode('utf-8'), word_id, barrel_id, offset, count))
+        return found
+
+    def close(self):
+        for obj in (getattr(self, 'mm', None), self.file):
+            try:
+                if obj is not None: obj.close()
+            except Exception: pass
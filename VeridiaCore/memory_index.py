@@ -0,0 +1,159 @@
+"""
+Veridia Search Engine - In-Memory Segment
+Compact index of uploaded documents, searchable until they are flushed to disk
+"""
+from array import array
+import numpy as np
+
+UPLOAD_AUTHORS = "Uploaded User"
+
+# Doc IDs of uploads start here, far above the built corpus and the
+# documents the incremental indexer adds
+DYNAMIC_DOC_ID_START = 10000000
+
+NO_DOCS = np.empty(0, dtype=np.int64)
+
+
+class MemoryIndex:
+    """
+    Uploaded documents held in flat arrays instead of a dict and a set per
+    document and word:
+
+        term_ids   word -> term id (each word interned once)
+        postings   term id -> array('I') of doc IDs, in upload order
+        doc_ids    row -> doc ID, with rows (doc ID -> row) for lookups
+        bounds     row -> 4 offsets into the arena: title, filename, text, end
+        arena      UTF-8 titles, filenames and texts back to back
+
+    Words come from tokenize, the engine's tokenizer, which also indexes
+    the segment a flush writes: a document keeps the same terms on disk.
+
+    One writer (the engine adds under its swap lock) and any number of
+    concurrent readers: arrays only ever grow, and readers copy what they
+    use, so they never hold a buffer the writer needs to resize.
+    """
+
+    def __init__(self, tokenize):
+        self.tokenize = tokenize
+        self.term_ids = {}
+        self.postings = []
+        self.doc_ids = array('I')
+        self.rows = {}
+        self.bounds = array('Q')
+        self.arena = bytearray()
+        self.in_order = True  # postings sorted (doc IDs were added ascending)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.rows
+
+    def add(self, doc_id, title, text, filename):
+        """Index one upload (caller serializes writers)"""
+        if self.doc_ids and doc_id < self.doc_ids[-1]:
+            self.in_order = False
+        start = len(self.arena)
+        fields = [title.encode('utf-8'), filename.encode('utf-8'), text.encode('utf-8')]
+        offsets = [start, start + len(fields[0]), start + len(fields[0]) + len(fields[1])]
+        self.arena += b''.join(fields)
+        offsets.append(len(self.arena))
+        self.bounds.extend(offsets)
+        self.doc_ids.append(doc_id)
+        self.rows[doc_id] = len(self.doc_ids) - 1
+
+        # Postings last: a doc a search finds always has its table row
+        for word in dict.fromkeys(self.tokenize(text)):
+            term_id = self.term_ids.get(word)
+            if term_id is None:
+                self.postings.append(array('I'))
+                term_id = self.term_ids[word] = len(self.postings) - 1
+            self.postings[term_id].append(doc_id)
+
+    def without(self, doc_ids, rows=None):
+        """
+        A new index of the documents in the first rows rows (default: all)
+        that are not in doc_ids: the rest of a flush. Their table rows, text
+        and postings are copied over filtered; nothing is tokenized again.
+        """
+        index = MemoryIndex(self.tokenize)
+        rows = len(self.doc_ids) if rows is None else rows
+        ids = np.frombuffer(self.doc_ids[:rows].tobytes(), dtype=np.uint32)
+        kept = ids[~np.isin(ids, np.fromiter(doc_ids, dtype=np.int64, count=len(doc_ids)))]
+        if not kept.size:
+            return index
+        index.in_order = self.in_order
+        for doc_id in kept.tolist():
+            row = self.rows[doc_id]
+            start, end = self.bounds[4 * row], self.bounds[4 * row + 3]
+            shift = len(index.arena) - start
+            index.bounds.extend(self.bounds[4 * row + i] + shift for i in range(4))
+            index.arena += self.arena[start:end]
+            index.doc_ids.append(doc_id)
+            index.rows[doc_id] = len(index.doc_ids) - 1
+
+        # Every posting list filtered at once; postings of rows added
+        # meanwhile are not among kept, so they are left out too
+        words = list(self.term_ids.items())
+        lists = [self.postings[term_id].tobytes() for _, term_id in words]
+        flat = np.frombuffer(b''.join(lists), dtype=np.uint32)
+        keep = np.isin(flat, kept)
+        term_of = np.repeat(np.arange(len(words)), [len(data) // 4 for data in lists])[keep]
+        if not term_of.size:
+            return index
+        cuts = np.flatnonzero(np.diff(term_of)) + 1
+        for i, docs in zip(term_of[np.r_[0, cuts]].tolist(), np.split(flat[keep], cuts)):
+            postings = array('I')
+            postings.frombytes(docs.tobytes())
+            index.postings.append(postings)
+            index.term_ids[words[i][0]] = len(index.postings) - 1
+        return index
+
+    # ============= POSTINGS =============
+
+    def docs(self, word):
+        """Sorted int64 doc IDs of the uploads containing word"""
+        term_id = self.term_ids.get(word)
+        if term_id is None:
+            return NO_DOCS
+        docs = np.frombuffer(self.postings[term_id].tobytes(), dtype=np.uint32).astype(np.int64)
+        return docs if self.in_order else np.sort(docs)
+
+    def prefix_df(self, prefix):
+        """{word: document frequency} of the uploaded words starting with prefix"""
+        return {w: len(self.postings[t]) for w, t in list(self.term_ids.items()) if w.startswith(prefix)}
+
+    def all_doc_ids(self):
+        return np.sort(np.frombuffer(self.doc_ids.tobytes(), dtype=np.uint32).astype(np.int64))
+
+    # ============= DOCUMENT TABLE =============
+
+    def _field(self, doc_id, i):
+        row = self.rows[doc_id]
+        return self.arena[self.bounds[4 * row + i]:self.bounds[4 * row + i + 1]].decode('utf-8')
+
+    def title(self, doc_id):
+        return self._field(doc_id, 0)
+
+    def filename(self, doc_id):
+        return self._field(doc_id, 1)
+
+    def text(self, doc_id):
+        return self._field(doc_id, 2)
+
+    def document(self, doc_id):
+        """The upload as returned by SearchEngine.get_document_content"""
+        text = self.text(doc_id)
+        return {
+            "title": self.title(doc_id),
+            "filename": self.filename(doc_id),
+            "text": text,
+            "authors": UPLOAD_AUTHORS,
+            "abstract": text[:300] + "..."
+        }
+
+    def memory_bytes(self):
+        """Approximate size of the arrays and the arena (the dicts excluded)"""
+        return (len(self.arena) + self.bounds.itemsize * len(self.bounds)
+                + self.doc_ids.itemsize * len(self.doc_ids)
+                + sum(p.itemsize * len(p) for p in self.postings))
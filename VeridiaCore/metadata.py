@@ -0,0 +1,236 @@
+"""
+Veridia Search Engine - Metadata Table
+Memory-mapped title / filename / authors columns, decoded one document at a time
+"""
+import os
+import mmap
+import struct
+from bisect import bisect_left
+import numpy as np
+
+# document_metadata.bin layout:
+#   header    magic, version, flags, document count n, heap bytes
+#   doc_ids   n sorted doc IDs (uint32)
+#   columns   per column (title, filename, then authors if HAS_AUTHORS):
+#             n uint32 start offsets into the heap, then n end offsets
+#   heap      the UTF-8 values; a repeated filename or author list is
+#             stored once, and every row holding it points at those bytes
+METADATA_FILE = "document_metadata.bin"
+MAGIC = b'VMET'
+VERSION = 1
+HAS_AUTHORS = 1
+HEADER = struct.Struct('<4sIIQQ')
+MAX_HEAP = 2 ** 32 - 1
+
+# Longest title kept, as when document_metadata.txt is loaded
+MAX_TITLE = 200
+
+# Shown for documents whose metadata names no file
+DEFAULT_FILENAME = "unknown.txt"
+
+
+def read_metadata_text(path):
+    """
+    (doc_id, title, filename, authors or None) per line of a
+    document_metadata.txt in either format: doc_id||title[||filename]
+    (build_pipeline.py) or doc_id|title|authors (build_all.py)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if '||' in line:
+                parts = line.strip().split('||')
+                if len(parts) >= 2 and parts[0].isdigit():
+                    yield int(parts[0]), parts[1], parts[2] if len(parts) > 2 else DEFAULT_FILENAME, None
+            else:
+                doc_id, _, rest = line.partition('|')
+                title, sep, authors = rest.rpartition('|')
+                if doc_id.isdigit() and sep:
+                    yield int(doc_id), title, DEFAULT_FILENAME, authors
+
+
+def write_metadata_table(path, rows):
+    """
+    Write rows ((doc_id, title, filename, authors) in any order; authors is
+    None if unknown, and the authors column is left out if no row has any)
+    to path, via a temporary file
+    """
+    rows = sorted(rows, key=lambda row: row[0])
+    with_authors = any(row[3] is not None for row in rows)
+    heap = bytearray()
+    interned = {}
+
+    def column(values, intern):
+        starts = np.empty(len(rows), dtype='<u4')
+        ends = np.empty(len(rows), dtype='<u4')
+        for i, value in enumerate(values):
+            data = value.encode('utf-8', errors='replace')
+            start = interned.get(data) if intern else None
+            if start is None:
+                start = len(heap)
+                heap.extend(data)
+                if intern:
+                    interned[data] = start
+            if start + len(data) > MAX_HEAP:
+                raise ValueError("metadata values exceed the 4 GB heap")
+            starts[i] = start
+            ends[i] = start + len(data)
+        return starts, ends
+
+    columns = [column((row[1][:MAX_TITLE] for row in rows), False),
+               column((row[2] for row in rows), True)]
+    if with_authors:
+        columns.append(column((row[3] or '' for row in rows), True))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, HAS_AUTHORS if with_authors else 0, len(rows), len(heap)))
+        f.write(np.array([row[0] for row in rows], dtype='<u4').tobytes())
+        for starts, ends in columns:
+            f.write(starts.tobytes())
+            f.write(ends.tobytes())
+        f.write(heap)
+    os.replace(tmp_path, path)
+
+
+class MetadataTable:
+    """
+    Read-only view of document_metadata.bin with the mapping interface of
+    the {doc_id: {"title", "filename"}} dict it replaces. Nothing is
+    decoded up front: a lookup binary-searches the mapped doc IDs and
+    decodes that one row, so opening it is instant and every process
+    mapping the file shares its pages.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = None
+        self.views = []
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, flags, self.size, _ = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} metadata table")
+            view = memoryview(self.mm)
+            self.views.append(view)
+            n = self.size
+            pos = HEADER.size
+            self.doc_ids = self._cast(view, pos, 'I', n)
+            pos += 4 * n
+            self.columns = []
+            for _ in range(3 if flags & HAS_AUTHORS else 2):
+                starts = self._cast(view, pos, 'I', n)
+                ends = self._cast(view, pos + 4 * n, 'I', n)
+                self.columns.append((starts, ends))
+                pos += 8 * n
+            self.heap_start = pos
+            self.has_authors = bool(flags & HAS_AUTHORS)
+        except Exception:
+            self.close()
+            raise
+
+    def _cast(self, view, pos, fmt, n):
+        cast = view[pos:pos + struct.calcsize(fmt) * n].cast(fmt)
+        self.views.append(cast)
+        return cast
+
+    def _row(self, doc_id):
+        i = bisect_left(self.doc_ids, doc_id)
+        return i if i < self.size and self.doc_ids[i] == doc_id else None
+
+    def _value(self, column, i):
+        starts, ends = self.columns[column]
+        return str(self.mm[self.heap_start + starts[i]:self.heap_start + ends[i]], 'utf-8')
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, doc_id):
+        return self._row(doc_id) is not None
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __getitem__(self, doc_id):
+        i = self._row(doc_id)
+        if i is None:
+            raise KeyError(doc_id)
+        return {"title": self._value(0, i), "filename": self._value(1, i)}
+
+    def get(self, doc_id, default=None):
+        return self[doc_id] if doc_id in self else default
+
+    def authors(self, doc_id):
+        """Authors of a document, or None if not known"""
+        i = self._row(doc_id) if self.has_authors else None
+        return None if i is None else self._value(2, i)
+
+    def sorted_ids(self):
+        """Every doc ID, ascending, as an int64 array"""
+        return np.array(self.doc_ids, dtype=np.int64)
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        for obj in (self.mm, self.file):
+            try:
+                if obj is not None: obj.close()
+            except Exception: pass
+
+
+class ReaderMetadata:
+    """
+    Metadata of an IndexReader: the base index's table (a MetadataTable,
+    or the dict loaded from document_metadata.txt), a small dict for the
+    segments' documents, and the reader's MemoryIndex for the uploads not
+    yet flushed. Read-only: uploads reach it through the memory index.
+    """
+
+    def __init__(self, base, overlay=None, dynamic=None):
+        self.base = base
+        self.overlay = dict(overlay or {})
+        self.dynamic = dynamic
+        self.extra = sum(1 for doc_id in self.overlay if doc_id not in base)
+
+    def __len__(self):
+        return len(self.base) + self.extra + (len(self.dynamic) if self.dynamic is not None else 0)
+
+    def __contains__(self, doc_id):
+        return (doc_id in self.overlay or doc_id in self.base
+                or (self.dynamic is not None and doc_id in self.dynamic))
+
+    def __iter__(self):
+        yield from self.base
+        for doc_id in self.overlay:
+            if doc_id not in self.base:
+                yield doc_id
+        if self.dynamic is not None:
+            yield from self.dynamic.doc_ids.tolist()
+
+    def __getitem__(self, doc_id):
+        value = self.overlay.get(doc_id)
+        if value is not None:
+            return value
+        if self.dynamic is not None and doc_id in self.dynamic:
+            return {"title": self.dynamic.title(doc_id), "filename": self.dynamic.filename(doc_id)}
+        return self.base[doc_id]
+
+    def get(self, doc_id, default=None):
+        return self[doc_id] if doc_id in self else default
+
+    def authors(self, doc_id):
+        """Authors from the base table, or None if it has none for doc_id"""
+        if doc_id in self.overlay or not isinstance(self.base, MetadataTable):
+            return None
+        return self.base.authors(doc_id)
+
+    def sorted_ids(self):
+        """Every doc ID, ascending, as an int64 array"""
+        if isinstance(self.base, MetadataTable):
+            base = self.base.sorted_ids()
+        else:
+            base = np.array(sorted(self.base), dtype=np.int64)
+        if not self.overlay:
+            return base
+        return np.union1d(base, np.fromiter(self.overlay, dtype=np.int64, count=len(self.overlay)))
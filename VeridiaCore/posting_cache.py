@@ -0,0 +1,84 @@
+"""
+Veridia Search Engine - Posting List Cache
+Keeps decoded posting lists of hot terms in memory, within a byte budget
+"""
+import threading
+from collections import OrderedDict
+
+
+def _nbytes(value):
+    """Memory held by a cached (doc_ids, freqs) pair"""
+    return sum(a.nbytes for a in value if a is not None)
+
+
+class PostingCache:
+    """
+    LRU cache of decoded (doc_ids, freqs) arrays, bounded by their total size
+    in bytes rather than by entry count: one common term can outweigh
+    thousands of rare ones. Cached arrays are read-only and shared between
+    requests. Thread-safe; a budget of 0 disables caching.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()  # key -> (doc_ids, freqs), least recently used first
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """Like get, but a miss is not counted: for callers that won't decode the list on a miss"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        nbytes = _nbytes(value)
+        if nbytes > self.budget_bytes:
+            return  # would evict everything else; not worth it
+        for a in value:
+            if a is not None:
+                a.flags.writeable = False
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = value
+            self.size_bytes += nbytes
+            while self.size_bytes > self.budget_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size_bytes -= _nbytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (the index they were decoded from is gone)"""
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "size_bytes": self.size_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,530 @@
+"""
+Veridia Search Engine - Posting List Codec
+Block-based delta + variable-byte compression for barrel posting lists
+"""
+import os
+import struct
+from itertools import chain
+import numpy as np
+
+# ============= FORMAT CONSTANTS =============
+# word_offsets_dense.bin starts with a 16-byte header slot when the barrels
+# are compressed. Legacy files have no header: slot 0 is word 0 and always
+# begins with barrel id 0, so it can never collide with the magic.
+OFFSETS_MAGIC = b'VRDX'
+FORMAT_RAW = 1          # headerless offsets, 4-byte doc ids per posting
+FORMAT_COMPRESSED = 2   # block directory + delta/varint payloads
+
+# Header flags (compressed formats only)
+FLAG_FREQS = 0x1        # each block payload is followed by varint term frequencies
+FLAG_BLOCK_MAX = 0x2    # lists carry per-term and per-block BM25 upper bounds
+FLAG_POSITIONS = 0x4    # token positions are stored in positions_{barrel}.bin
+
+# magic, version, flags, block_size, BM25 k1 and b used for the stored bounds
+HEADER = struct.Struct('<4sBBHff')
+SLOT = struct.Struct('<IQI')         # barrel_id, byte offset, posting count
+SLOT_SIZE = 16
+
+# Each posting list is split into blocks of BLOCK_SIZE postings.
+# Directory entry per block: last doc id in block, payload length in bytes,
+# (with FLAG_BLOCK_MAX) the block's max BM25 tf-weight and (with
+# FLAG_POSITIONS) the length of the block's positions in the positions file.
+BLOCK_SIZE = 128
+TERM_MAX = struct.Struct('<f')
+POSITIONS_OFFSET = struct.Struct('<Q')
+
+
+class IndexFormat:
+    """Describes the layout of a barrel set, read from the offsets header."""
+
+    def __init__(self, version=FORMAT_RAW, flags=0, block_size=0, k1=0.0, b=0.0):
+        self.version = version
+        self.flags = flags
+        self.block_size = block_size
+        self.k1 = k1
+        self.b = b
+        self.header_slots = 0 if version == FORMAT_RAW else 1
+
+    @property
+    def compressed(self):
+        return self.version >= FORMAT_COMPRESSED
+
+    @property
+    def has_freqs(self):
+        return bool(self.flags & FLAG_FREQS)
+
+    @property
+    def has_block_max(self):
+        return bool(self.flags & FLAG_BLOCK_MAX)
+
+    @property
+    def has_positions(self):
+        return bool(self.flags & FLAG_POSITIONS)
+
+    @property
+    def list_header_size(self):
+        """Bytes before the block directory (term max score, positions offset)"""
+        size = TERM_MAX.size if self.has_block_max else 0
+        return size + (POSITIONS_OFFSET.size if self.has_positions else 0)
+
+    @property
+    def directory_dtype(self):
+        return directory_dtype(self.has_block_max, self.has_positions)
+
+    def pack_header(self):
+        return HEADER.pack(OFFSETS_MAGIC, self.version, self.flags, self.block_size,
+                           self.k1, self.b)
+
+    @classmethod
+    def from_offsets(cls, buf):
+        """Detect the format from the first slot of word_offsets_dense.bin"""
+        if len(buf) >= SLOT_SIZE and buf[:4] == OFFSETS_MAGIC:
+            _, version, flags, block_size, k1, b = HEADER.unpack_from(buf, 0)
+            return cls(version, flags, block_size, k1, b)
+        return cls()
+
+
+def directory_dtype(block_max, positions):
+    fields = [('last_doc', '<u4'), ('nbytes', '<u4')]
+    if block_max:
+        fields.append(('max_score', '<f4'))
+    if positions:
+        fields.append(('pos_nbytes', '<u4'))
+    return np.dtype(fields)
+
+
+# ============= BM25 SUPPORT =============
+
+def load_doc_lengths(path):
+    """
+    Load doc_lengths.bin (uint32 token count per doc_id).
+    Returns (lengths, num_docs, avg_doc_len), or (None, 0, 1.0) if missing.
+    """
+    if not os.path.exists(path):
+        return None, 0, 1.0
+    lengths = np.fromfile(path, dtype='<u4')
+    indexed = lengths[lengths > 0]
+    avg = float(indexed.mean()) if indexed.size else 1.0
+    return lengths, int(indexed.size), avg
+
+
+def bm25_tf_weights(doc_ids, freqs, doc_lengths, avg_doc_len, k1, b):
+    """
+    Per-posting BM25 term weight without the idf factor:
+        tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    tf is 1 when freqs is None; docs without a known length count as average.
+    Shared by the barrel builder (block maxima) and the engine (scoring) so
+    both compute bit-identical values.
+    """
+    doc_ids = np.asarray(doc_ids)
+    tf = np.ones(len(doc_ids), dtype=np.float32) if freqs is None else np.asarray(freqs, dtype=np.float32)
+    if doc_lengths is not None:
+        dl = doc_lengths[np.minimum(doc_ids, len(doc_lengths) - 1)].astype(np.float32)
+        dl[(doc_ids >= len(doc_lengths)) | (dl == 0)] = avg_doc_len
+        norm = np.float32(k1) * (np.float32(1.0 - b) + np.float32(b) * dl / np.float32(avg_doc_len))
+    else:
+        norm = np.float32(k1)
+    return tf * np.float32(k1 + 1.0) / (tf + norm)
+
+
+# ============= VARINT CODEC =============
+
+def varint_sizes(values):
+    """Number of bytes each value takes when varint-encoded"""
+    v = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(v.size, dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        nbytes += v >= (1 << shift)
+    return nbytes
+
+
+def encode_varints(values):
+    """
+    Encode unsigned integers as LEB128 varints (7 bits per byte,
+    high bit set on every byte except the last one of a value).
+    Vectorized so large posting lists encode at NumPy speed.
+    """
+    v = np.asarray(values, dtype=np.uint64)
+    if v.size == 0:
+        return b''
+
+    nbytes = varint_sizes(v)
+    starts = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max())):
+        mask = nbytes > k
+        chunk = (v[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + k] = chunk | more
+    return out.tobytes()
+
+
+def decode_varints(buf, offset=0, length=None):
+    """Bulk-decode a region of varints into a uint32 array (no byte copy)"""
+    if length is None:
+        length = len(buf) - offset
+    b = np.frombuffer(buf, dtype=np.uint8, count=length, offset=offset)
+    if b.size == 0:
+        return np.empty(0, dtype=np.uint32)
+
+    # Fast path: every value fits in a single byte (typical for dense lists)
+    if b.max() < 0x80:
+        return b.astype(np.uint32)
+    ends = np.flatnonzero(b < 0x80)
+
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+
+    shifts = (np.arange(b.size) - np.repeat(starts, lengths)) * 7
+    parts = (b & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.uint32)
+
+
+# ============= POSTING LISTS =============
+
+def num_blocks(count, block_size):
+    return (count + block_size - 1) // block_size
+
+
+def encode_posting_list(doc_ids, block_size=BLOCK_SIZE, freqs=None, weights=None,
+                        positions_offset=None, positions_nbytes=None):
+    """
+    Encode a sorted list of doc ids (and optionally their term frequencies).
+    Layout: [term max][positions offset][block directory][block payloads],
+    where each payload holds the varint gaps of its postings followed, when
+    freqs are given, by their varint term frequencies. Gaps run across block
+    boundaries, so a block can be decoded on its own by starting from the
+    previous block's last doc. When per-posting BM25 weights are given, the
+    list starts with their maximum and every directory entry records its
+    block's maximum. When the list's positions were written (see
+    encode_positions), their file offset and per-block lengths are recorded.
+    """
+    if len(doc_ids) <= block_size:
+        return _encode_single_block(doc_ids, freqs, weights, positions_offset, positions_nbytes)
+
+    docs = np.asarray(doc_ids, dtype=np.int64)
+    gaps = np.diff(docs, prepend=0)
+    values = gaps
+    if freqs is not None:
+        values = np.empty(docs.size * 2, dtype=np.int64)
+        gap_pos, freq_pos = _interleave_positions(docs.size, block_size)
+        values[gap_pos] = gaps
+        values[freq_pos] = freqs
+
+    block_starts = np.arange(0, docs.size, block_size)
+    block_ends = np.minimum(block_starts + block_size, docs.size)
+    value_starts = block_starts * 2 if freqs is not None else block_starts
+
+    dtype = directory_dtype(weights is not None, positions_offset is not None)
+    directory = np.empty(block_starts.size, dtype=dtype)
+    directory['last_doc'] = docs[block_ends - 1]
+    directory['nbytes'] = np.add.reduceat(varint_sizes(values), value_starts)
+
+    prefix = b''
+    if weights is not None:
+        block_max = np.maximum.reduceat(np.asarray(weights, dtype=np.float32), block_starts)
+        directory['max_score'] = block_max
+        prefix = TERM_MAX.pack(float(block_max.max()))
+    if positions_offset is not None:
+        directory['pos_nbytes'] = positions_nbytes
+        prefix += POSITIONS_OFFSET.pack(positions_offset)
+    return prefix + directory.tobytes() + encode_varints(values)
+
+
+def _interleave_positions(count, block_size):
+    """
+    Positions of each posting's gap and frequency in the decoded value stream
+    of a list with frequencies: block b holds [gaps of b][freqs of b].
+    """
+    j = np.arange(count)
+    block_start = (j // block_size) * block_size
+    block_len = np.minimum(block_start + block_size, count) - block_start
+    return block_start + j, block_start + block_len + j
+
+
+def _append_varints(data, values):
+    for value in values:
+        while value >= 0x80:
+            data.append((value & 0x7F) | 0x80)
+            value >>= 7
+        data.append(value)
+
+
+def _encode_single_block(doc_ids, freqs=None, weights=None,
+                         positions_offset=None, positions_nbytes=None):
+    """Pure-Python encoder for short lists, where NumPy call overhead dominates"""
+    data = bytearray()
+    prev = 0
+    values = []
+    for doc_id in doc_ids:
+        values.append(doc_id - prev)
+        prev = doc_id
+    if freqs is not None:
+        values.extend(freqs)
+    _append_varints(data, values)
+
+    prefix = b''
+    entry_format = '<II'
+    entry = [prev, len(data)]
+    if weights is not None:
+        top = float(np.max(weights))
+        prefix = TERM_MAX.pack(top)
+        entry_format += 'f'
+        entry.append(top)
+    if positions_offset is not None:
+        prefix += POSITIONS_OFFSET.pack(positions_offset)
+        entry_format += 'I'
+        entry.append(positions_nbytes[0])
+    return prefix + struct.pack(entry_format, *entry) + bytes(data)
+
+
+def encode_positions(positions, block_size=BLOCK_SIZE, freqs=None):
+    """
+    Encode the ascending token positions of every posting of a list as
+    varint gaps that restart at each doc. Blocks line up with the doc id
+    blocks, so a block's positions can be decoded without the others.
+    positions holds one list per posting or, when freqs is given, every
+    posting's positions back to back (freqs[i] of them for posting i).
+    Returns (payload bytes, payload length per block).
+    """
+    count = len(positions) if freqs is None else len(freqs)
+    if count <= block_size:
+        if freqs is not None:
+            flat, end, positions = positions, 0, []
+            for tf in freqs:
+                positions.append(flat[end:end + tf])
+                end += tf
+        data = bytearray()
+        for doc_positions in positions:
+            _append_varints(data, [p - q for p, q in zip(doc_positions, [0] + doc_positions)])
+        return bytes(data), [len(data)]
+
+    if freqs is None:
+        lengths = np.fromiter(map(len, positions), dtype=np.int64, count=count)
+        flat = np.fromiter(chain.from_iterable(positions), dtype=np.int64, count=int(lengths.sum()))
+    else:
+        lengths = np.asarray(freqs, dtype=np.int64)
+        flat = np.asarray(positions, dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    gaps = np.diff(flat, prepend=0)
+    gaps[starts] = flat[starts]
+    block_nbytes = np.add.reduceat(varint_sizes(gaps), starts[::block_size])
+    return encode_varints(gaps), block_nbytes.tolist()
+
+
+def read_term_max(buf, offset):
+    """Stored max BM25 tf-weight of a list (requires FLAG_BLOCK_MAX)"""
+    return TERM_MAX.unpack_from(buf, offset)[0]
+
+
+def read_positions_offset(buf, offset, index_format):
+    """Offset of a list's positions in its positions file (requires FLAG_POSITIONS)"""
+    skip = TERM_MAX.size if index_format.has_block_max else 0
+    return POSITIONS_OFFSET.unpack_from(buf, offset + skip)[0]
+
+
+def read_block_directory(buf, offset, count, index_format):
+    """Structured view (last_doc, nbytes[, max_score]) over a list's block directory"""
+    nb = num_blocks(count, index_format.block_size)
+    return np.frombuffer(buf, dtype=index_format.directory_dtype, count=nb,
+                         offset=offset + index_format.list_header_size)
+
+
+def payload_offset(offset, count, index_format):
+    """Byte offset where the first block payload of a list starts"""
+    nb = num_blocks(count, index_format.block_size)
+    return offset + index_format.list_header_size + nb * index_format.directory_dtype.itemsize
+
+
+def decode_posting_list(buf, offset, count, index_format):
+    """
+    Decode a full compressed posting list.
+    Returns (doc_ids, freqs) as uint32 arrays; freqs is None when the
+    barrels were built without term frequencies.
+    """
+    if count == 0:
+        empty = np.empty(0, dtype=np.uint32)
+        return empty, (empty if index_format.has_freqs else None)
+
+    directory = read_block_directory(buf, offset, count, index_format)
+    start = payload_offset(offset, count, index_format)
+    values = decode_varints(buf, start, int(directory['nbytes'].sum()))
+
+    if not index_format.has_freqs:
+        return np.cumsum(values, dtype=np.uint32), None
+
+    # Full blocks are [gaps][freqs] rows of equal width; the tail block is shorter
+    block_size = index_format.block_size
+    full = count // block_size
+    rows = values[:full * 2 * block_size].reshape(full, 2, block_size)
+    tail = values[full * 2 * block_size:]
+    rest = count - full * block_size
+    gaps = np.concatenate((rows[:, 0].ravel(), tail[:rest]))
+    freqs = np.concatenate((rows[:, 1].ravel(), tail[rest:]))
+    return np.cumsum(gaps, dtype=np.uint32), freqs
+
+
+def decode_block(buf, offset, nbytes, size, base_doc, has_freqs):
+    """
+    Decode a single block of `size` postings whose payload starts at `offset`.
+    base_doc is the last doc id of the previous block (0 for the first one).
+    """
+    values = decode_varints(buf, offset, nbytes)
+    docs = np.cumsum(values[:size], dtype=np.uint32) + np.uint32(base_doc)
+    return docs, (values[size:] if has_freqs else None)
+
+
+def _probe_blocks(buf, offset, count, index_format, targets):
+    """
+    Decode the parts of a compressed list that can hold any of the sorted
+    targets. The block directory is binary-searched first, so blocks that
+    hold none of them are skipped without being decoded.
+    Yields (lo, hi, first_block, docs, freqs): targets[lo:hi] can only occur
+    in docs, decoded from consecutive blocks starting at first_block.
+    """
+    directory = read_block_directory(buf, offset, count, index_format)
+    last_docs = directory['last_doc']
+    blocks = np.searchsorted(last_docs, targets)
+    wanted = blocks[blocks < last_docs.size]
+    wanted = wanted[np.diff(wanted, prepend=-1) != 0]  # sorted, so dedupe neighbours
+
+    # A lone block decode costs about as much as bulk-decoding 16 blocks, so
+    # past that density one pass over the whole list is cheaper
+    if wanted.size * 16 > last_docs.size:
+        docs, freqs = decode_posting_list(buf, offset, count, index_format)
+        yield 0, targets.size, 0, docs, freqs
+        return
+
+    nbytes = directory['nbytes'].astype(np.int64)
+    starts = payload_offset(offset, count, index_format) + np.cumsum(nbytes) - nbytes
+    lo = np.searchsorted(blocks, wanted, 'left').tolist()
+    hi = np.searchsorted(blocks, wanted, 'right').tolist()
+    block_size = index_format.block_size
+    for j, i in enumerate(wanted.tolist()):
+        size = min(block_size, count - i * block_size)
+        base = int(last_docs[i - 1]) if i else 0
+        docs, freqs = decode_block(buf, int(starts[i]), int(nbytes[i]), size, base,
+                                   index_format.has_freqs)
+        yield lo[j], hi[j], i, docs, freqs
+
+
+def _match_sorted(docs, targets):
+    """Index of each target in the sorted docs array, and whether it is there"""
+    idx = np.searchsorted(docs, targets)
+    hit = idx < docs.size
+    hit[hit] = docs[idx[hit]] == targets[hit]
+    return idx, hit
+
+
+def find_postings(buf, offset, count, index_format, targets):
+    """
+    Look up a sorted array of doc ids in a compressed posting list,
+    decoding only the blocks that can hold one of them.
+
+    Returns:
+        (found, freqs): bool mask over targets, and their term frequencies
+        (zero where not found; None when the index has no tf)
+    """
+    targets = np.asarray(targets, dtype=np.uint32)
+    found = np.zeros(targets.size, dtype=bool)
+    freqs = np.zeros(targets.size, dtype=np.uint32) if index_format.has_freqs else None
+    if count == 0 or targets.size == 0:
+        return found, freqs
+
+    for lo, hi, _, docs, doc_freqs in _probe_blocks(buf, offset, count, index_format, targets):
+        idx, hit = _match_sorted(docs, targets[lo:hi])
+        found[lo:hi] = hit
+        if freqs is not None:
+            freqs[lo:hi][hit] = doc_freqs[idx[hit]]
+    return found, freqs
+
+
+def find_raw_postings(buf, offset, count, targets):
+    """find_postings for a legacy raw list: binary search on the mmap view"""
+    targets = np.asarray(targets, dtype=np.uint32)
+    return _match_sorted(read_raw_posting_list(buf, offset, count), targets)[1], None
+
+
+def find_decoded_postings(docs, freqs, targets):
+    """find_postings for a list that is already decoded: binary search, no block reads"""
+    targets = np.asarray(targets, dtype=np.uint32)
+    idx, found = _match_sorted(docs, targets)
+    if freqs is None:
+        return found, None
+    matched = np.zeros(targets.size, dtype=freqs.dtype)
+    matched[found] = freqs[idx[found]]
+    return found, matched
+
+
+def find_positions(buf, offset, count, index_format, pos_buf, targets):
+    """
+    Token positions of the sorted target doc ids in a list stored with
+    FLAG_POSITIONS. Only the position blocks of doc blocks that hold a
+    target are read from pos_buf (the barrel's positions file), gathered
+    and decoded in one pass.
+
+    Returns:
+        (target_index, positions): parallel int64 arrays, one entry per
+        occurrence, grouped by target and ascending within each target
+    """
+    targets = np.asarray(targets, dtype=np.uint32)
+    block_size = index_format.block_size
+    hit_targets, hit_postings, hit_tf, hit_runs = [], [], [], []
+    seen_blocks, block_totals = [], []
+    for lo, hi, first, docs, freqs in _probe_blocks(buf, offset, count, index_format, targets):
+        idx, hit = _match_sorted(docs, targets[lo:hi])
+        postings = idx[hit]
+        if not postings.size:
+            continue
+        tf = freqs.astype(np.int64)
+        block_starts = np.arange(0, docs.size, block_size)
+        # Offset of each posting's positions within its own block
+        runs = np.cumsum(tf) - tf
+        runs -= np.repeat(runs[block_starts], np.diff(block_starts, append=docs.size))
+        hit_targets.append(lo + np.flatnonzero(hit))
+        hit_postings.append(first * block_size + postings)
+        hit_tf.append(tf[postings])
+        hit_runs.append(runs[postings])
+        seen_blocks.append(first + np.arange(block_starts.size))
+        block_totals.append(np.add.reduceat(tf, block_starts))
+
+    if not hit_targets:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    postings = np.concatenate(hit_postings)
+    lengths = np.concatenate(hit_tf)
+    seen_blocks = np.concatenate(seen_blocks)
+    block_totals = np.concatenate(block_totals)
+
+    # Gather the position bytes of the blocks that matter
+    directory = read_block_directory(buf, offset, count, index_format)
+    pos_nbytes = directory['pos_nbytes'].astype(np.int64)
+    pos_starts = read_positions_offset(buf, offset, index_format) + np.cumsum(pos_nbytes) - pos_nbytes
+    blocks = postings // block_size
+    wanted = blocks[np.diff(blocks, prepend=-1) != 0]
+    sizes = pos_nbytes[wanted]
+    if wanted[-1] - wanted[0] + 1 == wanted.size:
+        # A run of adjacent blocks is one contiguous byte range
+        gaps = decode_varints(pos_buf, int(pos_starts[wanted[0]]), int(sizes.sum()))
+    else:
+        gather = np.repeat(pos_starts[wanted] - (np.cumsum(sizes) - sizes), sizes) + np.arange(sizes.sum())
+        gaps = decode_varints(np.frombuffer(pos_buf, dtype=np.uint8)[gather])
+
+    # Where each matching posting's gap run starts in the decoded values
+    totals = block_totals[np.searchsorted(seen_blocks, wanted)]
+    value_starts = (np.cumsum(totals) - totals)[np.searchsorted(wanted, blocks)]
+    value_starts += np.concatenate(hit_runs)
+
+    # Gather the runs, then prefix-sum each run back into positions
+    out_starts = np.cumsum(lengths) - lengths
+    take = np.repeat(value_starts - out_starts, lengths) + np.arange(lengths.sum())
+    picked = gaps[take].astype(np.int64)
+    totals = np.cumsum(picked)
+    positions = totals - np.repeat(totals[out_starts] - picked[out_starts], lengths)
+    return np.repeat(np.concatenate(hit_targets), lengths), positions
+
+
+def read_raw_posting_list(buf, offset, count):
+    """Zero-copy view over a legacy 4-byte-per-posting list"""
+    return np.frombuffer(buf, dtype='<u4', count=count, offset=offset)
@@ -0,0 +1,302 @@
+"""
+Veridia Search Engine - Boolean Query Parser
+Parses AND / OR / NOT, parentheses, "quoted phrases", title: / author:
+fields and prefix* terms into a normalized operator tree (the query plan)
+"""
+import re
+from functools import lru_cache
+
+FIELDS = ('title', 'author')
+OPERATORS = ('AND', 'OR', 'NOT')
+
+# ( ) "phrase" or any other run of non-space characters
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"?|([^\s()"]+))')
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+# ============= PLAN NODES =============
+
+class Term:
+    """A single word, or every lexicon word starting with it when prefix is set"""
+
+    def __init__(self, word, field=None, prefix=False):
+        self.word = word
+        self.field = field
+        self.prefix = prefix
+
+    def __repr__(self):
+        field = f"{self.field}:" if self.field else ""
+        return f"{field}{self.word}{'*' if self.prefix else ''}"
+
+
+class Phrase:
+    """Words that must appear next to each other, in order"""
+
+    def __init__(self, text, field=None):
+        self.text = text
+        self.field = field
+
+    def __repr__(self):
+        field = f"{self.field}:" if self.field else ""
+        return f'{field}"{self.text}"'
+
+
+class And:
+    """Docs matching every child and none of the excluded nodes"""
+
+    def __init__(self, children, excluded=()):
+        self.children = list(children)
+        self.excluded = list(excluded)
+
+    def __repr__(self):
+        parts = [repr(c) for c in self.children] + [f"NOT {e!r}" for e in self.excluded]
+        return f"({' AND '.join(parts)})"
+
+
+class Or:
+    """Docs matching any child"""
+
+    def __init__(self, children):
+        self.children = list(children)
+
+    def __repr__(self):
+        return f"({' OR '.join(repr(c) for c in self.children)})"
+
+
+class Not:
+    """Negation; only survives normalization when it has nothing to subtract from"""
+
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return f"NOT {self.child!r}"
+
+
+def walk(node):
+    """Yield every node of a plan, depth first"""
+    yield node
+    if isinstance(node, (And, Or)):
+        for child in node.children:
+            yield from walk(child)
+    if isinstance(node, And):
+        for child in node.excluded:
+            yield from walk(child)
+    elif isinstance(node, Not):
+        yield from walk(node.child)
+
+
+def is_advanced(node):
+    """True if the plan uses anything beyond implicitly AND-ed bare words"""
+    if isinstance(node, And):
+        return bool(node.excluded) or any(is_advanced(c) for c in node.children)
+    return not (isinstance(node, Term) and not node.field and not node.prefix)
+
+
+# ============= PARSER =============
+
+def tokenize_query(text):
+    """Split a query into ('(' | ')' | 'phrase' | 'word', value) tokens"""
+    tokens = []
+    for lparen, rparen, phrase, word in TOKEN_PATTERN.findall(text):
+        if lparen:
+            tokens.append(('(', lparen))
+        elif rparen:
+            tokens.append((')', rparen))
+        elif word:
+            tokens.append(('word', word))
+        else:
+            tokens.append(('phrase', phrase))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent over the grammar:
+        or_expr  := and_expr ( OR and_expr )*
+        and_expr := unary ( [AND] unary )*        (adjacent terms use the default operator)
+        unary    := ( NOT | - ) unary | atom
+        atom     := ( or_expr ) | field:atom | "phrase" | word | word*
+    Operators are only recognized in upper case. The parser is lenient:
+    unbalanced parentheses and quotes are closed or ignored, never an error.
+    """
+
+    def __init__(self, tokens, default_operator):
+        self.tokens = tokens
+        self.pos = 0
+        self.default_operator = default_operator
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def at_operator(self, *names):
+        kind, value = self.peek()
+        return kind == 'word' and value in names
+
+    def parse(self):
+        nodes = []
+        while self.pos < len(self.tokens):
+            node = self.or_expr()
+            if node is not None:
+                nodes.append(node)
+            elif self.pos < len(self.tokens):
+                self.take()  # stray ')' or dangling operator
+        return _or_from(nodes) if self.default_operator == 'OR' else _and_from(nodes)
+
+    def or_expr(self):
+        nodes = [self.and_expr()]
+        while self.at_operator('OR'):
+            self.take()
+            nodes.append(self.and_expr())
+        return _or_from(nodes)
+
+    def and_expr(self):
+        nodes = [self.unary()]
+        implicit = []
+        while True:
+            kind, _ = self.peek()
+            if kind is None or kind == ')' or self.at_operator('OR'):
+                break
+            if self.at_operator('AND'):
+                self.take()
+                nodes.append(self.unary())
+            else:
+                implicit.append(len(nodes))
+                nodes.append(self.unary())
+        if self.default_operator == 'OR' and implicit:
+            # a b AND c == a OR (b AND c): implicit OR binds looser than AND
+            groups, current = [], []
+            for i, node in enumerate(nodes):
+                if i in implicit:
+                    groups.append(current)
+                    current = []
+                current.append(node)
+            groups.append(current)
+            return _or_from([_and_from(group) for group in groups])
+        return _and_from(nodes)
+
+    def unary(self):
+        kind, value = self.peek()
+        if kind == 'word' and (value == 'NOT' or (value.startswith('-') and len(value) > 1)):
+            self.take()
+            if value != 'NOT':
+                self.tokens.insert(self.pos, ('word', value[1:]))
+            child = self.unary()
+            return Not(child) if child is not None else None
+        return self.atom()
+
+    def atom(self, field=None):
+        kind, value = self.take()
+        if kind == '(':
+            node = self.or_expr()
+            if self.peek()[0] == ')':
+                self.take()
+            return node
+        if kind == 'phrase':
+            words = WORD_PATTERN.findall(value.lower())
+            if len(words) == 1:
+                return Term(words[0], field)
+            return Phrase(value, field) if words else None
+        if kind != 'word' or value in OPERATORS:
+            return None
+
+        name, sep, rest = value.partition(':')
+        if sep and name.lower() in FIELDS and field is None:
+            if rest:
+                self.tokens.insert(self.pos, ('word', rest))
+            elif self.peek()[0] not in ('(', 'phrase', 'word'):
+                return None
+            return self._with_field(self.atom(), name.lower())
+
+        prefix = value.endswith('*')
+        words = WORD_PATTERN.findall(value.lower())
+        if not words:
+            return None
+        if len(words) > 1:
+            # state-of-the-art, e.g. "cs.AI": treat as a phrase
+            return Phrase(' '.join(words), field)
+        return Term(words[0], field, prefix=prefix)
+
+    def _with_field(self, node, field):
+        """Apply a field prefix to every leaf of a parenthesized group"""
+        if node is None:
+            return None
+        for leaf in walk(node):
+            if isinstance(leaf, (Term, Phrase)):
+                leaf.field = field
+        return node
+
+
+def _and_from(nodes):
+    """Build a normalized AND: flattened, with NOT children moved to excluded"""
+    children, excluded = [], []
+    for node in nodes:
+        if node is None:
+            continue
+        if isinstance(node, And):
+            children.extend(node.children)
+            excluded.extend(node.excluded)
+        elif isinstance(node, Not):
+            excluded.append(node.child)
+        else:
+            children.append(node)
+    if not children and not excluded:
+        return None
+    if len(children) == 1 and not excluded:
+        return children[0]
+    if not children and len(excluded) == 1:
+        return Not(excluded[0])
+    return And(children, excluded)
+
+
+def _or_from(nodes):
+    """Build a normalized OR: flattened and without empty branches"""
+    children = []
+    for node in nodes:
+        if node is None:
+            continue
+        children.extend(node.children if isinstance(node, Or) else [node])
+    if not children:
+        return None
+    return children[0] if len(children) == 1 else Or(children)
+
+
+def _drop_stop_words(node, stop_words, tokenizer=None):
+    """
+    Remove bare terms that are never indexed from a plan: stop words, and
+    words the indexing tokenizer would not keep as they are
+    """
+    if isinstance(node, Term) and not node.prefix and (
+            node.word in stop_words or (tokenizer is not None and tokenizer(node.word) != [node.word])):
+        return None
+    if isinstance(node, And):
+        children = [_drop_stop_words(c, stop_words, tokenizer) for c in node.children]
+        excluded = [_drop_stop_words(c, stop_words, tokenizer) for c in node.excluded]
+        return _and_from(children + [Not(e) for e in excluded if e is not None])
+    if isinstance(node, Or):
+        return _or_from([_drop_stop_words(c, stop_words, tokenizer) for c in node.children])
+    if isinstance(node, Not):
+        child = _drop_stop_words(node.child, stop_words, tokenizer)
+        return Not(child) if child is not None else None
+    return node
+
+
+@lru_cache(maxsize=1024)
+def compile_query(text, default_operator='AND', stop_words=frozenset(), tokenizer=None):
+    """
+    Parse a query string into a plan (operator tree), or None if it has no
+    searchable terms. Plans only describe the query, they hold no index
+    state, so they are cached and shared across requests and index reloads.
+    Treat returned plans as read-only. With a tokenizer (the one that built
+    the index), words it would drop are removed like stop words.
+    """
+    plan = _Parser(tokenize_query(text), default_operator).parse()
+    if plan is not None and (stop_words or tokenizer is not None):
+        # A query made only of stop words keeps them
+        plan = _drop_stop_words(plan, stop_words, tokenizer) or plan
+    return plan
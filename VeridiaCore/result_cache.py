@@ -0,0 +1,81 @@
+"""
+Veridia Search Engine - Query Result Cache
+Finished search results, invalidated by an index generation number
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+
+def approx_size(value):
+    """Rough memory footprint of a result (nested lists / dicts of scalars)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approx_size(v) for v in value)
+    return size
+
+
+class ResultCache:
+    """
+    LRU cache of search results keyed by normalized query and options.
+
+    Every change to the searchable documents must call bump_generation(),
+    which drops all entries. Callers read `generation` before computing a
+    result and pass it to put(), so a result computed while the index
+    changed is discarded instead of cached. Stale results are never served.
+    Thread-safe; max_entries = 0 disables caching.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.generation = 0
+        self.entries = OrderedDict()  # key -> (result, size), least recently used first
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result, generation):
+        """Store a result computed against the given generation (treat it as read-only afterwards)"""
+        if self.max_entries <= 0:
+            return
+        size = approx_size(result)
+        with self.lock:
+            if generation != self.generation or key in self.entries:
+                return
+            self.entries[key] = (result, size)
+            self.size_bytes += size
+            while len(self.entries) > self.max_entries:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+
+    def bump_generation(self):
+        """The index changed: invalidate every cached result"""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "generation": self.generation,
+                "entries": len(self.entries),
+                "size_bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,350 @@
+"""
+Veridia Search Engine - Index Segments
+Small immutable indexes for incrementally added documents, merged in tiers
+"""
+import os
+import json
+import mmap
+import shutil
+import threading
+from collections import defaultdict
+import numpy as np
+from .postings import (
+    IndexFormat, FORMAT_COMPRESSED, FLAG_FREQS, FLAG_POSITIONS, BLOCK_SIZE,
+    encode_posting_list, encode_positions, decode_posting_list, find_positions
+)
+
+SEGMENTS_DIR = "segments"
+MANIFEST_FILE = "manifest.json"
+
+# A tier holds segments of MERGE_FACTOR^t .. MERGE_FACTOR^(t+1) - 1 documents;
+# once MERGE_FACTOR segments share a tier they are merged into one of the next
+MERGE_FACTOR = 10
+
+# Files of one segment directory:
+#   segment.json   posting format and document count
+#   terms.json     word -> [byte offset in postings.bin, posting count]
+#   postings.bin   posting lists, same block format as the barrels (no block maxima)
+#   positions.bin  token positions (when stored)
+#   doc_table.json per-document columns: id, length, title, authors, filename, offset in docs.jsonl
+#   docs.jsonl     one {"title", "authors", "text"} record per document
+
+
+# ============= MANIFEST =============
+
+_manifest_locks = {}
+_manifest_locks_guard = threading.Lock()
+
+
+def manifest_lock(segments_dir):
+    """Process-wide lock for changes to one segments directory (commits, merges, cleanup)"""
+    key = os.path.abspath(segments_dir)
+    with _manifest_locks_guard:
+        return _manifest_locks.setdefault(key, threading.Lock())
+
+
+def read_manifest(segments_dir):
+    """Live segment names in commit order, and the counter for new names"""
+    path = os.path.join(segments_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"segments": [], "next_segment": 0}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(segments_dir, manifest):
+    """Atomically replace the manifest: readers see the old or the new one, never a mix"""
+    path = os.path.join(segments_dir, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_path(segments_dir)
+
+
+def fsync_path(path):
+    """
+    Flush a written file, or a directory's entries after a create or rename,
+    to disk. Windows cannot open directories; its renames are journaled.
+    """
+    is_dir = os.path.isdir(path)
+    if is_dir and os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY if is_dir else os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def new_segment_name(manifest):
+    name = f"seg_{manifest['next_segment']:06d}"
+    manifest['next_segment'] += 1
+    return name
+
+
+def segment_doc_count(segments_dir, name):
+    with open(os.path.join(segments_dir, name, "segment.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)["docs"]
+
+
+def segment_doc_ids(segments_dir, name):
+    with open(os.path.join(segments_dir, name, "doc_table.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)["id"]
+
+
+def remove_orphans(segments_dir, manifest):
+    """
+    Delete segment directories the manifest no longer lists (merged away, or
+    left half-written by a crash). Directories still mapped by a reader cannot
+    be deleted on Windows; they are retried on the next call.
+    """
+    live = set(manifest['segments'])
+    for name in os.listdir(segments_dir):
+        path = os.path.join(segments_dir, name)
+        if os.path.isdir(path) and name not in live:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# ============= MERGE POLICY =============
+
+def segment_tier(num_docs):
+    tier = 0
+    while num_docs >= MERGE_FACTOR ** (tier + 1):
+        tier += 1
+    return tier
+
+
+def pick_merge(segment_sizes):
+    """
+    Tiered merge policy. segment_sizes: [(name, num_docs)] in commit order.
+    Returns the oldest MERGE_FACTOR segments of the lowest full tier, or None.
+    Each document is rewritten about once per tier, so ingest cost stays
+    proportional to the new data (times log of the corpus size).
+    """
+    tiers = defaultdict(list)
+    for name, num_docs in segment_sizes:
+        tiers[segment_tier(num_docs)].append(name)
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= MERGE_FACTOR:
+            return tiers[tier][:MERGE_FACTOR]
+    return None
+
+
+# ============= WRITING =============
+
+def commit_segment(segments_dir, documents, store_positions=True, k1=1.2, b=0.75, on_commit=None):
+    """
+    Write documents (see write_segment) as a new segment and publish it in
+    the manifest; both are on disk when this returns. on_commit runs before the manifest lock is released, so
+    readers are told about commits in order. Returns the segment's name.
+    """
+    with manifest_lock(segments_dir):
+        if not os.path.isdir(segments_dir):
+            os.makedirs(segments_dir)
+            fsync_path(os.path.dirname(os.path.abspath(segments_dir)))
+        manifest = read_manifest(segments_dir)
+        name = new_segment_name(manifest)
+        write_segment(segments_dir, name, documents, store_positions, k1, b)
+        manifest['segments'].append(name)
+        write_manifest(segments_dir, manifest)
+        if on_commit is not None:
+            on_commit()
+    return name
+
+
+def write_segment(segments_dir, name, documents, store_positions=True, k1=1.2, b=0.75):
+    """
+    Write a new segment.
+
+    Args:
+        documents: [(doc_id, {"title", "authors", "text"[, "filename"]}, tokens)]
+            where tokens are the document's indexed words, in order
+    """
+    postings = defaultdict(lambda: ([], [], []))  # word -> (doc_ids, freqs, positions)
+    table = {"id": [], "length": [], "title": [], "authors": [], "filename": []}
+    records = []
+    for doc_id, record, tokens in sorted(documents, key=lambda d: d[0]):
+        occurrences = defaultdict(list)
+        for position, word in enumerate(tokens):
+            occurrences[word].append(position)
+        for word, positions in occurrences.items():
+            doc_ids, freqs, word_positions = postings[word]
+            doc_ids.append(doc_id)
+            freqs.append(len(positions))
+            word_positions.append(positions)
+        table["id"].append(doc_id)
+        table["length"].append(len(tokens))
+        table["title"].append(record.get("title", ""))
+        table["authors"].append(record.get("authors", ""))
+        table["filename"].append(record.get("filename", ""))
+        records.append(json.dumps(record).encode('utf-8') + b"\n")
+    _write_files(segments_dir, name, postings, table, records, store_positions, k1, b)
+
+
+def _write_files(segments_dir, name, postings, table, records, store_positions, k1, b):
+    flags = FLAG_FREQS | (FLAG_POSITIONS if store_positions else 0)
+    index_format = IndexFormat(FORMAT_COMPRESSED, flags, BLOCK_SIZE, k1, b)
+
+    # Written under a temporary name and renamed, so a crash never leaves a
+    # directory that looks complete
+    final = os.path.join(segments_dir, name)
+    tmp = final + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    terms = {}
+    with open(os.path.join(tmp, "postings.bin"), 'wb') as pf:
+        posf = open(os.path.join(tmp, "positions.bin"), 'wb') if store_positions else None
+        try:
+            for word in sorted(postings):
+                doc_ids, freqs, positions = postings[word]
+                positions_offset = positions_nbytes = None
+                if posf:
+                    positions_offset = posf.tell()
+                    data, positions_nbytes = encode_positions(positions, BLOCK_SIZE)
+                    posf.write(data)
+                terms[word] = [pf.tell(), len(doc_ids)]
+                pf.write(encode_posting_list(doc_ids, BLOCK_SIZE, freqs, None,
+                                             positions_offset, positions_nbytes))
+        finally:
+            if posf: posf.close()
+
+    table["offset"] = []
+    with open(os.path.join(tmp, "docs.jsonl"), 'wb') as f:
+        for line in records:
+            table["offset"].append(f.tell())
+            f.write(line)
+    with open(os.path.join(tmp, "doc_table.json"), 'w', encoding='utf-8') as f:
+        json.dump(table, f)
+    with open(os.path.join(tmp, "terms.json"), 'w', encoding='utf-8') as f:
+        json.dump(terms, f)
+    with open(os.path.join(tmp, "segment.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "name": name,
+            "docs": len(table["id"]),
+            "format": [index_format.version, index_format.flags, index_format.block_size, k1, b]
+        }, f, indent=2)
+    # Every file must be on disk before the manifest can name the segment:
+    # a flush deletes the only other copy of its documents right after
+    for filename in os.listdir(tmp):
+        fsync_path(os.path.join(tmp, filename))
+    fsync_path(tmp)
+    os.replace(tmp, final)
+    fsync_path(segments_dir)
+
+
+def merge_segments(segments_dir, names, new_name):
+    """Merge the named segments into a new one; the old ones are left in place"""
+    readers = [Segment(os.path.join(segments_dir, name)) for name in names]
+    try:
+        store_positions = all(r.index_format.has_positions for r in readers)
+        fmt = readers[0].index_format
+
+        # Per word: concatenate every segment's list, then restore doc order
+        parts = defaultdict(list)
+        for reader in readers:
+            for word, docs, freqs, positions in reader.iter_postings(store_positions):
+                parts[word].append((docs, freqs, positions))
+        postings = {}
+        for word, lists in parts.items():
+            docs = np.concatenate([p[0] for p in lists])
+            freqs = np.concatenate([p[1] for p in lists])
+            positions = [pos for p in lists for pos in p[2]] if store_positions else None
+            order = np.argsort(docs, kind='stable')
+            postings[word] = (docs[order].tolist(), freqs[order].tolist(),
+                              [positions[i] for i in order] if store_positions else None)
+
+        table = {"id": [], "length": [], "title": [], "authors": [], "filename": []}
+        records = []
+        rows = sorted(((doc_id, reader, i) for reader in readers
+                       for i, doc_id in enumerate(reader.table["id"])), key=lambda row: row[0])
+        for doc_id, reader, i in rows:
+            for column in table:
+                values = reader.table.get(column)
+                table[column].append(values[i] if values else "")
+            records.append(reader.read_doc_bytes(i))
+    finally:
+        for reader in readers:
+            reader.close()
+    _write_files(segments_dir, new_name, postings, table, records, store_positions, fmt.k1, fmt.b)
+
+
+# ============= READING =============
+
+def _map_file(path):
+    """(file, read-only mmap) or (None, None) for a missing or empty file"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None, None
+    f = open(path, 'rb')
+    return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment:
+    """Read-only view of one segment directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.barrel_id = f"segment:{self.name}"  # key among the engine's barrels
+        with open(os.path.join(path, "segment.json"), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        self.index_format = IndexFormat(*info["format"])
+        self.num_docs = info["docs"]
+        with open(os.path.join(path, "terms.json"), 'r', encoding='utf-8') as f:
+            self.terms = json.load(f)
+        self.words = sorted(self.terms)
+        with open(os.path.join(path, "doc_table.json"), 'r', encoding='utf-8') as f:
+            self.table = json.load(f)
+        self.doc_ids = np.array(self.table["id"], dtype=np.int64)
+        self.doc_lengths = np.array(self.table["length"], dtype=np.uint32)
+
+        self.postings_file, self.postings = _map_file(os.path.join(path, "postings.bin"))
+        self.positions_file, self.positions = _map_file(os.path.join(path, "positions.bin"))
+        self.docs_file = open(os.path.join(path, "docs.jsonl"), 'rb')
+        self.docs_lock = threading.Lock()  # seek + read on the shared handle
+
+    def location(self, word):
+        """(barrel key, offset, count) of word's list in this segment, or None"""
+        entry = self.terms.get(word)
+        return (self.barrel_id, entry[0], entry[1]) if entry else None
+
+    def filename(self, row):
+        names = self.table.get("filename")
+        return (names[row] if names else "") or f"doc_{self.table['id'][row]}.txt"
+
+    def row(self, doc_id):
+        i = int(np.searchsorted(self.doc_ids, doc_id))
+        return i if i < self.doc_ids.size and self.doc_ids[i] == doc_id else None
+
+    def read_doc_bytes(self, row):
+        with self.docs_lock:
+            self.docs_file.seek(self.table["offset"][row])
+            return self.docs_file.readline()
+
+    def read_doc(self, doc_id):
+        """The stored {"title", "authors", "text"} record of a document, or None"""
+        row = self.row(doc_id)
+        if row is None: return None
+        return json.loads(self.read_doc_bytes(row).decode('utf-8', errors='ignore'))
+
+    def iter_postings(self, with_positions):
+        """(word, doc_ids, freqs, per-doc position lists or None) for every word"""
+        for word in self.words:
+            offset, count = self.terms[word]
+            docs, freqs = decode_posting_list(self.postings, offset, count, self.index_format)
+            positions = None
+            if with_positions:
+                _, flat = find_positions(self.postings, offset, count, self.index_format,
+                                         self.positions, docs)
+                positions = [p.tolist() for p in np.split(flat, np.cumsum(freqs)[:-1].astype(np.int64))]
+            yield word, docs, freqs, positions
+
+    def close(self):
+        for obj in (self.postings, self.positions, self.postings_file,
+                    self.positions_file, self.docs_file):
+            try:
+                if obj is not None: obj.close()
+            except Exception: pass
@@ -0,0 +1,423 @@
+"""
+Veridia Search Engine - Index Snapshots
+Versioned read-only copies of the built index, and the reader objects serving them
+"""
+import os
+import re
+import json
+import mmap
+import time
+import shutil
+import sqlite3
+import itertools
+import threading
+import numpy as np
+from .postings import IndexFormat, SLOT_SIZE, load_doc_lengths
+from .lexicon import LEXICON_FILE, Lexicon
+from .docstore import DOCSTORE_FILES, RESULT_FILES, DocStore
+from .metadata import METADATA_FILE, MetadataTable, ReaderMetadata
+from .synonyms import SYNONYMS_FILE, SynonymTable
+
+# Layout under the data directory:
+#   CURRENT                 name of the published snapshot (replaced atomically)
+#   snapshots/<name>/       one immutable copy of the files the engine reads,
+#                           plus snapshot.json describing them
+# Without a CURRENT file the engine reads the data directory itself.
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+SNAPSHOT_MANIFEST = "snapshot.json"
+
+# Published snapshots kept on disk (the current one included)
+KEEP_SNAPSHOTS = 2
+
+SNAPSHOT_FILES = frozenset({
+    "word_offsets_dense.bin", "doc_lengths.bin", "document_metadata.txt", METADATA_FILE,
+    "lexicon.db", LEXICON_FILE, SYNONYMS_FILE, "dataset.jsonl", "doc_offsets.bin", *DOCSTORE_FILES, *RESULT_FILES
+})
+# Only read when there is no document store
+DATASET_FILES = frozenset({"dataset.jsonl", "doc_offsets.bin"})
+BARREL_FILE = re.compile(r"^(barrel|positions)_\d+\.bin$")
+
+
+# ============= PUBLISHING =============
+
+def current_snapshot(data_dir):
+    """(name, directory) of the published snapshot, or (None, data_dir) if none was published"""
+    path = os.path.join(data_dir, CURRENT_FILE)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+        directory = os.path.join(data_dir, SNAPSHOTS_DIR, name)
+        if name and os.path.isdir(directory):
+            return name, directory
+    return None, data_dir
+
+
+def read_snapshot_manifest(directory):
+    with open(os.path.join(directory, SNAPSHOT_MANIFEST), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def publish_snapshot(data_dir, keep=KEEP_SNAPSHOTS):
+    """
+    Copy the freshly built index files of data_dir into a new snapshot
+    directory and point CURRENT at it. Files unchanged since the previous
+    snapshot are hard-linked from it instead of copied (snapshot files are
+    never modified, while the builders rewrite theirs in place).
+    Returns the new snapshot's name.
+    """
+    files = sorted(name for name in os.listdir(data_dir)
+                   if name in SNAPSHOT_FILES or BARREL_FILE.match(name))
+    if DocStore.exists(data_dir):
+        files = [name for name in files if name not in DATASET_FILES]
+    root = os.path.join(data_dir, SNAPSHOTS_DIR)
+    os.makedirs(root, exist_ok=True)
+
+    previous_name, previous_dir = current_snapshot(data_dir)
+    previous = read_snapshot_manifest(previous_dir)["files"] if previous_name else {}
+    versions = [int(name[1:]) for name in os.listdir(root) if re.match(r"^v\d+$", name)]
+    name = f"v{max(versions, default=0) + 1:06d}"
+
+    final = os.path.join(root, name)
+    tmp = final + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    signatures = {}
+    linked = 0
+    for filename in files:
+        source = os.path.join(data_dir, filename)
+        stat = os.stat(source)
+        signatures[filename] = [stat.st_size, stat.st_mtime_ns]
+        target = os.path.join(tmp, filename)
+        if previous.get(filename) == signatures[filename]:
+            try:
+                os.link(os.path.join(previous_dir, filename), target)
+                linked += 1
+                continue
+            except OSError:
+                pass
+        shutil.copy2(source, target)
+
+    manifest = {"name": name, "created": time.time(), "files": signatures}
+    _write_atomic(os.path.join(tmp, SNAPSHOT_MANIFEST), json.dumps(manifest, indent=2))
+    os.replace(tmp, final)
+    _write_atomic(os.path.join(data_dir, CURRENT_FILE), name)
+    print(f"  [OK] Published snapshot {name} ({len(files)} files, {linked} unchanged)")
+    prune_snapshots(data_dir, keep)
+    return name
+
+
+def prune_snapshots(data_dir, keep=KEEP_SNAPSHOTS):
+    """
+    Delete all but the newest `keep` snapshots (never the current one) and
+    unfinished ones. Files still mapped by a running server stay readable
+    on POSIX; on Windows their deletion fails and is retried next time.
+    """
+    root = os.path.join(data_dir, SNAPSHOTS_DIR)
+    if not os.path.isdir(root):
+        return
+    current, _ = current_snapshot(data_dir)
+    names = sorted(name for name in os.listdir(root) if re.match(r"^v\d+$", name))
+    stale = [name for name in names[:-keep] if name != current] if keep > 0 else []
+    stale += [name for name in os.listdir(root) if name.endswith(".tmp")]
+    for name in stale:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+# ============= READING =============
+
+class Handle:
+    """Shared ownership of a BaseIndex or Segment: closed when the last reader releases it"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.refs = 0
+        self.lock = threading.Lock()
+
+    def retain(self):
+        with self.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self.lock:
+            self.refs -= 1
+            last = self.refs == 0
+        if last:
+            self.resource.close()
+
+
+_serials = itertools.count(1)
+
+
+class BaseIndex:
+    """The barrels, offsets, lexicon, synonyms, metadata and document store (or dataset) of one index directory"""
+
+    def __init__(self, directory, name=None):
+        self.directory = directory
+        self.name = name
+        self.serial = next(_serials)  # distinguishes its posting lists in the shared cache
+        self.index_format = IndexFormat()
+        self.offsets_file = None
+        self.offsets_mmap = None
+        self.barrels = {}
+        self.barrel_files = {}
+        self.positions = {}
+        self.positions_files = {}
+        self.doc_lengths = None
+        self.num_docs = 0
+        self.avg_doc_len = 1.0
+        self.metadata = {}
+        self.dataset_file = None
+        self.dataset_mmap = None
+        self.doc_offsets_file = None
+        self.doc_offsets_mmap = None
+        self.docstore = None
+        self.lexicon = None
+        self.synonyms = None
+        self.conn = None
+        try:
+            self._load()
+        except Exception:
+            self.close()
+            raise
+
+    def _load(self):
+        # Map the lexicon file; indexes built before it existed fall back to SQLite
+        lexicon_path = os.path.join(self.directory, LEXICON_FILE)
+        db_path = os.path.join(self.directory, "lexicon.db")
+        if os.path.exists(lexicon_path):
+            try:
+                self.lexicon = Lexicon(lexicon_path)
+                print(f"  [OK] Mapped lexicon ({len(self.lexicon):,} words)")
+            except Exception as e:
+                print(f"  [ERR] Failed to map lexicon: {e}")
+        if self.lexicon is None and os.path.exists(db_path):
+            try:
+                self.conn = sqlite3.connect(db_path, check_same_thread=False)
+                self.conn.row_factory = sqlite3.Row
+                print(f"  [OK] Connected to SQLite lexicon at {db_path}")
+            except Exception as e:
+                print(f"  [ERR] Failed to connect to DB: {e}")
+        elif self.lexicon is None:
+            print(f"  [ERR] Lexicon not found in {self.directory}. Please run build_lexicon.py")
+
+        # Map the synonym table; without it semantic expansion scans the word vectors
+        synonyms_path = os.path.join(self.directory, SYNONYMS_FILE)
+        if os.path.exists(synonyms_path):
+            try:
+                self.synonyms = SynonymTable(synonyms_path)
+                print(f"  [OK] Mapped synonym table ({len(self.synonyms):,} word IDs)")
+            except Exception as e:
+                print(f"  [ERR] Failed to map synonym table: {e}")
+
+        # Load Offsets (Dense Mmap)
+        offsets_path = os.path.join(self.directory, "word_offsets_dense.bin")
+        if os.path.exists(offsets_path):
+            try:
+                self.offsets_file = open(offsets_path, 'rb')
+                self.offsets_mmap = mmap.mmap(self.offsets_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.index_format = IndexFormat.from_offsets(self.offsets_mmap)
+                records = len(self.offsets_mmap) // SLOT_SIZE - self.index_format.header_slots
+                print(f"  [OK] Mapped offsets ({records:,} records, posting format v{self.index_format.version})")
+            except Exception as e:
+                print(f"  [ERR] Failed to map offsets: {e}")
+
+        # Load Barrels
+        max_barrel = 0
+        for filename in os.listdir(self.directory):
+            if filename.startswith("barrel_") and filename.endswith(".bin"):
+                try:
+                    bid = int(filename.split('_')[1].split('.')[0])
+                    max_barrel = max(max_barrel, bid)
+                except: pass
+
+        print(f"  [OK] Barrels: 0 to {max_barrel}")
+        for i in range(max_barrel + 1):
+            path = os.path.join(self.directory, f"barrel_{i}.bin")
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                f = open(path, 'rb')
+                self.barrel_files[i] = f
+                self.barrels[i] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.barrels[i] = None
+
+        # Load Positions (phrase queries)
+        if self.index_format.has_positions:
+            for i in range(max_barrel + 1):
+                path = os.path.join(self.directory, f"positions_{i}.bin")
+                if os.path.exists(path) and os.path.getsize(path) > 0:
+                    f = open(path, 'rb')
+                    self.positions_files[i] = f
+                    self.positions[i] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            print(f"  [OK] Positions: {len(self.positions)} files (phrase queries enabled)")
+
+        # Load Document Lengths (BM25 length normalization)
+        lengths_path = os.path.join(self.directory, "doc_lengths.bin")
+        try:
+            self.doc_lengths, self.num_docs, self.avg_doc_len = load_doc_lengths(lengths_path)
+            if self.doc_lengths is not None:
+                print(f"  [OK] Loaded lengths for {self.num_docs:,} documents (avg {self.avg_doc_len:.1f} tokens)")
+        except Exception as e:
+            print(f"  [ERR] Document lengths load failed: {e}")
+            self.doc_lengths = None
+
+        # Map the metadata table; indexes built before it existed load the text file
+        table_path = os.path.join(self.directory, METADATA_FILE)
+        meta_path = os.path.join(self.directory, "document_metadata.txt")
+        if os.path.exists(table_path):
+            try:
+                self.metadata = MetadataTable(table_path)
+                print(f"  [OK] Mapped metadata ({len(self.metadata):,} documents)")
+                if not self.num_docs:
+                    self.num_docs = len(self.metadata)
+            except Exception as e:
+                print(f"  [ERR] Failed to map metadata: {e}")
+        if not isinstance(self.metadata, MetadataTable) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        parts = line.strip().split('||')
+                        if len(parts) >= 2:
+                            doc_id = int(parts[0])
+                            title = parts[1][:200] if len(parts[1]) > 200 else parts[1]
+                            filename = parts[2] if len(parts) > 2 else "unknown.txt"
+                            self.metadata[doc_id] = {"title": title, "filename": filename}
+                print(f"  [OK] Loaded {len(self.metadata):,} documents metadata")
+                if not self.num_docs:
+                    self.num_docs = len(self.metadata)
+            except Exception as e:
+                print(f"  [ERR] Metadata load failed: {e}")
+
+        # Load the document store for content retrieval; older indexes read dataset.jsonl
+        if DocStore.exists(self.directory):
+            try:
+                self.docstore = DocStore(self.directory)
+                print("  [OK] Document store mapped for content retrieval")
+            except Exception as e:
+                print(f"  [ERR] Document store mapping failed: {e}")
+        jsonl_path = os.path.join(self.directory, "dataset.jsonl")
+        doc_offsets_path = os.path.join(self.directory, "doc_offsets.bin")
+        if self.docstore is None and os.path.exists(jsonl_path) and os.path.exists(doc_offsets_path):
+            try:
+                self.dataset_file = open(jsonl_path, 'rb')
+                if os.path.getsize(jsonl_path) > 0:
+                    self.dataset_mmap = mmap.mmap(self.dataset_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+                self.doc_offsets_file = open(doc_offsets_path, 'rb')
+                if os.path.getsize(doc_offsets_path) > 0:
+                    self.doc_offsets_mmap = mmap.mmap(self.doc_offsets_file.fileno(), 0, access=mmap.ACCESS_READ)
+                print("  [OK] Dataset mapped for content retrieval")
+            except Exception as e:
+                print(f"  [WARN] Dataset mapping failed: {e}")
+
+    def close(self):
+        metadata = self.metadata if isinstance(self.metadata, MetadataTable) else None
+        resources = ([self.lexicon, self.synonyms, self.conn, self.docstore, metadata, self.dataset_mmap, self.dataset_file, self.doc_offsets_mmap,
+                      self.doc_offsets_file, self.offsets_mmap, self.offsets_file]
+                     + list(self.barrels.values()) + list(self.barrel_files.values())
+                     + list(self.positions.values()) + list(self.positions_files.values()))
+        for obj in resources:
+            try:
+                if obj is not None: obj.close()
+            except Exception: pass
+
+
+class IndexReader:
+    """
+    Immutable view of the searchable index: one BaseIndex plus the live
+    segments, with the collection statistics of their union.
+
+    Queries pin the reader for their whole run and the engine swaps in a
+    new one on every reload or segment commit. A replaced reader is retired
+    and closed by whichever thread unpins it last, so in-flight queries
+    finish on the files they started with. Pinning takes no lock: list
+    append/pop are atomic in CPython, and a reader retired between the
+    lookup and the pin is simply released and looked up again.
+    """
+
+    def __init__(self, base, segments=(), dynamic_index=None):
+        """
+        base / segments: retained Handles, owned by the reader from now on.
+        dynamic_index: the engine's MemoryIndex of unflushed uploads
+        """
+        self.base_handle = base
+        self.segment_handles = list(segments)
+        self.base = base.resource
+        self.segments = [handle.resource for handle in self.segment_handles]
+        self.pins = []
+        self.retired = False
+        self.closed = False
+        self.close_lock = threading.Lock()
+
+        base = self.base
+        self.index_format = base.index_format
+        self.offsets_mmap = base.offsets_mmap
+        self.lexicon = base.lexicon
+        self.synonyms = base.synonyms
+        self.conn = base.conn
+        self.dataset_mmap = base.dataset_mmap
+        self.doc_offsets_mmap = base.doc_offsets_mmap
+        self.docstore = base.docstore
+        self.cache_tag = base.serial
+        self.field_indexes = {}  # field -> ({word: sorted doc IDs}, sorted words), built on demand
+
+        self.barrels = dict(base.barrels)
+        self.positions = dict(base.positions)
+        self.barrel_formats = {}  # barrel id -> IndexFormat, for barrels not in index_format
+        overlay = {}
+        for segment in self.segments:
+            self.barrels[segment.barrel_id] = segment.postings
+            self.positions[segment.barrel_id] = segment.positions
+            self.barrel_formats[segment.barrel_id] = segment.index_format
+            for i, doc_id in enumerate(segment.table["id"]):
+                overlay[doc_id] = {"title": segment.table["title"][i][:200],
+                                   "filename": segment.filename(i)}
+        self.dynamic_index = dynamic_index
+        self.metadata = ReaderMetadata(base.metadata, overlay, dynamic_index)
+
+        # Collection statistics: the barrels' plus the segments'. The average
+        # length stays the barrels' so their stored block maxima remain valid.
+        # doc_lengths covers the barrels only: segment docs keep their lengths
+        # in their segment, since uploaded doc IDs start far past the barrels'
+        segment_docs = sum(len(segment.table["id"]) for segment in self.segments)
+        if base.doc_lengths is None and segment_docs:
+            self.avg_doc_len = float(np.mean(np.concatenate([seg.doc_lengths for seg in self.segments])))
+        else:
+            self.avg_doc_len = base.avg_doc_len
+        self.doc_lengths = base.doc_lengths
+        self.num_docs = base.num_docs + segment_docs
+        self.segment_docs = segment_docs
+        self.segment_of = {doc_id: segment for segment in self.segments for doc_id in segment.table["id"]}
+        self.segment_barrels = {segment.barrel_id: segment for segment in self.segments}
+        self.segment_doc_ids = np.array(sorted(self.segment_of), dtype=np.int64)
+
+    def pin(self):
+        self.pins.append(None)
+
+    def unpin(self):
+        self.pins.pop()
+        if self.retired and not self.pins:
+            self.close()
+
+    def retire(self):
+        """Replaced by a newer reader: close as soon as no query holds it"""
+        self.retired = True
+        if not self.pins:
+            self.close()
+
+    def close(self):
+        with self.close_lock:
+            if self.closed: return
+            self.closed = True
+        for handle in [self.base_handle] + self.segment_handles:
+            handle.release()
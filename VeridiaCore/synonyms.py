@@ -0,0 +1,146 @@
+"""
+Veridia Search Engine - Synonym Table
+The nearest word-vector neighbours of every lexicon word, computed once at
+build time so semantic expansion never scans the vector matrix
+"""
+import os
+import mmap
+import zlib
+import struct
+import numpy as np
+
+# synonyms.bin layout:
+#   header      magic, version, row count n (highest word ID + 1), neighbours
+#               kept per word, total neighbours, checksum of the vector vocabulary
+#   checks      n CRC32s of the word each row belongs to (0 for unused word IDs)
+#   offsets     n + 1 uint32: row i is neighbours[offsets[i]:offsets[i + 1]]
+#   neighbours  indices into the vector vocabulary, most similar first
+# A row is only used for the word it was computed for, so a table left from
+# an earlier lexicon never answers for a word whose ID has changed.
+SYNONYMS_FILE = "synonyms.bin"
+MAGIC = b'VSYN'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+
+# Neighbours kept per word, and the cosine similarity they must reach
+# (the defaults of VectorModel.find_similar_words)
+MAX_SYNONYMS = 5
+SIMILARITY_THRESHOLD = 0.5
+
+# Words whose similarities are computed together: one (batch x vocabulary)
+# float32 matrix, about 200 MB for a 400k-word vocabulary
+BATCH_WORDS = 128
+
+
+def _checksum(word):
+    return zlib.crc32(word.encode('utf-8'))
+
+
+def nearest_words(model, indices, top_n=MAX_SYNONYMS, threshold=SIMILARITY_THRESHOLD):
+    """
+    For each vector vocabulary index in indices, the indices of its top_n
+    neighbours scoring at least threshold, chosen as find_similar_words does
+    """
+    matrix = model.matrix
+    size = len(matrix)
+    k = min(top_n + 1, size)
+    for start in range(0, len(indices), BATCH_WORDS):
+        batch = indices[start:start + BATCH_WORDS]
+        scores = np.dot(matrix[batch], matrix.T)
+        top = np.argpartition(scores, size - k, axis=1)[:, size - k:]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        for row, idx in enumerate(batch):
+            found = []
+            # The best match is the word itself, as in find_similar_words
+            for j in order[row][1:]:
+                neighbour = int(top[row, j])
+                if neighbour == idx: continue
+                if top_scores[row, j] < threshold: break
+                found.append(neighbour)
+            yield found
+
+
+def write_synonyms(path, words, model, top_n=MAX_SYNONYMS):
+    """
+    Write the table of words ([(word, word_id)], e.g. a whole lexicon) over
+    the loaded VectorModel model to path, via a temporary file. Words
+    missing from the vectors get an empty row.
+    """
+    size = max((word_id for _, word_id in words), default=-1) + 1
+    checks = np.zeros(size, dtype='<u4')
+    counts = np.zeros(size, dtype=np.int64)
+    rows = {}
+    known = []
+    for word, word_id in words:
+        checks[word_id] = _checksum(word)
+        idx = model.vocab.get(word.lower())
+        if idx is not None:
+            known.append((word_id, idx))
+    for (word_id, _), found in zip(known, nearest_words(model, [idx for _, idx in known], top_n)):
+        rows[word_id] = found
+        counts[word_id] = len(found)
+    offsets = np.zeros(size + 1, dtype='<u4')
+    offsets[1:] = np.cumsum(counts)
+    neighbours = np.fromiter((n for word_id in sorted(rows) for n in rows[word_id]),
+                             dtype='<u4', count=int(offsets[-1]))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, size, top_n, len(neighbours), model.vocab_crc))
+        f.write(checks.tobytes())
+        f.write(offsets.tobytes())
+        f.write(neighbours.tobytes())
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+class SynonymTable:
+    """
+    Read-only view of synonyms.bin: a word's neighbours are two array reads
+    away from its word ID, with nothing loaded up front
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = None
+        self.views = []
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.size, self.top_n, total, self.vocab_crc = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} synonym table")
+            view = memoryview(self.mm)
+            self.views.append(view)
+            pos = HEADER.size
+            self.checks = self._cast(view, pos, self.size)
+            pos += 4 * self.size
+            self.offsets = self._cast(view, pos, self.size + 1)
+            pos += 4 * (self.size + 1)
+            self.neighbours = self._cast(view, pos, total)
+        except Exception:
+            self.close()
+            raise
+
+    def _cast(self, view, pos, n):
+        cast = view[pos:pos + 4 * n].cast('I')
+        self.views.append(cast)
+        return cast
+
+    def __len__(self):
+        return self.size
+
+    def get(self, word_id, word):
+        """Vector vocabulary indices of word's neighbours, most similar first, or None if it has no row"""
+        if word_id >= self.size or self.checks[word_id] != _checksum(word):
+            return None
+        return self.neighbours[self.offsets[word_id]:self.offsets[word_id + 1]].tolist()
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        for obj in (self.mm, self.file):
+            try:
+                if obj is not None: obj.close()
+            except Exception: pass
@@ -1,6 +1,9 @@
 import os
+import zlib
+import threading
 import numpy as np
 import time
+from .vector_index import IVF_SUFFIX, IVFIndex, write_ivf
 
 class VectorModel:
     def __init__(self, model_path):
@@ -9,6 +12,10 @@ class VectorModel:
         self.words = [] # index -> word
         self.matrix = None # numpy array
         self.vector_size = 0
+        self.vocab_crc = None # checksum of self.words, to match tables built over them
+        self.index = None # IVFIndex over matrix, for find_similar_vectors
+        self.index_thread = None # builds the index in the background when there is none
+        self.index_lock = threading.Lock()
         self.loaded = False
 
     def load_model(self):
@@ -31,10 +38,12 @@ class VectorModel:
                     self.words = f.read().splitlines()
                 
                 self.vocab = {w: i for i, w in enumerate(self.words)}
+                self.vocab_crc = zlib.crc32('\n'.join(self.words).encode('utf-8'))
                 self.matrix = data
                 self.vector_size = self.matrix.shape[1]
                 self.loaded = True
                 print(f"  [OK] Instant load: {len(self.words)} vectors.")
+                self.load_index()
                 return
             except Exception as e:
                 print(f"  [WARN] Failed to load cache: {e}. Re-parsing...")
@@ -72,6 +81,7 @@ class VectorModel:
             if vectors:
                 self.matrix = np.vstack(vectors)
                 self.vector_size = self.matrix.shape[1]
+                self.vocab_crc = zlib.crc32('\n'.join(self.words).encode('utf-8'))
                 self.loaded = True
                 print(f"  Parsed {len(self.words)} vectors in {time.time()-t_start:.2f}s.")
                 
@@ -80,9 +90,47 @@ class VectorModel:
                 np.save(npy_path, self.matrix)
                 with open(vocab_path, 'w', encoding='utf-8') as f:
                     f.write('\n'.join(self.words))
+                self.load_index()
         except Exception as e:
             print(f"Error loading embeddings: {e}")
 
+    def index_path(self):
+        return os.path.splitext(self.model_path)[0] + IVF_SUFFIX
+
+    def load_index(self):
+        """
+        Maps the IVF index (.ivf) next to the binary cache, if one was built
+        over these vectors. Loading never builds it: build_vector_index.py
+        does, or the first find_similar_vectors call starts it in the background.
+        """
+        ivf_path = self.index_path()
+        if not os.path.exists(ivf_path): return
+        try:
+            index = IVFIndex(ivf_path)
+            if index.matches(self.matrix, self.vocab_crc):
+                self.index = index
+                print(f"  [OK] Mapped vector index ({index.nlist} lists).")
+            else:
+                print("  [WARN] Vector index was built over other vectors. Using exact search until it is rebuilt.")
+        except Exception as e:
+            print(f"  [WARN] Vector index unavailable: {e}. Using exact search.")
+
+    def build_index(self, nlist=None):
+        """Builds the IVF index over the loaded vectors, writes it next to the binary cache and maps it"""
+        ivf_path = self.index_path()
+        write_ivf(ivf_path, self.matrix, self.vocab_crc, nlist)
+        self.index = IVFIndex(ivf_path)
+        return self.index
+
+    def _build_index_in_background(self):
+        print("  Building vector index in the background (exact search until it is ready)...")
+        t_start = time.time()
+        try:
+            index = self.build_index()
+            print(f"  [OK] Vector index built: {index.nlist} lists in {time.time()-t_start:.2f}s.")
+        except Exception as e:
+            print(f"  [WARN] Vector index build failed: {e}. Using exact search.")
+
     def get_vector(self, word):
         if not self.loaded: return None
         idx = self.vocab.get(word.lower())
@@ -111,3 +159,33 @@ class VectorModel:
             if len(results) >= top_n: break
             
         return results
+
+    def find_similar_vectors(self, vec, k=10, nprobe=None):
+        """
+        [(word, cosine similarity)] of the k words nearest to any vector
+        (a multi-word centroid, a document's vector), best first. Searches
+        nprobe lists of the vector index (default: index.nprobe); exact
+        over the whole matrix until there is one, which the first call
+        starts building in the background.
+        """
+        if not self.loaded or k <= 0: return []
+        vec = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm == 0: return []
+        vec = vec / norm
+
+        index = self.index
+        if index is None:
+            with self.index_lock:
+                if self.index_thread is None:
+                    self.index_thread = threading.Thread(target=self._build_index_in_background, daemon=True)
+                    self.index_thread.start()
+        if index is not None:
+            indices, scores = index.search(vec, k, nprobe)
+        else:
+            scores = np.dot(self.matrix, vec)
+            k = min(k, len(scores))
+            indices = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+            indices = indices[np.argsort(-scores[indices], kind='stable')]
+            scores = scores[indices]
+        return [(self.words[idx], float(score)) for idx, score in zip(indices, scores)]
@@ -0,0 +1,151 @@
+"""
+Veridia Search Engine - Write-Ahead Log
+Append-only record of the documents added to the in-memory index, replayed at startup
+"""
+import os
+import json
+import zlib
+import struct
+import threading
+
+# Record: payload length, CRC32 of the payload, then the JSON payload
+RECORD_HEADER = struct.Struct('<II')
+
+# Records handed to the flusher wait here until their segment is committed
+ROTATED_SUFFIX = ".flushing"
+
+
+def read_records(path):
+    """Records of a log file, oldest first; stops at the first torn or corrupt one"""
+    return [record for record, _ in _scan(path)]
+
+
+def _scan(path):
+    """(record, end offset) per intact record of a log file"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, pos)
+        payload = data[pos + RECORD_HEADER.size:pos + RECORD_HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break  # the write that was in progress when the process died
+        try:
+            record = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            break
+        pos += RECORD_HEADER.size + length
+        records.append((record, pos))
+    return records
+
+
+class WriteAheadLog:
+    """
+    Durable log of JSON records with group commit.
+
+    append() writes a record and returns its sequence number; sync(seq)
+    returns once that record is on disk. Concurrent writers share fsyncs:
+    the first one to sync covers every record appended before it, so a
+    burst of uploads costs a few fsyncs instead of one each.
+
+    rotate() hands the records logged so far to a flusher: they move to
+    <path>.flushing, which is deleted (remove_rotated) once they are safe
+    in a segment. Until then both files are replayed at startup.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rotated_path = path + ROTATED_SUFFIX
+        self.lock = threading.Lock()       # appends and rotation
+        self.sync_lock = threading.Lock()  # one fsync at a time
+        self.written = 0  # sequence number of the last record appended
+        self.synced = 0   # ... and of the last one known to be on disk
+        self.file = self._open(path)
+        if os.path.exists(self.rotated_path):
+            # A crash while rotate() appended to it leaves a torn tail too;
+            # the next rotation must not append behind it
+            self._open(self.rotated_path).close()
+
+    @staticmethod
+    def _open(path):
+        """Open a log for appending, cutting off a torn record left by a crash"""
+        records = _scan(path)
+        valid = records[-1][1] if records else 0
+        f = open(path, 'ab')
+        if f.tell() > valid:
+            f.truncate(valid)
+            f.flush()
+            os.fsync(f.fileno())
+            print(f"  [ERR] Write-ahead log {os.path.basename(path)}: dropped a torn record")
+        return f
+
+    def append(self, record):
+        payload = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.written += 1
+            return self.written
+
+    def sync(self, seq=None):
+        """Block until record seq (default: everything appended so far) is on disk"""
+        if seq is None:
+            seq = self.written
+        if seq <= self.synced:
+            return
+        with self.sync_lock:
+            if seq <= self.synced:
+                return  # covered by the fsync another writer just finished
+            with self.lock:
+                self.file.flush()
+                target = self.written
+            # Appends carry on while the disk works
+            os.fsync(self.file.fileno())
+            self.synced = target
+
+    def rotate(self):
+        """
+        Move every record logged so far to the rotated file (appending to
+        it if an earlier flush never finished) and start an empty log.
+        Returns the rotated file's records.
+        """
+        with self.sync_lock, self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.synced = self.written
+            if self.file.tell() > 0:
+                if os.path.exists(self.rotated_path):
+                    with open(self.path, 'rb') as src, open(self.rotated_path, 'ab') as dst:
+                        dst.write(src.read())
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    # A crash before the truncate below only duplicates records;
+                    # replay skips doc IDs it has already seen
+                    self.file.truncate(0)
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                else:
+                    self.file.close()
+                    os.replace(self.path, self.rotated_path)
+                    self.file = open(self.path, 'ab')
+        return read_records(self.rotated_path)
+
+    def remove_rotated(self):
+        """Drop the rotated records once the segment holding them is committed"""
+        try:
+            os.remove(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def replay(self):
+        """All logged records, rotated ones first"""
+        return read_records(self.rotated_path) + read_records(self.path)
+
+    def close(self):
+        with self.sync_lock, self.lock:
+            if not self.file.closed:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
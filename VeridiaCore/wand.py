@@ -0,0 +1,181 @@
+"""
+Veridia Search Engine - Block-Max WAND Top-K Evaluation
+Document-at-a-time query processing over compressed barrel postings
+"""
+import heapq
+from bisect import bisect_left
+import numpy as np
+from .postings import (
+    read_block_directory, read_term_max, payload_offset, decode_block
+)
+
+END_DOC = 1 << 32  # Sentinel doc id once a cursor is exhausted
+
+# Stored bounds are float32; widen them slightly so rounding can never prune a winner
+BOUND_SLACK = 1.0001
+
+
+class BlockMaxCursor:
+    """
+    Iterator over one compressed posting list.
+    Blocks are decoded lazily, only when the cursor actually lands in them;
+    skipping past a block needs nothing but its directory entry.
+    """
+
+    def __init__(self, buf, offset, count, index_format, scale, score_block):
+        """
+        Args:
+            buf, offset, count: location of the posting list in its barrel
+            index_format: IndexFormat with FLAG_BLOCK_MAX set
+            scale: query-time multiplier for stored bounds (weight * idf)
+            score_block: fn(doc_ids, freqs) -> np.ndarray of posting scores
+        """
+        self.buf = buf
+        self.count = count
+        self.block_size = index_format.block_size
+        self.has_freqs = index_format.has_freqs
+        self.score_block = score_block
+
+        directory = read_block_directory(buf, offset, count, index_format)
+        nbytes = directory['nbytes'].astype(np.int64)
+        starts = payload_offset(offset, count, index_format) + np.cumsum(nbytes) - nbytes
+        self.last_docs = directory['last_doc'].tolist()
+        self.block_nbytes = nbytes.tolist()
+        self.block_starts = starts.tolist()
+        self.block_max = (directory['max_score'] * (scale * BOUND_SLACK)).tolist()
+        self.max_score = read_term_max(buf, offset) * scale * BOUND_SLACK
+
+        self.block = -1
+        self.docs = []
+        self.scores = []
+        self.pos = 0
+        self.doc = END_DOC
+        if count:
+            self._load_block(0)
+
+    def _load_block(self, i):
+        size = min(self.block_size, self.count - i * self.block_size)
+        base = self.last_docs[i - 1] if i else 0
+        docs, freqs = decode_block(self.buf, self.block_starts[i], self.block_nbytes[i],
+                                   size, base, self.has_freqs)
+        self.block = i
+        self.docs = docs.tolist()
+        self.scores = self.score_block(docs, freqs).tolist()
+        self.pos = 0
+        self.doc = self.docs[0]
+
+    def _block_for(self, target):
+        """Index of the first block (from the current one) that may hold target"""
+        return bisect_left(self.last_docs, target, max(self.block, 0))
+
+    def score(self):
+        return self.scores[self.pos]
+
+    def next(self):
+        """Advance to the next posting"""
+        self.pos += 1
+        if self.pos < len(self.docs):
+            self.doc = self.docs[self.pos]
+        elif self.block + 1 < len(self.last_docs):
+            self._load_block(self.block + 1)
+        else:
+            self.doc = END_DOC
+
+    def next_geq(self, target):
+        """Advance to the first posting with doc id >= target"""
+        if target <= self.doc:
+            return
+        if target > self.last_docs[self.block]:
+            i = self._block_for(target)
+            if i >= len(self.last_docs):
+                self.doc = END_DOC
+                return
+            self._load_block(i)
+        self.pos = bisect_left(self.docs, target, self.pos)
+        self.doc = self.docs[self.pos]
+
+    def block_max_at(self, target):
+        """Upper bound for target's score, from the block that would hold it"""
+        if target <= self.last_docs[self.block]:
+            return self.block_max[self.block]
+        i = self._block_for(target)
+        return self.block_max[i] if i < len(self.block_max) else 0.0
+
+    def block_end_at(self, target):
+        """Last doc id of the block that would hold target"""
+        if target <= self.last_docs[self.block]:
+            return self.last_docs[self.block]
+        i = self._block_for(target)
+        return self.last_docs[i] if i < len(self.last_docs) else END_DOC
+
+
+def block_max_wand(cursors, k):
+    """
+    Block-max WAND (Ding & Suel, 2011) top-k evaluation.
+    Only documents whose block-level upper bound can beat the current k-th
+    best score are fully scored; whole blocks are skipped otherwise.
+
+    Returns:
+        List of (doc_id, score), best first; ties go to the lower doc id.
+    """
+    if k <= 0:
+        return []
+    terms = [c for c in cursors if c.doc != END_DOC]
+    live = list(terms)
+    heap = []  # (score, -doc_id): min-heap of the current top-k
+    threshold = 0.0
+
+    while live:
+        live.sort(key=lambda c: c.doc)
+
+        # Find the pivot: first cursor where the summed term bounds beat the threshold
+        acc = 0.0
+        pivot = -1
+        for i, c in enumerate(live):
+            acc += c.max_score
+            if acc > threshold:
+                pivot = i
+                break
+        if pivot < 0:
+            break
+        pivot_doc = live[pivot].doc
+        while pivot + 1 < len(live) and live[pivot + 1].doc == pivot_doc:
+            pivot += 1
+
+        # Refine with the block maxima of the blocks that would hold pivot_doc
+        block_bound = 0.0
+        for c in live[:pivot + 1]:
+            block_bound += c.block_max_at(pivot_doc)
+
+        if block_bound > threshold:
+            if live[0].doc == pivot_doc:
+                # Every cursor up to the pivot sits on pivot_doc: score it
+                # (summed in query term order, like the exhaustive scorer)
+                score = 0.0
+                for c in terms:
+                    if c.doc == pivot_doc:
+                        score += c.score()
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, -pivot_doc))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, -pivot_doc))
+                if len(heap) == k:
+                    threshold = heap[0][0]
+                for c in live[:pivot + 1]:
+                    c.next()
+            else:
+                # Docs before pivot_doc cannot reach the threshold
+                for c in live[:pivot]:
+                    c.next_geq(pivot_doc)
+        else:
+            # No doc up to the end of the current blocks can make it: jump past them
+            target = min(c.block_end_at(pivot_doc) for c in live[:pivot + 1]) + 1
+            if pivot + 1 < len(live):
+                target = min(target, live[pivot + 1].doc)
+            target = max(target, pivot_doc + 1)
+            for c in live[:pivot + 1]:
+                c.next_geq(target)
+
+        live = [c for c in live if c.doc != END_DOC]
+
+    return [(-neg_doc, score) for score, neg_doc in sorted(heap, reverse=True)]
@@ -92,6 +92,9 @@ def add_file_document():
         
         elapsed = time.time() - start_index
         
+        # Let a background segment merge finish before the process exits
+        indexer.wait_for_merges()
+        
         print("\n" + "="*60)
         print(f"SUCCESS! File added in {elapsed:.2f} seconds.")
         print(f"New Index Size: {indexer.get_status()['next_doc_id']} documents")
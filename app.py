@@ -1,14 +1,22 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import sys
+import json
 import os
 import re
 import time
+import queue
 
 # Add the parent directory to path to import engine
 # sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from VeridiaCore.engine import SearchEngine
+from VeridiaCore.query_parser import is_advanced
+from config import (
+    BM25_K1, BM25_B, POSTING_CACHE_BYTES, QUERY_CACHE_SIZE, INGEST_QUEUE_SIZE, INGEST_BATCH_DOCS
+)
+from text_processor import clean_and_tokenize
 from incremental_indexer import IncrementalIndexer
+from ingest_queue import IngestionQueue
 from ai_suggestion_engine import (
     AIAutoCorrector, AISuggestionEngine, SemanticQueryAnalyzer,
     create_ai_corrector_from_engine, create_ai_suggestion_engine
@@ -25,10 +33,17 @@ app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 # Initialize Search Engine
 # Data is in VeridiaCore (where barrels are)
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'VeridiaCore'))
-search_engine = SearchEngine(DATA_DIR)
+search_engine = SearchEngine(DATA_DIR, k1=BM25_K1, b=BM25_B, tokenizer=clean_and_tokenize,
+                             posting_cache_bytes=POSTING_CACHE_BYTES, result_cache_size=QUERY_CACHE_SIZE)
 
 # Initialize Incremental Indexer
-incremental_indexer = IncrementalIndexer(DATA_DIR)
+# (each commit becomes a segment the engine picks up through load_segments)
+incremental_indexer = IncrementalIndexer(DATA_DIR, result_cache=search_engine.result_cache,
+                                         on_commit=search_engine.load_segments)
+
+# Background indexing for /api/add-document(s): requests only queue a job
+ingest_queue = IngestionQueue(incremental_indexer, max_jobs=INGEST_QUEUE_SIZE,
+                              max_batch_docs=INGEST_BATCH_DOCS)
 
 # Initialize AI-Powered Components
 print("\n[Init] Creating AI Corrector and Suggestion Engine...")
@@ -99,101 +114,54 @@ def search():
         return jsonify([])
 
     print(f"\n[Search API] Processing query: '{query}'")
+
+    # Repeated queries are answered from the result cache until the index changes
+    result_cache = search_engine.result_cache
+    cache_key = ('search', search_engine.normalize_query(query), use_semantic, ai_corrector is not None)
+    generation = result_cache.generation
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        print("  [CACHE] Served from result cache")
+        return Response(cached, mimetype='application/json')
     
-    # helper for enriching results
-    def enrich(results):
-        enriched = []
+    # helper for rendering results: each document once, its pre-encoded
+    # display fields spliced with its score (cached as the response body)
+    def render(results):
+        unique = []
         seen_ids = set()
         for res in results:
             doc_id = res['doc_id']
             if doc_id in seen_ids: continue
             seen_ids.add(doc_id)
-            
-            content_data = search_engine.get_document_content(doc_id)
-            if content_data:
-                res['abstract'] = content_data.get('abstract', 'No Abstract')
-                res['filename'] = content_data.get('filename', 'Unknown')
-            enriched.append(res)
-        return enriched
-
-    # Stage 1: Standard Search (Strict AND)
-    # This is best for exact matches
-    results = search_engine.search(query, use_semantic=use_semantic)
-    print(f"  Stage 1 (Strict): Found {len(results)} results")
-
-    # Stage 2: AI Auto-Correction
-    # If Stage 1 failed/low results, try fixing typos
-    if len(results) < 5 and ai_corrector:
-        corrected_query = query
-        words = query.split()
-        new_words = []
-        changed = False
-        
-        for word in words:
-            if len(word) > 2:
-                # Get correction
-                corr = ai_corrector.correct_word(word, max_suggestions=1)
-                best = corr['suggestions'][0][0] if corr['suggestions'] else word
-                new_words.append(best)
-                if best.lower() != word.lower():
-                    changed = True
-            else:
-                new_words.append(word)
-        
-        if changed:
-            corrected_query = " ".join(new_words)
-            print(f"  Stage 2 (Correction): Retrying with '{corrected_query}'")
-            corrected_results = search_engine.search(corrected_query, use_semantic=use_semantic)
-            print(f"    Found {len(corrected_results)} results")
-            
-            # Merge results (preferring strictly matched ones)
-            # Simple merge: existing results + new corrected ones
-            current_ids = {r['doc_id'] for r in results}
-            for res in corrected_results:
-                if res['doc_id'] not in current_ids:
-                    results.append(res)
-
-    # Stage 3: Fallback "OR" Search (The Safety Net)
-    # If we still have very few results and multiple words, search for ANY word
-    if len(results) < 3 and len(query.split()) > 1:
-        print(f"  Stage 3 (Fallback OR): searching words individually")
-        
-        # Use a dictionary to accumulate scores
-        or_scores = {}
-        # Pre-populate with existing results
-        for res in results:
-            or_scores[res['doc_id']] = res
-        
-        words = query.split()
-        for word in words:
-            if len(word) < 3: continue # Skip small stop words like 'is', 'of'
-            
-            # Search each word individually (no semantic for speed/relevance focus)
-            word_res = search_engine.search(word, use_semantic=False)
-            for res in word_res:
-                did = res['doc_id']
-                if did not in or_scores:
-                    or_scores[did] = res
-                    # Penalty for partial match compared to full match? 
-                    # Actually engine.search already scores. 
-                    # We might want to lower score since it's just one word match.
-                    or_scores[did]['score'] *= 0.5 
-                else:
-                    # Boost score if multiple words match
-                    or_scores[did]['score'] += res['score'] * 0.5 
-
-        # Convert back to list and sort
-        results = list(or_scores.values())
-        results.sort(key=lambda x: x['score'], reverse=True)
-        print(f"    After OR-Merge: {len(results)} total results")
+            unique.append(res)
+        return search_engine.render_results(unique)
+
+    # Boolean syntax (OR, NOT/-word, parentheses, "phrases", title:/author:, prefix*):
+    # the user spelled out what must match, so run the compiled plan once, no fallbacks
+    plan = search_engine.parse_query(query)
+    if plan is not None and is_advanced(plan):
+        results = search_engine.search_boolean(query, use_semantic=use_semantic)
+        body = render(results[:50])
+        result_cache.put(cache_key, body, generation)
+        return Response(body, mimetype='application/json')
+
+    # Plain keywords: strict AND, then typo correction, then an OR fallback,
+    # all run by the engine in one pass over shared term lookups and postings
+    correct_word = None
+    if ai_corrector:
+        def correct_word(word):
+            corr = ai_corrector.correct_word(word, max_suggestions=1)
+            return corr['suggestions'][0][0] if corr['suggestions'] else word
+    results = search_engine.search_staged(query, use_semantic=use_semantic, correct_word=correct_word)
 
     # Limit results
     results = results[:50]
     
-    # Final Enrichment
-    final_output = enrich(results)
+    # Final Rendering
+    body = render(results)
+    result_cache.put(cache_key, body, generation)
     
-    return jsonify(final_output)
+    return Response(body, mimetype='application/json')
 
 @app.route('/api/suggest')
 def suggest():
@@ -263,17 +231,44 @@ def autocomplete():
 def debug():
     return jsonify({
         "data_dir": search_engine.data_dir,
-        "lexicon_size": len(search_engine.lexicon),
-        "offsets_size": len(search_engine.word_offsets),
+        "lexicon_size": search_engine.lexicon_size(),
+        "offsets_size": search_engine.offsets_size(),
         "metadata_size": len(search_engine.metadata),
         "cwd": os.getcwd(),
-        "vector_model_loaded": search_engine.vector_model.loaded
+        "vector_model_loaded": search_engine.vector_model.loaded,
+        "posting_cache": search_engine.posting_cache.stats(),
+        "result_cache": search_engine.result_cache.stats(),
+        "snapshot": search_engine.snapshot_name,
+        "uploads_in_memory": {
+            "documents": len(search_engine.dynamic_index),
+            "bytes": search_engine.dynamic_index.memory_bytes()
+        }
     })
 
+@app.route('/api/reload', methods=['POST'])
+def reload_index():
+    """
+    Switch to the latest published index snapshot (see publish_snapshot.py).
+    Searches keep running on the previous snapshot until they finish.
+    """
+    try:
+        start = time.time()
+        search_engine.load_indices()
+        return jsonify({
+            'success': True,
+            'snapshot': search_engine.snapshot_name,
+            'documents': len(search_engine.metadata),
+            'time_ms': round((time.time() - start) * 1000, 2)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/status')
 def status():
     """Get indexing status"""
-    return jsonify(incremental_indexer.get_status())
+    status = incremental_indexer.get_status()
+    status['ingest_queue'] = ingest_queue.stats()
+    return jsonify(status)
 
 @app.route('/api/add-document', methods=['POST'])
 def add_document():
@@ -297,20 +292,18 @@ def add_document():
         text = data.get('text', '')
         authors = data.get('authors', 'Unknown')
         
-        # Add document using incremental indexer
-        stats = incremental_indexer.add_documents([
-            (title, text, authors)
-        ])
-        
-        # Reload the search engine with updated indices
-        search_engine.load_indices()
+        # Queue for the background indexer; progress at /api/jobs/<job_id>
+        job = ingest_queue.submit([(title, text, authors)])
         
         return jsonify({
             'success': True,
-            'message': 'Document added successfully',
-            'stats': stats,
-            'new_doc_id': incremental_indexer.next_doc_id - 1
-        }), 201
+            'message': 'Document queued for indexing',
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
+    
+    except queue.Full:
+        return jsonify({'error': 'Indexing queue is full, retry later'}), 503
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -354,22 +347,30 @@ def add_documents():
             authors = doc.get('authors', 'Unknown')
             documents.append((title, text, authors))
         
-        # Add documents using incremental indexer
-        stats = incremental_indexer.add_documents(documents)
-        
-        # Reload the search engine with updated indices
-        search_engine.load_indices()
+        # Queue for the background indexer; progress at /api/jobs/<job_id>
+        job = ingest_queue.submit(documents)
         
         return jsonify({
             'success': True,
-            'message': f'{len(documents)} document(s) added successfully',
-            'stats': stats,
-            'total_documents': incremental_indexer.next_doc_id
-        }), 201
+            'message': f'{len(documents)} document(s) queued for indexing',
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
+    
+    except queue.Full:
+        return jsonify({'error': 'Indexing queue is full, retry later'}), 503
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a queued /api/add-document(s) submission"""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/clear-state', methods=['POST'])
 def clear_state():
     """
@@ -378,9 +379,7 @@ def clear_state():
     """
     try:
         # Reset state
-        incremental_indexer.next_doc_id = 0
-        incremental_indexer.word_id_counter = 0
-        incremental_indexer.lexicon.clear()
+        incremental_indexer.next_doc_id = incremental_indexer.first_free_doc_id()
         incremental_indexer._save_state()
         
         return jsonify({
@@ -539,22 +538,14 @@ def enhanced_search():
         # 2. Perform Search (using semantic engine)
         results = search_engine.search(final_query, use_semantic=use_semantic)
         
-        # 3. Enrich Results
-        enriched_results = []
-        for res in results:
-            doc_id = res['doc_id']
-            content_data = search_engine.get_document_content(doc_id)
-            if content_data:
-                res['abstract'] = content_data.get('abstract', 'No Abstract')
-                res['filename'] = content_data.get('filename', 'Unknown')
-            enriched_results.append(res)
-            
-        return jsonify({
+        # 3. Render Results (pre-encoded display fields, spliced into the response)
+        head = json.dumps({
             'query': query,
             'corrected_query': final_query,
-            'correction': correction_info,
-            'results': enriched_results
-        })
+            'correction': correction_info
+        }, separators=(',', ':'))
+        body = head[:-1].encode('ascii') + b',"results":' + search_engine.render_results(results) + b'}'
+        return Response(body, mimetype='application/json')
         
     except Exception as e:
         print(f"Error in enhanced-search: {e}")
@@ -1,14 +1,24 @@
 """
 Veridia Search Engine - Complete Build Script
 Runs all indexing steps in sequence
+
+Usage: python build_all.py [workers]   (default: BUILD_WORKERS from config.py)
 """
 import sys
 import time
 from build_index_fast import build_indices_optimized
-from build_inverted_fast import build_inverted_index_optimized
+from build_spimi import build_inverted_spimi
+from build_parallel import build_indices_parallel
+from build_lexicon import build_lexicon
+from build_docstore import build_docstore
+from build_metadata import build_metadata
+from build_results import build_results
+from build_synonyms import build_synonyms
+from build_vector_index import build_vector_index
+from config import BUILD_WORKERS
 
 
-def main():
+def main(workers=BUILD_WORKERS):
     """Run complete indexing pipeline."""
     print("\n" + "="*70)
     print(" "*15 + "VERIDIA SEARCH ENGINE")
@@ -18,6 +28,20 @@ def main():
     total_start = time.time()
     
     try:
+        if workers > 1:
+            # Steps 1 and 2 together, on all workers
+            print(f"STEPS 1-2: Building Lexicon, Forward Index, Metadata and Barrels ({workers} workers)")
+            print("-"*70)
+            stats = build_indices_parallel(workers)
+            print(f"\n✓ Steps 1-2 completed in {time.time() - total_start:.2f} seconds\n")
+            _build_lexicon_file()
+            _build_docstore()
+            _build_metadata_table()
+            _build_result_fragments()
+            _build_synonym_table()
+            _build_vector_index()
+            return _summary(stats, total_start)
+        
         # Step 1: Build lexicon, forward index, and metadata
         print("STEP 1: Building Lexicon, Forward Index, and Metadata")
         print("-"*70)
@@ -28,31 +52,23 @@ def main():
         step1_time = time.time() - step1_start
         print(f"\n✓ Step 1 completed in {step1_time:.2f} seconds\n")
         
-        # Step 2: Build inverted index
-        print("\nSTEP 2: Building Inverted Index")
+        # Step 2: Build inverted index (straight into barrels, within SPIMI_MEMORY_BYTES)
+        print("\nSTEP 2: Building Inverted Index and Barrels")
         print("-"*70)
         step2_start = time.time()
         
-        build_inverted_index_optimized()
+        build_inverted_spimi()
         
         step2_time = time.time() - step2_start
         print(f"\n✓ Step 2 completed in {step2_time:.2f} seconds\n")
         
-        # Final summary
-        total_time = time.time() - total_start
-        
-        print("\n" + "="*70)
-        print(" "*20 + "BUILD SUMMARY")
-        print("="*70)
-        print(f"Total Documents Indexed: {stats['docs']:,}")
-        print(f"Unique Words in Lexicon: {stats['words']:,}")
-        print(f"Total Build Time: {total_time:.2f} seconds ({total_time/60:.1f} minutes)")
-        print(f"Average Speed: {stats['docs']/total_time:.1f} documents/second")
-        print("\n✓ All indices built successfully!")
-        print("\nYou can now run: python app.py")
-        print("="*70 + "\n")
-        
-        return True
+        _build_lexicon_file()
+        _build_docstore()
+        _build_metadata_table()
+        _build_result_fragments()
+        _build_synonym_table()
+        _build_vector_index()
+        return _summary(stats, total_start)
         
     except Exception as e:
         print(f"\n❌ BUILD FAILED: {e}")
@@ -61,6 +77,90 @@ def main():
         return False
 
 
+def _build_lexicon_file():
+    """Step 3: the memory-mapped lexicon the search engine looks words up in"""
+    print("\nSTEP 3: Building Lexicon File")
+    print("-"*70)
+    step3_start = time.time()
+    
+    build_lexicon()
+    
+    print(f"\n✓ Step 3 completed in {time.time() - step3_start:.2f} seconds\n")
+
+
+def _build_docstore():
+    """Step 4: the compressed document store result pages are read from"""
+    print("\nSTEP 4: Building Document Store")
+    print("-"*70)
+    step4_start = time.time()
+    
+    build_docstore()
+    
+    print(f"\n✓ Step 4 completed in {time.time() - step4_start:.2f} seconds\n")
+
+
+def _build_metadata_table():
+    """Step 5: the memory-mapped titles, filenames and authors"""
+    print("\nSTEP 5: Building Metadata Table")
+    print("-"*70)
+    step5_start = time.time()
+    
+    build_metadata()
+    
+    print(f"\n✓ Step 5 completed in {time.time() - step5_start:.2f} seconds\n")
+
+
+def _build_result_fragments():
+    """Step 6: search result fields as pre-encoded JSON"""
+    print("\nSTEP 6: Building Result Fragments")
+    print("-"*70)
+    step6_start = time.time()
+    
+    build_results()
+    
+    print(f"\n✓ Step 6 completed in {time.time() - step6_start:.2f} seconds\n")
+
+
+def _build_synonym_table():
+    """Step 7: each word's nearest neighbours, for semantic query expansion"""
+    print("\nSTEP 7: Building Synonym Table")
+    print("-"*70)
+    step7_start = time.time()
+    
+    build_synonyms()
+    
+    print(f"\n✓ Step 7 completed in {time.time() - step7_start:.2f} seconds\n")
+
+
+def _build_vector_index():
+    """Step 8: the IVF index over the word vectors, for nearest-vector search"""
+    print("\nSTEP 8: Building Vector Index")
+    print("-"*70)
+    step8_start = time.time()
+    
+    build_vector_index()
+    
+    print(f"\n✓ Step 8 completed in {time.time() - step8_start:.2f} seconds\n")
+
+
+def _summary(stats, total_start):
+    """Print the final build summary"""
+    total_time = time.time() - total_start
+    
+    print("\n" + "="*70)
+    print(" "*20 + "BUILD SUMMARY")
+    print("="*70)
+    print(f"Total Documents Indexed: {stats['docs']:,}")
+    print(f"Unique Words in Lexicon: {stats['words']:,}")
+    print(f"Total Build Time: {total_time:.2f} seconds ({total_time/60:.1f} minutes)")
+    print(f"Average Speed: {stats['docs']/total_time:.1f} documents/second")
+    print("\n✓ All indices built successfully!")
+    print("\nYou can now run: python app.py")
+    print("="*70 + "\n")
+    
+    return True
+
+
 if __name__ == "__main__":
-    success = main()
+    success = main(int(sys.argv[1]) if len(sys.argv) > 1 else BUILD_WORKERS)
     sys.exit(0 if success else 1)
\ No newline at end of file
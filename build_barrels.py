@@ -4,16 +4,206 @@ import time
 from collections import defaultdict
 
 # Configuration
-from config import OUTPUT_DIR
+from config import (
+    OUTPUT_DIR, COMPRESS_POSTINGS, STORE_POSITIONS, DOC_LENGTHS_PATH, BM25_K1, BM25_B
+)
+from VeridiaCore.postings import (
+    IndexFormat, FORMAT_COMPRESSED, FLAG_FREQS, FLAG_BLOCK_MAX, FLAG_POSITIONS, BLOCK_SIZE,
+    SLOT, SLOT_SIZE, encode_posting_list, encode_positions, load_doc_lengths, bm25_tf_weights
+)
 
 # Configuration
 VERIDIA_CORE_DIR = OUTPUT_DIR
 INPUT_INVERTED_TXT = os.path.join(VERIDIA_CORE_DIR, 'inverted_index.txt')
-OUTPUT_OFFSETS_BIN = os.path.join(VERIDIA_CORE_DIR, 'word_offsets_barrels.bin')
-OUTPUT_BARRELS_INFO = os.path.join(VERIDIA_CORE_DIR, 'barrels_info.txt')
 
 NUM_BARRELS = 10  # Configurable number of barrels
 
+def parse_postings(field):
+    """
+    Parse the postings column of inverted_index.txt.
+    Accepts 'doc doc ...' (legacy), 'doc:tf doc:tf ...' and 'doc:tf:pos,pos ...'.
+    Returns (doc_ids, freqs, positions); freqs and positions are None when
+    the layout does not carry them.
+    """
+    entries = field.split()
+    if not entries or ':' not in entries[0]:
+        return [int(d) for d in entries], None, None
+    doc_ids = []
+    freqs = []
+    positions = [] if entries[0].count(':') == 2 else None
+    for entry in entries:
+        parts = entry.split(':')
+        doc_ids.append(int(parts[0]))
+        freqs.append(int(parts[1]))
+        if positions is not None:
+            positions.append([int(p) for p in parts[2].split(',')])
+    return doc_ids, freqs, positions
+
+class BarrelWriter:
+    """
+    Writes posting lists, in ascending word ID order, into the barrels (and
+    positions files) of out_dir, then the offsets maps and the info report.
+    """
+    
+    def __init__(self, out_dir=VERIDIA_CORE_DIR, doc_lengths_path=DOC_LENGTHS_PATH,
+                 store_positions=STORE_POSITIONS):
+        self.out_dir = out_dir
+        self.store_positions = store_positions
+        
+        # Compressed barrels carry a format header in the dense offsets file
+        if COMPRESS_POSTINGS:
+            self.index_format = IndexFormat(FORMAT_COMPRESSED, 0, BLOCK_SIZE, BM25_K1, BM25_B)
+        else:
+            self.index_format = IndexFormat()
+        
+        # Per-term / per-block BM25 upper bounds for top-k (block-max WAND) pruning
+        self.doc_lengths, _, self.avg_doc_len = load_doc_lengths(doc_lengths_path)
+        if self.index_format.compressed and self.doc_lengths is not None:
+            self.index_format.flags |= FLAG_BLOCK_MAX
+        print(f"  Posting format: v{self.index_format.version} "
+              f"({'delta+varint blocks' if self.index_format.compressed else 'raw uint32'})")
+        
+        # Prepare file handles for barrels (and their positions files)
+        self.barrel_files = {}
+        self.positions_files = {}
+        for i in range(NUM_BARRELS):
+            path = os.path.join(out_dir, f"barrel_{i}.bin")
+            self.barrel_files[i] = open(path, 'wb')
+        
+        # Track offsets: WordID -> (BarrelID, Offset, Count)
+        self.word_offsets = {}
+        
+        self.word_count = 0
+        self.total_postings = 0
+    
+    def add(self, word_id, doc_ids, freqs=None, positions=None, flat_positions=False):
+        """
+        Append one posting list: ascending doc_ids, their term frequencies
+        and, per doc, its ascending token positions (freqs and positions
+        may be None when the source does not carry them). With
+        flat_positions, positions is one list of every doc's positions back
+        to back, split by freqs.
+        """
+        index_format = self.index_format
+        count = len(doc_ids)
+        
+        # Term frequencies (and positions) are stored when the inverted index carries them
+        if self.word_count == 0 and freqs is not None and index_format.compressed:
+            index_format.flags |= FLAG_FREQS
+            if positions is not None and self.store_positions:
+                index_format.flags |= FLAG_POSITIONS
+                for i in range(NUM_BARRELS):
+                    path = os.path.join(self.out_dir, f"positions_{i}.bin")
+                    self.positions_files[i] = open(path, 'wb')
+        if not index_format.has_freqs:
+            freqs = None
+        
+        # Key Logic: Determine Barrel ID
+        # Simple modulo distribution ensures determinism and even spread
+        barrel_id = word_id % NUM_BARRELS
+        
+        # Get current offset in that barrel
+        bf = self.barrel_files[barrel_id]
+        offset = bf.tell()
+        
+        # Write DocIDs to barrel
+        # v1: 4 bytes unsigned int per DocID
+        # v2: [term max] [positions offset] + block directory + delta/varint encoded gaps (+ tf)
+        if index_format.compressed:
+            weights = None
+            if index_format.has_block_max:
+                weights = bm25_tf_weights(doc_ids, freqs, self.doc_lengths, self.avg_doc_len,
+                                          index_format.k1, index_format.b)
+            positions_offset = positions_nbytes = None
+            if index_format.has_positions:
+                pf = self.positions_files[barrel_id]
+                positions_offset = pf.tell()
+                pos_data, positions_nbytes = encode_positions(positions, index_format.block_size,
+                                                              freqs if flat_positions else None)
+                pf.write(pos_data)
+            data = encode_posting_list(doc_ids, index_format.block_size, freqs, weights,
+                                       positions_offset, positions_nbytes)
+        else:
+            data = struct.pack(f'<{count}I', *doc_ids)
+        bf.write(data)
+        
+        # Store metadata
+        self.word_offsets[word_id] = (barrel_id, offset, count)
+        
+        self.word_count += 1
+        self.total_postings += count
+        
+        if self.word_count % 10000 == 0:
+            print(f"Processed {self.word_count} words...", end='\r')
+    
+    def close(self):
+        """Close the barrels and write the offsets maps"""
+        index_format = self.index_format
+        word_offsets = self.word_offsets
+        
+        # Close barrel files
+        for f_obj in list(self.barrel_files.values()) + list(self.positions_files.values()):
+            f_obj.close()
+            
+        print(f"\nBarrels created. Writing offsets map...")
+        
+        # Write Offsets Map (Binary)
+        # Format: WordID (4B) | BarrelID (4B) | Offset (8B) | Count (4B) = 20 Bytes
+        offsets_bin = os.path.join(self.out_dir, 'word_offsets_barrels.bin')
+        with open(offsets_bin, 'wb') as f_out:
+            # Sort by WordID for cleaner structure (optional but good)
+            sorted_ids = sorted(word_offsets.keys())
+            for wid in sorted_ids:
+                bid, off, cnt = word_offsets[wid]
+                f_out.write(struct.pack('<IIQI', wid, bid, off, cnt))
+                
+        # Write Info File
+        with open(os.path.join(self.out_dir, 'barrels_info.txt'), 'w', encoding='utf-8') as f_info:
+            f_info.write(f"Barrels Implementation Report\n")
+            f_info.write(f"============================\n")
+            f_info.write(f"Total Words: {self.word_count}\n")
+            f_info.write(f"Total Postings: {self.total_postings}\n")
+            f_info.write(f"Number of Barrels: {NUM_BARRELS}\n")
+            f_info.write(f"Sharding Strategy: WordID % {NUM_BARRELS}\n")
+            f_info.write(f"Binary Format for Offsets: WordID(4)|BarrelID(4)|Offset(8)|Count(4)\n")
+            f_info.write(f"Posting Format Version: {index_format.version}\n")
+            if index_format.compressed:
+                f_info.write(f"Posting Compression: delta + varint, {index_format.block_size} postings/block\n")
+                f_info.write(f"Term Frequencies: {'yes' if index_format.has_freqs else 'no'}\n")
+                if index_format.has_block_max:
+                    f_info.write(f"Block-Max Scores: BM25 k1={index_format.k1}, b={index_format.b}\n")
+                f_info.write(f"Positions: {'yes (positions_N.bin)' if index_format.has_positions else 'no'}\n")
+            f_info.write(f"Document Frequency: posting count per word in word_offsets_dense.bin\n")
+            f_info.write(f"Generated Files:\n")
+            for i in range(NUM_BARRELS):
+                 size = os.path.getsize(os.path.join(self.out_dir, f"barrel_{i}.bin"))
+                 f_info.write(f" - barrel_{i}.bin: {size} bytes\n")
+            f_info.write(f" - word_offsets_barrels.bin: {os.path.getsize(offsets_bin)} bytes\n")
+
+        print(f"\n[4/4] Generating Zero-Latency Dense Index...")
+        
+        # Logic for dense index generation
+        NEW_OFFSETS = os.path.join(self.out_dir, 'word_offsets_dense.bin')
+        
+        if word_offsets:
+            max_id = max(word_offsets.keys())
+            # Each slot: BarrelID(4) + Off(8) + Cnt(4) = 16 bytes
+            # Compressed formats reserve slot 0 for the format header
+            header_slots = index_format.header_slots
+            array_size = (max_id + 1 + header_slots) * SLOT_SIZE
+            buffer = bytearray(array_size)
+            if header_slots:
+                buffer[:SLOT_SIZE] = index_format.pack_header()
+            
+            for wid, (bid, off, cnt) in word_offsets.items():
+                if wid <= max_id:
+                    SLOT.pack_into(buffer, (wid + header_slots) * SLOT_SIZE, bid, off, cnt)
+                    
+            with open(NEW_OFFSETS, 'wb') as f:
+                f.write(buffer)
+            print(f"  ✓ Created {NEW_OFFSETS} ({array_size/1024/1024:.1f} MB)")
+
+
 def build_barrels():
     print(f"Building {NUM_BARRELS} barrels from {INPUT_INVERTED_TXT}...")
     start_time = time.time()
@@ -21,99 +211,17 @@ def build_barrels():
     if not os.path.exists(INPUT_INVERTED_TXT):
         print(f"Error: {INPUT_INVERTED_TXT} not found.")
         return
-
-    # Prepare file handles for barrels
-    barrel_files = {}
-    for i in range(NUM_BARRELS):
-        path = os.path.join(VERIDIA_CORE_DIR, f"barrel_{i}.bin")
-        barrel_files[i] = open(path, 'wb')
-        
-    # Track offsets: WordID -> (BarrelID, Offset, Count)
-    word_offsets = {}
-    
-    word_count = 0
-    total_postings = 0
     
+    writer = BarrelWriter()
     with open(INPUT_INVERTED_TXT, 'r', encoding='utf-8') as f:
         for line in f:
             parts = line.strip().split('\t')
             if len(parts) < 2:
                 continue
-                
-            word_id = int(parts[0])
-            doc_ids = [int(d) for d in parts[1].split()]
-            count = len(doc_ids)
-            
-            # Key Logic: Determine Barrel ID
-            # Simple modulo distribution ensures determinism and even spread
-            barrel_id = word_id % NUM_BARRELS
-            
-            # Get current offset in that barrel
-            bf = barrel_files[barrel_id]
-            offset = bf.tell()
-            
-            # Write DocIDs to barrel (Binary: 4 bytes unsigned int per DocID)
-            # packing 'I' * count
-            data = struct.pack(f'<{count}I', *doc_ids)
-            bf.write(data)
             
-            # Store metadata
-            word_offsets[word_id] = (barrel_id, offset, count)
-            
-            word_count += 1
-            total_postings += count
-            
-            if word_count % 10000 == 0:
-                print(f"Processed {word_count} words...", end='\r')
-
-    # Close barrel files
-    for f_obj in barrel_files.values():
-        f_obj.close()
-        
-    print(f"\nBarrels created. Writing offsets map...")
-    
-    # Write Offsets Map (Binary)
-    # Format: WordID (4B) | BarrelID (4B) | Offset (8B) | Count (4B) = 20 Bytes
-    with open(OUTPUT_OFFSETS_BIN, 'wb') as f_out:
-        # Sort by WordID for cleaner structure (optional but good)
-        sorted_ids = sorted(word_offsets.keys())
-        for wid in sorted_ids:
-            bid, off, cnt = word_offsets[wid]
-            f_out.write(struct.pack('<IIQI', wid, bid, off, cnt))
-            
-    # Write Info File
-    with open(OUTPUT_BARRELS_INFO, 'w', encoding='utf-8') as f_info:
-        f_info.write(f"Barrels Implementation Report\n")
-        f_info.write(f"============================\n")
-        f_info.write(f"Total Words: {word_count}\n")
-        f_info.write(f"Total Postings: {total_postings}\n")
-        f_info.write(f"Number of Barrels: {NUM_BARRELS}\n")
-        f_info.write(f"Sharding Strategy: WordID % {NUM_BARRELS}\n")
-        f_info.write(f"Binary Format for Offsets: WordID(4)|BarrelID(4)|Offset(8)|Count(4)\n")
-        f_info.write(f"Generated Files:\n")
-        for i in range(NUM_BARRELS):
-             size = os.path.getsize(os.path.join(VERIDIA_CORE_DIR, f"barrel_{i}.bin"))
-             f_info.write(f" - barrel_{i}.bin: {size} bytes\n")
-        f_info.write(f" - word_offsets_barrels.bin: {os.path.getsize(OUTPUT_OFFSETS_BIN)} bytes\n")
-
-    print(f"\n[4/4] Generating Zero-Latency Dense Index...")
-    
-    # Logic for dense index generation
-    NEW_OFFSETS = os.path.join(VERIDIA_CORE_DIR, 'word_offsets_dense.bin')
-    
-    if word_offsets:
-        max_id = max(word_offsets.keys())
-        # Each slot: BarrelID(4) + Off(8) + Cnt(4) = 16 bytes
-        array_size = (max_id + 1) * 16
-        buffer = bytearray(array_size)
-        
-        for wid, (bid, off, cnt) in word_offsets.items():
-            if wid <= max_id:
-                struct.pack_into('<IQI', buffer, wid * 16, bid, off, cnt)
-                
-        with open(NEW_OFFSETS, 'wb') as f:
-            f.write(buffer)
-        print(f"  ✓ Created {NEW_OFFSETS} ({array_size/1024/1024:.1f} MB)")
+            doc_ids, freqs, positions = parse_postings(parts[1])
+            writer.add(int(parts[0]), doc_ids, freqs, positions)
+    writer.close()
 
     elapsed = time.time() - start_time
     print(f"Done in {elapsed:.2f} seconds.")
@@ -0,0 +1,55 @@
+"""
+Veridia Search Engine - Document Store Builder
+Writes the block-compressed document store (see VeridiaCore/docstore.py)
+from dataset.jsonl, numbering documents the way the index builds do
+"""
+import os
+import json
+import time
+import shutil
+from json_parser import parse_document
+from build_pipeline import dataset_lines
+from VeridiaCore.docstore import DOCSTORE_FILES, DocStoreWriter, move_docstore
+from config import OUTPUT_DIR, JSON_DATASET_PATH, MAX_DOCUMENTS
+
+
+def build_docstore(dataset_path=JSON_DATASET_PATH, directory=OUTPUT_DIR, limit=MAX_DOCUMENTS):
+    print(f"Building document store from {dataset_path}...")
+    if not os.path.exists(dataset_path):
+        print(f"ERROR: JSON file not found at {dataset_path}")
+        return False
+    start_time = time.time()
+    # Written aside and moved in at the end: a running server may have the old store mapped
+    tmp_dir = os.path.join(directory, "docstore.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    writer = DocStoreWriter(tmp_dir)
+    doc_id = 0
+    with open(dataset_path, 'rb') as f:
+        for offset, line in dataset_lines(f):
+            if doc_id >= limit:
+                break
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line.decode('utf-8'))
+                parse_document(data)
+            except ValueError:
+                continue
+            except Exception as e:
+                print(f"Warning: Error processing line at byte {offset}: {e}")
+                continue
+            doc_id += 1
+            writer.add(doc_id, data)
+    writer.close()
+    move_docstore(tmp_dir, directory)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in DOCSTORE_FILES)
+    print(f"[OK] Document store built: {doc_id:,} documents, {size / 1024 / 1024:.1f} MB "
+          f"(dataset {os.path.getsize(dataset_path) / 1024 / 1024:.1f} MB) in {time.time() - start_time:.2f}s")
+    return True
+
+
+if __name__ == '__main__':
+    build_docstore()
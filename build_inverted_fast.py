@@ -4,13 +4,45 @@ Builds inverted index from forward index efficiently
 """
 import os
 import time
-from collections import defaultdict
+from array import array
+from collections import defaultdict, Counter
 from config import (
-    FORWARD_INDEX_PATH, INVERTED_INDEX_PATH, 
-    BATCH_SIZE, PROGRESS_INTERVAL
+    FORWARD_INDEX_PATH, INVERTED_INDEX_PATH, DOC_LENGTHS_PATH,
+    BATCH_SIZE, PROGRESS_INTERVAL, STORE_POSITIONS
 )
 
 
+def add_document_postings(inverted_index, doc_id, word_ids, store_positions=STORE_POSITIONS):
+    """
+    Invert one forward-index document into inverted_index (word_id -> {doc_id: entry}).
+    The entry is the term frequency, or 'tf:p1,p2,...' with the token
+    positions of the word when positions are stored.
+    """
+    if not store_positions:
+        for word_id, tf in Counter(word_ids).items():
+            inverted_index[word_id][doc_id] = tf
+        return
+    occurrences = defaultdict(list)
+    for position, word_id in enumerate(word_ids):
+        occurrences[word_id].append(str(position))
+    for word_id, positions in occurrences.items():
+        inverted_index[word_id][doc_id] = f"{len(positions)}:{','.join(positions)}"
+
+
+def write_doc_lengths(doc_lengths, path=DOC_LENGTHS_PATH):
+    """
+    Write document lengths (in tokens) as a dense uint32 array indexed by doc_id.
+    Used for BM25 length normalization.
+    """
+    if not doc_lengths:
+        return
+    lengths = array('I', bytes(4 * (max(doc_lengths) + 1)))
+    for doc_id, length in doc_lengths.items():
+        lengths[doc_id] = length
+    with open(path, 'wb') as f:
+        lengths.tofile(f)
+
+
 def build_inverted_index_optimized():
     """
     Build inverted index using memory-efficient streaming approach.
@@ -26,8 +58,9 @@ def build_inverted_index_optimized():
         print("Please run build_index_fast.py first!")
         return
     
-    # Use defaultdict for automatic list creation
-    inverted_index = defaultdict(set)
+    # word_id -> {doc_id: term frequency [and positions]}
+    inverted_index = defaultdict(dict)
+    doc_lengths = {}
     
     print("\n[1/2] Reading forward index and inverting...")
     
@@ -44,10 +77,9 @@ def build_inverted_index_optimized():
             doc_id = parts[0]
             word_ids = parts[1].split()
             
-            # Add doc_id to each word's posting list
-            # Using set to avoid duplicates
-            for word_id in set(word_ids):  # set removes duplicates within document
-                inverted_index[word_id].add(doc_id)
+            # Add doc_id to each word's posting list with its term frequency
+            add_document_postings(inverted_index, doc_id, word_ids)
+            doc_lengths[int(doc_id)] = len(word_ids)
             
             if line_count % PROGRESS_INTERVAL == 0:
                 elapsed = time.time() - start_time
@@ -59,6 +91,8 @@ def build_inverted_index_optimized():
     print(f"  Total unique words: {len(inverted_index):,}")
     
     # Write inverted index
+    # Format: word_id<TAB>doc_id:tf doc_id:tf ...
+    # (doc_id:tf:pos,pos,... when STORE_POSITIONS is enabled)
     with open(INVERTED_INDEX_PATH, 'w', encoding='utf-8') as f:
         buffer = []
         
@@ -66,8 +100,10 @@ def build_inverted_index_optimized():
         sorted_word_ids = sorted(inverted_index.keys(), key=lambda x: int(x))
         
         for i, word_id in enumerate(sorted_word_ids, 1):
-            doc_ids = sorted(inverted_index[word_id], key=lambda x: int(x))
-            buffer.append(f"{word_id}\t{' '.join(doc_ids)}\n")
+            postings = inverted_index[word_id]
+            doc_ids = sorted(postings, key=lambda x: int(x))
+            entries = ' '.join(f"{d}:{postings[d]}" for d in doc_ids)
+            buffer.append(f"{word_id}\t{entries}\n")
             
             if len(buffer) >= BATCH_SIZE:
                 f.writelines(buffer)
@@ -80,6 +116,9 @@ def build_inverted_index_optimized():
         if buffer:
             f.writelines(buffer)
     
+    write_doc_lengths(doc_lengths)
+    print(f"  Document lengths written to {DOC_LENGTHS_PATH}")
+    
     end_time = time.time()
     elapsed = end_time - start_time
     
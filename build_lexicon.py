@@ -0,0 +1,63 @@
+"""
+Veridia Search Engine - Lexicon File Builder
+Writes lexicon.bin (see VeridiaCore/lexicon.py) from lexicon.txt, or lexicon.db,
+and the barrels' word_offsets_dense.bin
+"""
+import os
+import time
+import sqlite3
+from config import OUTPUT_DIR
+from VeridiaCore.postings import IndexFormat, SLOT, SLOT_SIZE
+from VeridiaCore.lexicon import LEXICON_FILE, write_lexicon
+
+
+def read_lexicon(directory=OUTPUT_DIR):
+    """{word: word_id} from lexicon.txt, else from lexicon.db"""
+    lexicon = {}
+    txt_path = os.path.join(directory, "lexicon.txt")
+    db_path = os.path.join(directory, "lexicon.db")
+    if os.path.exists(txt_path):
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split('\t')
+                if len(parts) == 2:
+                    lexicon[parts[0]] = int(parts[1])
+    elif os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            lexicon.update(conn.execute("SELECT word, id FROM lexicon"))
+        finally:
+            conn.close()
+    return lexicon
+
+
+def read_locations(directory=OUTPUT_DIR):
+    """{word_id: (barrel_id, offset, count)} of every word in word_offsets_dense.bin"""
+    with open(os.path.join(directory, "word_offsets_dense.bin"), 'rb') as f:
+        data = f.read()
+    header_slots = IndexFormat.from_offsets(data).header_slots
+    locations = {}
+    for word_id in range(len(data) // SLOT_SIZE - header_slots):
+        location = SLOT.unpack_from(data, (word_id + header_slots) * SLOT_SIZE)
+        if location[2]:
+            locations[word_id] = location
+    return locations
+
+
+def build_lexicon(directory=OUTPUT_DIR):
+    print(f"Building lexicon file in {directory}...")
+    start_time = time.time()
+    lexicon = read_lexicon(directory)
+    if not lexicon:
+        print("ERROR: No lexicon.txt or lexicon.db found. Build the index first!")
+        return False
+    path = os.path.join(directory, LEXICON_FILE)
+    write_lexicon(path, lexicon, read_locations(directory))
+    print(f"[OK] Lexicon file built: {len(lexicon):,} words, "
+          f"{os.path.getsize(path) / 1024 / 1024:.1f} MB in {time.time() - start_time:.2f}s")
+    return True
+
+
+if __name__ == '__main__':
+    import sys
+    build_lexicon(sys.argv[1] if len(sys.argv) > 1 else OUTPUT_DIR)
@@ -0,0 +1,33 @@
+"""
+Veridia Search Engine - Metadata Table Builder
+Writes document_metadata.bin (see VeridiaCore/metadata.py) from
+document_metadata.txt, in the format of either build
+"""
+import os
+import sys
+import time
+from VeridiaCore.metadata import read_metadata_text, write_metadata_table
+from config import METADATA_PATH, METADATA_BIN_PATH
+
+
+def build_metadata(text_path=METADATA_PATH, table_path=METADATA_BIN_PATH):
+    print(f"Building metadata table from {text_path}...")
+    if not os.path.exists(text_path):
+        print(f"ERROR: {text_path} not found. Build the index first!")
+        return False
+    start_time = time.time()
+    # Later lines win, as when the text file is loaded into a dict
+    rows = {row[0]: row for row in read_metadata_text(text_path)}
+    write_metadata_table(table_path, rows.values())
+    print(f"[OK] Metadata table built: {len(rows):,} documents, "
+          f"{os.path.getsize(table_path) / 1024 / 1024:.1f} MB in {time.time() - start_time:.2f}s")
+    return True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        directory = sys.argv[1]
+        build_metadata(os.path.join(directory, "document_metadata.txt"),
+                       os.path.join(directory, "document_metadata.bin"))
+    else:
+        build_metadata()
@@ -0,0 +1,266 @@
+"""
+Veridia Search Engine - Parallel Index Builder
+Builds lexicon, forward index, metadata, document lengths and barrels on all
+cores; the output is identical to build_index_fast + build_spimi
+"""
+import io
+import os
+import json
+import time
+import pickle
+import shutil
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from json_parser import parse_document_line
+from text_processor import clean_and_tokenize
+from build_barrels import BarrelWriter
+from build_spimi import SpimiIndexer, merge_runs, write_dense_lengths
+from config import (
+    OUTPUT_DIR, JSON_DATASET_PATH, LEXICON_PATH, FORWARD_INDEX_PATH, METADATA_PATH,
+    DOC_LENGTHS_PATH, MAX_DOCUMENTS, STORE_POSITIONS, BUILD_WORKERS, BUILD_CHUNK_BYTES,
+    SPIMI_MEMORY_BYTES
+)
+
+# Per-chunk intermediate files, deleted at the end
+PARTS_DIR = "build_parts"
+
+
+def chunk_bounds(path, chunk_bytes):
+    """[(start, end)] byte ranges of path, each ending just after a newline"""
+    size = os.path.getsize(path)
+    bounds = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+# ============= WORKERS =============
+
+def tokenize_chunk(args):
+    """
+    Phase 1: parse and tokenize the documents of one byte range against a
+    local lexicon. Writes [(local doc number, title, authors, local word
+    ids)] to part_path and returns (documents parsed, local words in order
+    of first occurrence, local doc number of each word's first occurrence).
+    Local doc numbers count every parsed document from 1, like the serial
+    build's doc IDs, so empty documents still take their number.
+    """
+    dataset_path, start, end, part_path = args
+    with open(dataset_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    lexicon = {}
+    first_docs = array('I')
+    docs = []
+    count = 0
+    # Universal newlines, exactly like the serial build's text-mode reader
+    for line in io.StringIO(data.decode('utf-8'), newline=None):
+        if not line.strip():
+            continue
+        try:
+            title, full_text, authors = parse_document_line(line)
+        except json.JSONDecodeError:
+            continue
+        except Exception as e:
+            print(f"Warning: Error processing line at byte {start}+: {e}")
+            continue
+        count += 1
+
+        words = clean_and_tokenize(full_text)
+        if not words:
+            continue
+        word_ids = array('I')
+        for word in words:
+            wid = lexicon.get(word)
+            if wid is None:
+                wid = lexicon[word] = len(lexicon)
+                first_docs.append(count)
+            word_ids.append(wid)
+        docs.append((count, title, authors, word_ids))
+
+    with open(part_path, 'wb') as f:
+        pickle.dump(docs, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return count, list(lexicon), first_docs
+
+
+def invert_chunk(args):
+    """
+    Phase 2: rewrite one chunk with global doc and word IDs. Writes its
+    forward index and metadata next to part_path and its postings as SPIMI
+    runs. Returns (run paths, length of each of its docs in doc ID order).
+    """
+    part_path, doc_offset, max_local, remap, store_positions, memory_bytes = args
+    with open(part_path, 'rb') as f:
+        docs = pickle.load(f)
+    os.remove(part_path)
+    names = [str(wid) for wid in remap]
+
+    indexer = SpimiIndexer(os.path.dirname(part_path), memory_bytes, store_positions,
+                           run_prefix=os.path.basename(part_path))
+    doc_lengths = array('I', bytes(4 * max_local))  # documents without words stay 0
+    with open(part_path + ".fwd", 'w', encoding='utf-8') as f_fwd, \
+         open(part_path + ".meta", 'w', encoding='utf-8') as f_meta:
+        forward_buffer = []
+        metadata_buffer = []
+        for local, title, authors, local_ids in docs:
+            if local > max_local:
+                break
+            doc_id = doc_offset + local
+            forward_buffer.append(f"{doc_id}\t{' '.join([names[wid] for wid in local_ids])}\n")
+            metadata_buffer.append(f"{doc_id}|{title}|{authors}\n")
+            indexer.add(doc_id, [remap[wid] for wid in local_ids])
+            doc_lengths[local - 1] = len(local_ids)
+        f_fwd.writelines(forward_buffer)
+        f_meta.writelines(metadata_buffer)
+    indexer.flush()
+    return indexer.runs, doc_lengths
+
+
+# ============= MERGING =============
+
+def _concatenate(paths, output_path):
+    with open(output_path, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, 16 * 1024 * 1024)
+
+
+def build_indices_parallel(workers=BUILD_WORKERS, chunk_bytes=BUILD_CHUNK_BYTES, limit=MAX_DOCUMENTS,
+                           memory_bytes=SPIMI_MEMORY_BYTES):
+    """
+    Build the text indices on `workers` processes:
+
+    1. dataset.jsonl is split into newline-aligned byte ranges; each worker
+       tokenizes one against a local lexicon.
+    2. The local lexicons are merged in chunk order, which hands out global
+       word IDs in the same first-occurrence order as the serial build.
+    3. Each worker remaps its chunk to global IDs and inverts it into SPIMI
+       runs; the forward index and metadata of the chunks are concatenated
+       and the runs are merged by word ID into the barrels.
+
+    Returns the same stats as build_indices_optimized.
+    """
+    print("=" * 60)
+    print(f"VERIDIA SEARCH ENGINE - PARALLEL INDEX BUILDER ({workers} workers)")
+    print("=" * 60)
+
+    start_time = time.time()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    parts_dir = os.path.join(OUTPUT_DIR, PARTS_DIR)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+
+    bounds = chunk_bounds(JSON_DATASET_PATH, chunk_bytes)
+    print(f"\n[1/4] Tokenizing {len(bounds)} chunks of {JSON_DATASET_PATH}...")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Submitted a few at a time, so chunks past MAX_DOCUMENTS are never read
+            chunks = []  # (part path, documents parsed, words, first_docs)
+            pending = deque()
+            queued = iter(enumerate(bounds))
+
+            def submit_next():
+                for i, (start, end) in queued:
+                    part_path = os.path.join(parts_dir, f"chunk_{i:05d}")
+                    pending.append((part_path, pool.submit(tokenize_chunk,
+                                                           (JSON_DATASET_PATH, start, end, part_path))))
+                    return
+
+            for _ in range(2 * workers):
+                submit_next()
+            parsed = 0
+            while pending:
+                part_path, future = pending.popleft()
+                count, words, first_docs = future.result()
+                chunks.append((part_path, count, words, first_docs))
+                parsed += count
+                print(f"  Tokenized: {len(chunks):,} / {len(bounds):,} chunks | "
+                      f"{parsed:,} docs | {parsed / (time.time() - start_time):.0f} docs/sec")
+                if parsed >= limit:
+                    for _, rest in pending:
+                        rest.cancel()
+                    break
+                submit_next()
+
+            print(f"\n[2/4] Merging {len(chunks)} chunk lexicons...")
+            lexicon = {}
+            jobs = []
+            doc_offset = 0
+            for part_path, count, words, first_docs in chunks:
+                max_local = min(count, limit - doc_offset)
+                remap = array('I')
+                # Words first seen past the limit were never indexed serially
+                for word in words[:bisect_right(first_docs, max_local)]:
+                    wid = lexicon.get(word)
+                    if wid is None:
+                        wid = lexicon[word] = len(lexicon)
+                    remap.append(wid)
+                jobs.append((part_path, doc_offset, max_local, remap, STORE_POSITIONS,
+                             memory_bytes // workers))
+                doc_offset += max_local
+                if doc_offset >= limit:
+                    break
+
+            print(f"\n[3/4] Inverting chunks with global IDs...")
+            runs = []
+            doc_lengths = array('I', [0])  # indexed by doc_id, which starts at 1
+            for chunk_runs, chunk_lengths in pool.map(invert_chunk, jobs):
+                runs.extend(chunk_runs)
+                doc_lengths.extend(chunk_lengths)
+
+        print(f"\n[4/4] Merging chunk outputs...")
+        part_paths = [job[0] for job in jobs]
+        _concatenate([p + ".fwd" for p in part_paths], FORWARD_INDEX_PATH)
+        _concatenate([p + ".meta" for p in part_paths], METADATA_PATH)
+        with open(LEXICON_PATH, 'w', encoding='utf-8') as f_lex:
+            f_lex.writelines(f"{word}\t{word_id}\n" for word, word_id in lexicon.items())
+        # Like the serial build, the lengths file ends at the last doc with words
+        while doc_lengths and doc_lengths[-1] == 0:
+            doc_lengths.pop()
+        if doc_lengths:
+            write_dense_lengths(doc_lengths, DOC_LENGTHS_PATH)
+        print(f"  Merging {len(runs)} runs into barrels...")
+        writer = BarrelWriter(OUTPUT_DIR, DOC_LENGTHS_PATH)
+        unique_words = merge_runs(runs, writer)
+        writer.close()
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    elapsed = time.time() - start_time
+    total_docs = sum(1 for length in doc_lengths if length)
+    total_words = sum(doc_lengths)
+
+    print("\n" + "=" * 60)
+    print("PARALLEL INDEX BUILD COMPLETE!")
+    print("=" * 60)
+    print(f"✓ Total Documents: {total_docs:,}")
+    print(f"✓ Unique Words: {len(lexicon):,} ({unique_words:,} in the barrels)")
+    print(f"✓ Total Word Instances: {total_words:,}")
+    print(f"✓ Time Elapsed: {elapsed:.2f} seconds")
+    print(f"✓ Processing Rate: {total_docs/elapsed:.1f} docs/sec")
+    print("=" * 60)
+
+    return {
+        'docs': total_docs,
+        'words': len(lexicon),
+        'time': elapsed
+    }
+
+
+if __name__ == "__main__":
+    try:
+        build_indices_parallel()
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,437 @@
+"""
+Veridia Search Engine - One-Pass Build Pipeline
+Reads dataset.jsonl once and writes every file the search engine loads:
+lexicon.bin, barrels, offsets maps, doc_offsets.bin, metadata (text and
+table), lengths, the document store and, given word vectors, the synonym
+table and vector index
+"""
+import os
+import sys
+import json
+import time
+import shutil
+from array import array
+from itertools import islice
+from json_parser import parse_document
+from text_processor import clean_and_tokenize
+from build_barrels import BarrelWriter
+from build_spimi import SpimiIndexer, write_dense_lengths
+from VeridiaCore.lexicon import write_lexicon
+from VeridiaCore.docstore import DOCSTORE_FILES, DocStoreWriter, move_docstore, write_results
+from VeridiaCore.metadata import DEFAULT_FILENAME, MetadataTable, write_metadata_table
+from VeridiaCore.synonyms import SYNONYMS_FILE, write_synonyms
+from VeridiaCore.vector_model import VectorModel
+from config import (
+    OUTPUT_DIR, JSON_DATASET_PATH, METADATA_PATH, METADATA_BIN_PATH, DOC_LENGTHS_PATH, LEXICON_BIN_PATH,
+    DOC_OFFSETS_PATH, MAX_DOCUMENTS, PROGRESS_INTERVAL, STORE_POSITIONS, SPIMI_MEMORY_BYTES,
+    BUILD_CHECKPOINT_DOCS
+)
+
+# Build state kept between checkpoints; removed once the build completes
+CHECKPOINT_DIR = "build_checkpoint"
+
+
+class StageTimer:
+    """Wall time spent per named stage, printed as a table at the end"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self, total):
+        print("\nStage timings:")
+        for stage, seconds in self.seconds.items():
+            print(f"  {stage:<22} {seconds:8.2f}s  {100 * seconds / total:5.1f}%")
+
+
+def dataset_lines(f, offset=0):
+    """
+    (byte offset, line) of every line of a binary file from offset on,
+    split the way the text-mode builds split it (on \\n, \\r\\n and a lone
+    \\r), so documents get the same doc IDs
+    """
+    f.seek(offset)
+    for raw in f:
+        if b'\r' not in raw:
+            yield offset, raw
+        else:
+            part_offset = offset
+            for part in raw.splitlines(keepends=True):
+                yield part_offset, part
+                part_offset += len(part)
+        offset += len(raw)
+
+
+def document_filename(data):
+    """File name shown for a document: its own, or the one in a file:// url"""
+    filename = data.get('filename') or ''
+    if not filename and str(data.get('url', '')).startswith('file://'):
+        filename = data['url'][len('file://'):]
+    return filename
+
+
+def read_metadata_part(path):
+    """(doc_id, title, filename, authors) per line of a checkpoint's doc_id||title||filename||authors part"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            doc_id, title, rest = line.rstrip('\n').split('||', 2)
+            filename, _, authors = rest.rpartition('||')  # title and authors hold no '|'
+            yield int(doc_id), title, filename, authors
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class BuildCheckpoint:
+    """
+    Progress of a pipeline build, persisted so a crashed build can resume.
+
+    The state up to the last checkpoint lives in directory: the SPIMI run
+    files completed so far, append-only parts (lexicon words in ID order,
+    doc offsets, doc lengths, metadata lines, the document store files)
+    and checkpoint.json, which
+    records how much of each part, which runs and how many bytes of
+    dataset.jsonl it covers. checkpoint.json is replaced atomically after
+    everything it names is on disk, so the last one written is always
+    consistent; resume() cuts the parts back to it and drops newer runs.
+    """
+
+    MANIFEST = "checkpoint.json"
+
+    def __init__(self, directory, dataset_path, limit, store_positions):
+        self.directory = directory
+        self.run_dir = os.path.join(directory, "runs")
+        self.metadata_path = os.path.join(directory, "metadata.part")
+        self.lexicon_path = os.path.join(directory, "lexicon.words")
+        self.offsets_path = os.path.join(directory, "doc_offsets.part")
+        self.lengths_path = os.path.join(directory, "doc_lengths.part")
+        stat = os.stat(dataset_path)
+        # A checkpoint only applies to the same dataset and build settings
+        self.settings = {
+            "dataset_size": stat.st_size, "dataset_mtime": stat.st_mtime_ns,
+            "limit": limit, "store_positions": store_positions
+        }
+
+        self.lexicon = {}
+        self.doc_offsets = array('Q')       # index doc_id - 1
+        self.doc_lengths = array('I', [0])  # index doc_id, which starts at 1
+        self.runs = []
+        self.doc_id = 0
+        self.position = 0      # bytes of dataset.jsonl covered
+        self.complete = False  # the whole dataset (up to limit) is in the runs
+        self.saved_words = 0
+        self.saved_runs = 0
+
+    def start(self):
+        """Discard any previous checkpoint and start an empty build"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.run_dir)
+        self._open_parts('wb')
+
+    def resume(self):
+        """Load the last checkpoint; False if there is none usable"""
+        try:
+            with open(os.path.join(self.directory, self.MANIFEST), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            print("  [ERR] No checkpoint to resume from; starting a new build")
+            return False
+        if {k: manifest.get(k) for k in self.settings} != self.settings:
+            print("  [ERR] dataset.jsonl or the build settings changed since the checkpoint; "
+                  "starting a new build")
+            return False
+
+        doc_id = manifest["doc_id"]
+        parts = [(self.lexicon_path, manifest["lexicon_bytes"]), (self.offsets_path, 8 * doc_id),
+                 (self.lengths_path, 4 * doc_id), (self.metadata_path, manifest["metadata_bytes"])]
+        docstore_bytes = manifest.get("docstore_bytes", [])
+        parts += [(os.path.join(self.directory, name), nbytes)
+                  for name, nbytes in zip(DOCSTORE_FILES, docstore_bytes)]
+        runs = [os.path.join(self.run_dir, name) for name in manifest["runs"]]
+        if any(not os.path.exists(path) or os.path.getsize(path) < nbytes for path, nbytes in parts) \
+                or len(docstore_bytes) != len(DOCSTORE_FILES) or not all(map(os.path.exists, runs)):
+            print("  [ERR] Checkpoint files are missing or short; starting a new build")
+            return False
+
+        # Drop whatever was written after the checkpoint
+        for path, nbytes in parts:
+            os.truncate(path, nbytes)
+        for name in os.listdir(self.run_dir):
+            if name not in manifest["runs"]:
+                os.remove(os.path.join(self.run_dir, name))
+
+        with open(self.lexicon_path, 'r', encoding='utf-8') as f:
+            words = f.read().split('\n')[:-1]
+        self.lexicon = dict(zip(words, range(len(words))))
+        with open(self.offsets_path, 'rb') as f:
+            self.doc_offsets.fromfile(f, doc_id)
+        with open(self.lengths_path, 'rb') as f:
+            self.doc_lengths.fromfile(f, doc_id)
+        self.runs = runs
+        self.doc_id = doc_id
+        self.position = manifest["position"]
+        self.complete = manifest["complete"]
+        self.saved_words = len(self.lexicon)
+        self.saved_runs = len(runs)
+        self._open_parts('ab')
+        print(f"  [OK] Resuming from checkpoint: {doc_id:,} documents, byte {self.position:,} "
+              f"of {self.settings['dataset_size']:,}, {len(runs)} runs")
+        return True
+
+    def _open_parts(self, mode):
+        self.lexicon_file = open(self.lexicon_path, mode)
+        self.offsets_file = open(self.offsets_path, mode)
+        self.lengths_file = open(self.lengths_path, mode)
+        self.metadata = open(self.metadata_path, mode[0], encoding='utf-8')
+        self.docstore = DocStoreWriter(self.directory, append=mode == 'ab')
+
+    def save(self, runs, doc_id, position, complete=False):
+        """
+        Persist the state after doc_id, whose postings must all be in runs
+        (the indexer flushed), and position, the dataset offset to go on from
+        """
+        new_words = list(islice(self.lexicon, self.saved_words, None))
+        if new_words:
+            self.lexicon_file.write(('\n'.join(new_words) + '\n').encode('utf-8'))
+        saved_docs = self.offsets_file.tell() // 8
+        self.doc_offsets[saved_docs:].tofile(self.offsets_file)
+        self.doc_lengths[saved_docs + 1:].tofile(self.lengths_file)
+        for f in (self.lexicon_file, self.offsets_file, self.lengths_file, self.metadata):
+            _fsync(f)
+        self.docstore.flush()
+        for path in runs[self.saved_runs:]:
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+
+        manifest = dict(self.settings, doc_id=doc_id, position=position, complete=complete,
+                        lexicon_bytes=self.lexicon_file.tell(), metadata_bytes=self.metadata.tell(),
+                        docstore_bytes=self.docstore.sizes(),
+                        runs=[os.path.basename(path) for path in runs])
+        tmp_path = os.path.join(self.directory, self.MANIFEST + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+            _fsync(f)
+        os.replace(tmp_path, os.path.join(self.directory, self.MANIFEST))
+        self.saved_words = len(self.lexicon)
+        self.saved_runs = len(runs)
+
+    def close(self):
+        for f in (self.lexicon_file, self.offsets_file, self.lengths_file, self.metadata):
+            f.close()
+        self.docstore.close()
+
+    def remove(self):
+        """Delete the checkpoint once the build it covers has completed"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def build_pipeline(limit=MAX_DOCUMENTS, memory_bytes=SPIMI_MEMORY_BYTES, store_positions=STORE_POSITIONS,
+                   resume=False, checkpoint_docs=BUILD_CHECKPOINT_DOCS):
+    """
+    Build the whole index in one streaming pass over dataset.jsonl:
+
+    1. Each line is parsed and tokenized once. Its byte offset goes to
+       doc_offsets.bin, its title to the metadata, its fields to the
+       document store (see VeridiaCore/docstore.py), and its word IDs
+       (assigned in first-occurrence order, like build_index_fast) straight
+       into a SpimiIndexer, which spills sorted runs within memory_bytes.
+    2. The runs are merged into the barrels and offsets maps, and the
+       lexicon, with each word's barrel location, is written to lexicon.bin.
+
+    No lexicon.txt, forward_index.txt or inverted_index.txt is written.
+    Word and doc IDs, barrels and lengths are identical to build_all.py's.
+
+    Progress is checkpointed (see BuildCheckpoint) whenever a run is
+    spilled and at least every checkpoint_docs documents. With resume, a
+    build that died picks up at its last checkpoint instead of starting over.
+    """
+    print("=" * 60)
+    print("VERIDIA SEARCH ENGINE - ONE-PASS BUILD PIPELINE")
+    print("=" * 60)
+
+    start_time = time.time()
+    timer = StageTimer()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    checkpoint = BuildCheckpoint(os.path.join(OUTPUT_DIR, CHECKPOINT_DIR), JSON_DATASET_PATH,
+                                 limit, store_positions)
+    if not (resume and checkpoint.resume()):
+        checkpoint.start()
+    indexer = SpimiIndexer(checkpoint.run_dir, memory_bytes, store_positions)
+    indexer.runs = list(checkpoint.runs)
+
+    lexicon = checkpoint.lexicon
+    doc_offsets = checkpoint.doc_offsets
+    doc_lengths = checkpoint.doc_lengths
+    f_meta = checkpoint.metadata
+    docstore = checkpoint.docstore
+    metadata_buffer = []
+    doc_id = checkpoint.doc_id
+    position = checkpoint.position
+    resumed_docs = doc_id
+
+    try:
+        if not checkpoint.complete:
+            print(f"\n[1/3] Streaming {JSON_DATASET_PATH}...")
+            last_checkpoint = doc_id
+            with open(JSON_DATASET_PATH, 'rb') as f:
+                for offset, line in dataset_lines(f, position):
+                    if doc_id >= limit:
+                        break
+                    position = offset + len(line)
+                    if not line.strip():
+                        continue
+
+                    t0 = time.perf_counter()
+                    try:
+                        data = json.loads(line.decode('utf-8'))
+                        title, full_text, authors = parse_document(data)
+                    except ValueError:
+                        continue
+                    except Exception as e:
+                        print(f"Warning: Error processing line at byte {offset}: {e}")
+                        continue
+                    doc_id += 1
+                    doc_offsets.append(offset)
+                    t1 = time.perf_counter()
+                    docstore.add(doc_id, data)
+                    t2 = time.perf_counter()
+
+                    words = clean_and_tokenize(full_text)
+                    word_ids = list(map(lexicon.get, words))
+                    if None in word_ids:
+                        # New words, numbered in order of first occurrence
+                        for i, wid in enumerate(word_ids):
+                            if wid is None:
+                                wid = lexicon.get(words[i])
+                                if wid is None:
+                                    wid = lexicon[words[i]] = len(lexicon)
+                                word_ids[i] = wid
+                    t3 = time.perf_counter()
+
+                    doc_lengths.append(len(word_ids))
+                    runs = len(indexer.runs)
+                    if word_ids:
+                        clean_title = title.replace('|', '-').replace('\r', ' ')
+                        clean_authors = authors.replace('|', '-').replace('\r', ' ')
+                        filename = document_filename(data)
+                        metadata_buffer.append(f"{doc_id}||{clean_title}||{filename}||{clean_authors}\n")
+                        indexer.add(doc_id, word_ids)
+                    t4 = time.perf_counter()
+                    timer.add("parse", t1 - t0)
+                    timer.add("document store", t2 - t1)
+                    timer.add("tokenize + lexicon", t3 - t2)
+                    timer.add("invert", t4 - t3)
+
+                    # Checkpoint when the indexer spilled a run (its memory is
+                    # empty then) or, failing that, every checkpoint_docs documents
+                    if len(indexer.runs) > runs or doc_id - last_checkpoint >= checkpoint_docs:
+                        t0 = time.perf_counter()
+                        indexer.flush()
+                        f_meta.writelines(metadata_buffer)
+                        metadata_buffer.clear()
+                        checkpoint.save(indexer.runs, doc_id, position)
+                        last_checkpoint = doc_id
+                        timer.add("checkpoints", time.perf_counter() - t0)
+
+                    if doc_id % PROGRESS_INTERVAL == 0:
+                        f_meta.writelines(metadata_buffer)
+                        metadata_buffer.clear()
+                        elapsed = time.time() - start_time
+                        print(f"  Processed: {doc_id:,} documents | Vocabulary: {len(lexicon):,} | "
+                              f"Runs: {len(indexer.runs)} | Rate: {(doc_id - resumed_docs) / elapsed:.0f} docs/sec")
+            t0 = time.time()
+            indexer.flush()
+            f_meta.writelines(metadata_buffer)
+            checkpoint.save(indexer.runs, doc_id, position, complete=True)
+            timer.add("checkpoints", time.time() - t0)
+            timer.add("read", time.time() - start_time - sum(timer.seconds.values()))
+        checkpoint.close()
+
+        print(f"\n[2/3] Writing document offsets, lengths and metadata...")
+        t0 = time.time()
+        with open(DOC_OFFSETS_PATH, 'wb') as f_off:
+            doc_offsets.tofile(f_off)
+        # Like the other builds, the lengths file ends at the last doc with words
+        while doc_lengths and doc_lengths[-1] == 0:
+            doc_lengths.pop()
+        if doc_lengths:
+            write_dense_lengths(doc_lengths, DOC_LENGTHS_PATH)
+        timer.add("offsets + lengths", time.time() - t0)
+
+        t0 = time.time()
+        rows = list(read_metadata_part(checkpoint.metadata_path))
+        with open(METADATA_PATH, 'w', encoding='utf-8') as f_meta:
+            f_meta.writelines(f"{doc_id}||{title}||{filename}\n" if filename else f"{doc_id}||{title}\n"
+                              for doc_id, title, filename, _ in rows)
+        write_metadata_table(METADATA_BIN_PATH, [(doc_id, title, filename or DEFAULT_FILENAME, authors)
+                                                 for doc_id, title, filename, authors in rows])
+        timer.add("metadata", time.time() - t0)
+
+        t0 = time.time()
+        print(f"\n[3/3] Merging {len(indexer.runs)} runs into barrels and writing lexicon.bin...")
+        writer = BarrelWriter(OUTPUT_DIR, DOC_LENGTHS_PATH, store_positions)
+        unique_words = indexer.merge(writer)
+        writer.close()
+        timer.add("barrels", time.time() - t0)
+
+        t0 = time.time()
+        write_lexicon(LEXICON_BIN_PATH, lexicon, writer.word_offsets)
+        timer.add("lexicon.bin", time.time() - t0)
+
+        t0 = time.time()
+        metadata = MetadataTable(METADATA_BIN_PATH)
+        try:
+            write_results(checkpoint.directory, metadata)
+        finally:
+            metadata.close()
+        move_docstore(checkpoint.directory, OUTPUT_DIR)
+        timer.add("result fragments", time.time() - t0)
+
+        t0 = time.time()
+        model = VectorModel(os.path.join(OUTPUT_DIR, "glove.txt"))
+        model.load_model()
+        if model.loaded:
+            write_synonyms(os.path.join(OUTPUT_DIR, SYNONYMS_FILE), list(lexicon.items()), model)
+            timer.add("synonym table", time.time() - t0)
+            if model.index is None:
+                t0 = time.time()
+                model.build_index()
+                timer.add("vector index", time.time() - t0)
+    except BaseException:
+        print(f"\n[ERR] Build stopped after document {doc_id:,}. Continue it from the last checkpoint with: "
+              f"python build_pipeline.py --resume")
+        raise
+    checkpoint.remove()
+
+    elapsed = time.time() - start_time
+    total_docs = sum(1 for length in doc_lengths if length)
+    timer.report(elapsed)
+
+    print("\n" + "=" * 60)
+    print("ONE-PASS BUILD COMPLETE!")
+    print("=" * 60)
+    print(f"✓ Total Documents: {total_docs:,} ({doc_id:,} parsed, {resumed_docs:,} from the checkpoint)")
+    print(f"✓ Unique Words: {len(lexicon):,} ({unique_words:,} in the barrels)")
+    print(f"✓ Total Word Instances: {sum(doc_lengths):,}")
+    print(f"✓ Time Elapsed: {elapsed:.2f} seconds")
+    print(f"✓ Processing Rate: {total_docs/elapsed:.1f} docs/sec")
+    print("=" * 60)
+
+    return {
+        'docs': total_docs,
+        'words': len(lexicon),
+        'time': elapsed
+    }
+
+
+if __name__ == "__main__":
+    try:
+        build_pipeline(resume="--resume" in sys.argv[1:])
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,35 @@
+"""
+Veridia Search Engine - Result Fragment Builder
+Writes the result store (see VeridiaCore/docstore.py): every document's
+search result fields as pre-encoded JSON, from document_metadata.bin and
+the document store
+"""
+import os
+import sys
+import time
+from VeridiaCore.docstore import DocStore, RESULT_FILES, write_results
+from VeridiaCore.metadata import METADATA_FILE, MetadataTable
+from config import OUTPUT_DIR
+
+
+def build_results(directory=OUTPUT_DIR):
+    print(f"Building result fragments in {directory}...")
+    table_path = os.path.join(directory, METADATA_FILE)
+    if not DocStore.exists(directory) or not os.path.exists(table_path):
+        print("ERROR: Document store or metadata table not found. "
+              "Run build_docstore.py and build_metadata.py first!")
+        return False
+    start_time = time.time()
+    metadata = MetadataTable(table_path)
+    try:
+        write_results(directory, metadata)
+    finally:
+        metadata.close()
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in RESULT_FILES)
+    print(f"[OK] Result fragments built: {len(metadata):,} documents, "
+          f"{size / 1024 / 1024:.1f} MB in {time.time() - start_time:.2f}s")
+    return True
+
+
+if __name__ == '__main__':
+    build_results(sys.argv[1] if len(sys.argv) > 1 else OUTPUT_DIR)
@@ -0,0 +1,236 @@
+"""
+Veridia Search Engine - SPIMI Inverted Index Builder
+Inverts the forward index within a fixed memory budget, straight into barrels
+"""
+import os
+import time
+import heapq
+import shutil
+import struct
+import itertools
+from array import array
+import numpy as np
+from build_barrels import BarrelWriter
+from config import (
+    OUTPUT_DIR, FORWARD_INDEX_PATH, DOC_LENGTHS_PATH, PROGRESS_INTERVAL,
+    STORE_POSITIONS, SPIMI_MEMORY_BYTES
+)
+
+# Sorted runs are written here and deleted once merged into the barrels
+RUNS_DIR = "spimi_runs"
+
+# Run file record: word_id, posting count, position count, then uint32
+# doc_ids[count], freqs[count], positions[position count]
+RUN_RECORD = struct.Struct('<III')
+
+# Memory per buffered token: its word ID, plus the sort at flush time
+# (permutation, sorted word IDs, doc IDs and positions)
+TOKEN_BYTES = 32
+DOC_BYTES = 8
+
+
+class SpimiIndexer:
+    """
+    Single-pass in-memory inversion (SPIMI). Documents' word IDs are
+    buffered back to back until the estimated size reaches memory_bytes;
+    then one stable sort by word ID inverts the buffer, which is written as
+    a binary run of terms in word ID order, and memory starts over.
+    merge() k-way merges the runs into barrels. Documents must arrive in
+    ascending doc ID order, so a term's postings in later runs always
+    follow those in earlier ones.
+    """
+
+    def __init__(self, run_dir, memory_bytes=SPIMI_MEMORY_BYTES, store_positions=STORE_POSITIONS,
+                 run_prefix="run"):
+        self.run_dir = run_dir
+        self.memory_bytes = memory_bytes
+        self.store_positions = store_positions
+        self.run_prefix = run_prefix
+        self.runs = []
+        self.tokens = array('I')   # word IDs of the buffered documents
+        self.doc_ids = array('I')
+        self.lengths = array('I')  # tokens per buffered document
+        self.used_bytes = 0
+        os.makedirs(run_dir, exist_ok=True)
+
+    def add(self, doc_id, word_ids):
+        """Buffer one document (word_ids: its tokens' word IDs, in order)"""
+        self.tokens.extend(word_ids)
+        self.doc_ids.append(doc_id)
+        self.lengths.append(len(word_ids))
+        self.used_bytes += TOKEN_BYTES * len(word_ids) + DOC_BYTES
+        if self.used_bytes >= self.memory_bytes:
+            self.flush()
+
+    def flush(self):
+        """Invert the buffered documents into a sorted run and free them"""
+        if not self.tokens:
+            return None
+        words = np.frombuffer(self.tokens, dtype=np.uint32)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.int64)
+        # Stable, so each term keeps its doc IDs and positions ascending
+        order = np.argsort(words, kind='stable')
+        words = words[order]
+        docs = np.repeat(np.frombuffer(self.doc_ids, dtype=np.uint32), lengths)[order]
+        positions = None
+        if self.store_positions:
+            starts = np.repeat((np.cumsum(lengths) - lengths).astype(np.uint32), lengths)
+            positions = (np.arange(words.size, dtype=np.uint32) - starts)[order]
+            del starts
+        del order
+
+        # A posting starts wherever the word or the doc changes, a term wherever the word does
+        new_word = np.empty(words.size, dtype=bool)
+        new_word[0] = True
+        np.not_equal(words[1:], words[:-1], out=new_word[1:])
+        new_posting = new_word.copy()
+        new_posting[1:] |= docs[1:] != docs[:-1]
+        posting_starts = np.flatnonzero(new_posting)
+        freqs = np.diff(np.append(posting_starts, words.size)).astype(np.uint32)
+        docs = docs[posting_starts]
+        term_starts = np.flatnonzero(new_word[posting_starts])
+        term_ends = np.append(term_starts[1:], posting_starts.size)
+        token_bounds = np.append(posting_starts, words.size)
+
+        path = os.path.join(self.run_dir, f"{self.run_prefix}_{len(self.runs):05d}.run")
+        with open(path, 'wb') as f:
+            for word_id, first, last in zip(words[posting_starts[term_starts]].tolist(),
+                                            term_starts.tolist(), term_ends.tolist()):
+                if positions is not None:
+                    pos_first, pos_last = int(token_bounds[first]), int(token_bounds[last])
+                    f.write(RUN_RECORD.pack(word_id, last - first, pos_last - pos_first))
+                    f.write(docs[first:last].tobytes())
+                    f.write(freqs[first:last].tobytes())
+                    f.write(positions[pos_first:pos_last].tobytes())
+                else:
+                    f.write(RUN_RECORD.pack(word_id, last - first, 0))
+                    f.write(docs[first:last].tobytes())
+                    f.write(freqs[first:last].tobytes())
+        self.runs.append(path)
+        self.tokens = array('I')
+        self.doc_ids = array('I')
+        self.lengths = array('I')
+        self.used_bytes = 0
+        return path
+
+    def merge(self, writer):
+        """Flush what is left and merge every run into a BarrelWriter"""
+        self.flush()
+        return merge_runs(self.runs, writer, self.store_positions)
+
+
+def read_run(path, order):
+    """(word_id, order, doc_ids, freqs, positions) per term of a run file"""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RUN_RECORD.size)
+            if not header:
+                return
+            word_id, count, npositions = RUN_RECORD.unpack(header)
+            doc_ids, freqs, positions = array('I'), array('I'), array('I')
+            doc_ids.fromfile(f, count)
+            freqs.fromfile(f, count)
+            positions.fromfile(f, npositions)
+            yield word_id, order, doc_ids, freqs, positions
+
+
+def merge_runs(paths, writer, store_positions=STORE_POSITIONS):
+    """
+    K-way merge of runs (given in doc ID order) into writer, one term at a
+    time: memory holds one record per run plus the term being written.
+    Returns the number of terms written.
+    """
+    streams = [read_run(path, order) for order, path in enumerate(paths)]
+    words = 0
+    for word_id, group in itertools.groupby(heapq.merge(*streams), key=lambda x: x[0]):
+        doc_ids, freqs, positions = array('I'), array('I'), array('I')
+        for _, _, run_docs, run_freqs, run_positions in group:
+            doc_ids.extend(run_docs)
+            freqs.extend(run_freqs)
+            positions.extend(run_positions)
+        writer.add(word_id, doc_ids.tolist(), freqs.tolist(),
+                   positions.tolist() if store_positions else None, flat_positions=True)
+        words += 1
+    return words
+
+
+def write_dense_lengths(lengths, path=DOC_LENGTHS_PATH):
+    """Write an array('I') of document lengths indexed by doc_id (see write_doc_lengths)"""
+    with open(path, 'wb') as f:
+        lengths.tofile(f)
+
+
+def build_inverted_spimi(memory_bytes=SPIMI_MEMORY_BYTES):
+    """
+    Invert forward_index.txt into the barrels, offsets maps and document
+    lengths without writing inverted_index.txt. Peak memory is set by
+    memory_bytes (plus one posting list during the merge), not corpus size.
+    """
+    print("=" * 60)
+    print("BUILDING INVERTED INDEX (SPIMI)")
+    print("=" * 60)
+
+    start_time = time.time()
+
+    if not os.path.exists(FORWARD_INDEX_PATH):
+        print(f"ERROR: Forward index not found at {FORWARD_INDEX_PATH}")
+        print("Please run build_index_fast.py first!")
+        return
+
+    run_dir = os.path.join(OUTPUT_DIR, RUNS_DIR)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    indexer = SpimiIndexer(run_dir, memory_bytes)
+    doc_lengths = array('I')
+
+    print(f"\n[1/2] Inverting forward index in runs of {memory_bytes / 1024 / 1024:.0f} MB...")
+    line_count = 0
+    try:
+        with open(FORWARD_INDEX_PATH, 'r', encoding='utf-8') as f:
+            for line in f:
+                line_count += 1
+
+                parts = line.strip().split('\t')
+                if len(parts) < 2:
+                    continue
+
+                doc_id = int(parts[0])
+                word_ids = [int(w) for w in parts[1].split()]
+                indexer.add(doc_id, word_ids)
+                if len(doc_lengths) <= doc_id:
+                    doc_lengths.extend(array('I', bytes(4 * (doc_id + 1 - len(doc_lengths)))))
+                doc_lengths[doc_id] = len(word_ids)
+
+                if line_count % PROGRESS_INTERVAL == 0:
+                    elapsed = time.time() - start_time
+                    print(f"  Processed: {line_count:,} documents | Runs: {len(indexer.runs)} | "
+                          f"Rate: {line_count / elapsed:.0f} docs/sec")
+
+        if doc_lengths:
+            write_dense_lengths(doc_lengths)
+            print(f"  Document lengths written to {DOC_LENGTHS_PATH}")
+
+        indexer.flush()
+        print(f"\n[2/2] Merging {len(indexer.runs)} runs into barrels...")
+        writer = BarrelWriter(OUTPUT_DIR, DOC_LENGTHS_PATH)
+        words = indexer.merge(writer)
+        writer.close()
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    elapsed = time.time() - start_time
+    print("\n" + "=" * 60)
+    print("INVERTED INDEX BUILD COMPLETE!")
+    print("=" * 60)
+    print(f"✓ Documents Processed: {line_count:,}")
+    print(f"✓ Unique Words: {words:,}")
+    print(f"✓ Time Elapsed: {elapsed:.2f} seconds")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    try:
+        build_inverted_spimi()
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
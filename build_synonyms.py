@@ -0,0 +1,40 @@
+"""
+Veridia Search Engine - Synonym Table Builder
+Writes synonyms.bin (see VeridiaCore/synonyms.py): the nearest neighbours
+of every lexicon.bin word in the word vectors (glove.txt and its cache)
+"""
+import os
+import sys
+import time
+from VeridiaCore.lexicon import LEXICON_FILE, Lexicon
+from VeridiaCore.synonyms import SYNONYMS_FILE, write_synonyms
+from VeridiaCore.vector_model import VectorModel
+from config import OUTPUT_DIR
+
+
+def build_synonyms(directory=OUTPUT_DIR):
+    print(f"Building synonym table in {directory}...")
+    lexicon_path = os.path.join(directory, LEXICON_FILE)
+    if not os.path.exists(lexicon_path):
+        print(f"ERROR: {lexicon_path} not found. Run build_lexicon.py first!")
+        return False
+    start_time = time.time()
+    model = VectorModel(os.path.join(directory, "glove.txt"))
+    model.load_model()
+    if not model.loaded:
+        print("Skipping synonym table: no word vectors (semantic search is disabled)")
+        return False
+    lexicon = Lexicon(lexicon_path)
+    try:
+        words = [(word, word_id) for word, word_id, _, _, _ in lexicon.prefix("")]
+    finally:
+        lexicon.close()
+    path = os.path.join(directory, SYNONYMS_FILE)
+    covered = write_synonyms(path, words, model)
+    print(f"[OK] Synonym table built: {covered:,} of {len(words):,} words have vectors, "
+          f"{os.path.getsize(path) / 1024 / 1024:.1f} MB in {time.time() - start_time:.2f}s")
+    return True
+
+
+if __name__ == '__main__':
+    build_synonyms(sys.argv[1] if len(sys.argv) > 1 else OUTPUT_DIR)
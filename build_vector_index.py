@@ -0,0 +1,32 @@
+"""
+Veridia Search Engine - Vector Index Builder
+Writes glove.ivf (see VeridiaCore/vector_index.py): the IVF index that
+VectorModel.find_similar_vectors searches, over the word vectors (glove.txt
+and its cache)
+"""
+import os
+import sys
+import time
+from VeridiaCore.vector_model import VectorModel
+from config import OUTPUT_DIR
+
+
+def build_vector_index(directory=OUTPUT_DIR):
+    print(f"Building vector index in {directory}...")
+    start_time = time.time()
+    model = VectorModel(os.path.join(directory, "glove.txt"))
+    model.load_model()
+    if not model.loaded:
+        print("Skipping vector index: no word vectors (semantic search is disabled)")
+        return False
+    if model.index is not None:
+        print(f"[OK] Vector index is up to date ({model.index.nlist} lists)")
+        return True
+    index = model.build_index()
+    print(f"[OK] Vector index built: {index.nlist:,} lists over {index.size:,} vectors, "
+          f"{os.path.getsize(model.index_path()) / 1024 / 1024:.1f} MB in {time.time() - start_time:.2f}s")
+    return True
+
+
+if __name__ == '__main__':
+    build_vector_index(sys.argv[1] if len(sys.argv) > 1 else OUTPUT_DIR)
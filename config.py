@@ -24,6 +24,10 @@ LEXICON_PATH = os.path.join(OUTPUT_DIR, "lexicon.txt")
 FORWARD_INDEX_PATH = os.path.join(OUTPUT_DIR, "forward_index.txt")
 INVERTED_INDEX_PATH = os.path.join(OUTPUT_DIR, "inverted_index.txt")
 METADATA_PATH = os.path.join(OUTPUT_DIR, "document_metadata.txt")
+METADATA_BIN_PATH = os.path.join(OUTPUT_DIR, "document_metadata.bin")
+DOC_LENGTHS_PATH = os.path.join(OUTPUT_DIR, "doc_lengths.bin")
+LEXICON_BIN_PATH = os.path.join(OUTPUT_DIR, "lexicon.bin")
+DOC_OFFSETS_PATH = os.path.join(OUTPUT_DIR, "doc_offsets.bin")
 
 # ============= INDEXING CONFIGURATION =============
 # Maximum number of documents to index
@@ -35,6 +39,36 @@ BATCH_SIZE = 50000
 # Progress reporting interval
 PROGRESS_INTERVAL = 10000
 
+# Processes for build_all.py (1 = the serial single-process build). The
+# parallel build tokenizes dataset.jsonl in chunks of BUILD_CHUNK_BYTES.
+BUILD_WORKERS = os.cpu_count() or 1
+BUILD_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Memory ceiling for inverting the corpus (build_all.py, build_spimi.py; split
+# between the parallel build's workers). Postings beyond it are spilled to
+# sorted run files, which are merged straight into the barrels.
+SPIMI_MEMORY_BYTES = 512 * 1024 * 1024
+
+# build_pipeline.py checkpoints its progress whenever it spills a run, and
+# at least every this many documents, so `--resume` after a crash redoes at
+# most this much work
+BUILD_CHECKPOINT_DOCS = 250000
+
+# Documents submitted through /api/add-document(s) are indexed by a
+# background worker. Submissions waiting in the queue (beyond this the
+# endpoints answer 503), and the most documents one index commit groups
+# together out of the waiting submissions.
+INGEST_QUEUE_SIZE = 256
+INGEST_BATCH_DOCS = 5000
+
+# Write barrels as delta + variable-byte compressed blocks (format v2).
+# Set to False to produce the legacy raw 4-byte-per-posting barrels.
+COMPRESS_POSTINGS = True
+
+# Keep token positions in the inverted index and barrels (phrase queries).
+# Requires COMPRESS_POSTINGS; roughly doubles the inverted index size.
+STORE_POSITIONS = True
+
 # ============= LANGUAGE FILTERING =============
 STOP_WORDS = {
     "a", "an", "the", "and", "or", "but", "if", "of", "at", "by", "for", "with",
@@ -54,6 +88,13 @@ MIN_WORD_LENGTH = 3
 # Maximum number of results to return
 MAX_RESULTS = 50
 
+# BM25 ranking parameters (term frequency saturation, length normalization)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Memory budget (bytes) for decoded posting lists of frequently searched terms
+POSTING_CACHE_BYTES = 256 * 1024 * 1024
+
 # Memory-mapped file usage (faster for large indices)
 USE_MEMORY_MAPPING = True
 
@@ -27,6 +27,7 @@ config.LEXICON_PATH = os.path.join(DEMO_DIR, "lexicon.txt")
 config.FORWARD_INDEX_PATH = os.path.join(DEMO_DIR, "forward_index.txt")
 config.INVERTED_INDEX_PATH = os.path.join(DEMO_DIR, "inverted_index.txt")
 config.METADATA_PATH = os.path.join(DEMO_DIR, "document_metadata.txt")
+config.DOC_LENGTHS_PATH = os.path.join(DEMO_DIR, "doc_lengths.bin")
 
 # Now import modules (they will see the updated config)
 from build_index_fast import build_indices_optimized
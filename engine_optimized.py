@@ -3,13 +3,15 @@ Veridia Search Engine - Optimized Search Engine
 Fast query processing with caching
 """
 import os
+import math
 import time
+from array import array
 from collections import defaultdict
-from functools import lru_cache
 from text_processor import clean_and_tokenize
+from VeridiaCore.result_cache import ResultCache
 from config import (
-    LEXICON_PATH, INVERTED_INDEX_PATH, METADATA_PATH,
-    MAX_RESULTS, QUERY_CACHE_SIZE
+    LEXICON_PATH, INVERTED_INDEX_PATH, METADATA_PATH, DOC_LENGTHS_PATH,
+    MAX_RESULTS, QUERY_CACHE_SIZE, BM25_K1, BM25_B
 )
 
 
@@ -20,8 +22,14 @@ class SearchEngine:
         start = time.time()
         
         self.lexicon = {}           # word -> word_id
-        self.inverted_index = {}    # word_id -> [doc_ids]
+        self.inverted_index = {}    # word_id -> [(doc_id, tf)]
         self.metadata = {}          # doc_id -> {title, authors}
+        self.doc_lengths = array('I')
+        self.avg_doc_len = 1.0
+        
+        # Results per normalized query; call result_cache.bump_generation()
+        # whenever the indices change
+        self.result_cache = ResultCache(QUERY_CACHE_SIZE)
         
         self._load_indices()
         
@@ -51,11 +59,23 @@ class SearchEngine:
                     parts = line.strip().split('\t')
                     if len(parts) >= 2:
                         word_id = parts[0]
-                        doc_ids = parts[1].split()
-                        self.inverted_index[word_id] = doc_ids
+                        postings = []
+                        for entry in parts[1].split():
+                            doc_id, _, rest = entry.partition(':')
+                            tf = rest.partition(':')[0]  # drop positions, if any
+                            postings.append((doc_id, int(tf) if tf else 1))
+                        self.inverted_index[word_id] = postings
         else:
             print(f"WARNING: Inverted index not found at {INVERTED_INDEX_PATH}")
         
+        # Load document lengths for BM25
+        if os.path.exists(DOC_LENGTHS_PATH):
+            with open(DOC_LENGTHS_PATH, 'rb') as f:
+                self.doc_lengths.frombytes(f.read())
+            indexed = [n for n in self.doc_lengths if n]
+            if indexed:
+                self.avg_doc_len = sum(indexed) / len(indexed)
+        
         # Load metadata
         if os.path.exists(METADATA_PATH):
             with open(METADATA_PATH, 'r', encoding='utf-8') as f:
@@ -72,11 +92,10 @@ class SearchEngine:
         else:
             print(f"WARNING: Metadata not found at {METADATA_PATH}")
     
-    @lru_cache(maxsize=QUERY_CACHE_SIZE)
     def search(self, query):
         """
         Search for documents matching the query.
-        Uses LRU cache for frequently searched queries.
+        Repeated queries (same tokens) are served from the result cache.
         
         Args:
             query: Search query string
@@ -87,14 +106,24 @@ class SearchEngine:
         if not query or not query.strip():
             return []
         
-        start_time = time.time()
-        
         # Tokenize query
         query_words = clean_and_tokenize(query)
         
         if not query_words:
             return []
         
+        cache_key = tuple(query_words)
+        generation = self.result_cache.generation
+        results = self.result_cache.get(cache_key)
+        if results is None:
+            results = self._search_words(query, query_words)
+            self.result_cache.put(cache_key, results, generation)
+        return list(results)
+    
+    def _search_words(self, query, query_words):
+        """BM25 ranking for an already tokenized query"""
+        start_time = time.time()
+        
         # Get word IDs for query terms
         query_word_ids = []
         for word in query_words:
@@ -104,13 +133,20 @@ class SearchEngine:
         if not query_word_ids:
             return []
         
-        # Score documents using term frequency
-        doc_scores = defaultdict(int)
+        # Score documents using BM25
+        doc_scores = defaultdict(float)
+        num_docs = max(len(self.metadata), 1)
+        k1, b = BM25_K1, BM25_B
         
         for word_id in query_word_ids:
             if word_id in self.inverted_index:
-                for doc_id in self.inverted_index[word_id]:
-                    doc_scores[doc_id] += 1
+                postings = self.inverted_index[word_id]
+                df = len(postings)
+                idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings:
+                    dl = self._doc_length(int(doc_id))
+                    norm = k1 * (1.0 - b + b * dl / self.avg_doc_len)
+                    doc_scores[doc_id] += idf * tf * (k1 + 1.0) / (tf + norm)
         
         # Sort by score (descending)
         sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
@@ -125,7 +161,7 @@ class SearchEngine:
                     "title": meta["title"],
                     "authors": meta["authors"],
                     "filename": f"arxiv_{doc_id}.txt",
-                    "score": score
+                    "score": round(score, 2)
                 })
         
         elapsed = time.time() - start_time
@@ -135,13 +171,19 @@ class SearchEngine:
         
         return results
     
+    def _doc_length(self, doc_id):
+        """Document length in tokens (average length if unknown)"""
+        if doc_id < len(self.doc_lengths) and self.doc_lengths[doc_id]:
+            return self.doc_lengths[doc_id]
+        return self.avg_doc_len
+    
     def get_stats(self):
         """Get search engine statistics."""
         return {
             "total_documents": len(self.metadata),
             "unique_words": len(self.lexicon),
             "index_entries": len(self.inverted_index),
-            "cache_info": self.search.cache_info()._asdict()
+            "cache_info": self.result_cache.stats()
         }
 
 
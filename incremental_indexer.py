@@ -2,106 +2,114 @@
 Veridia Search Engine - Incremental Indexer
 Supports adding new documents without reprocessing existing data
 Tracks indexed document IDs and maintains persistent state
+
+Each batch of new documents becomes a small immutable index segment
+(VeridiaCore/segments.py) that the search engine reads next to the barrels.
+A background thread merges segments in tiers, so the cost of an add is
+proportional to the new data, not to the corpus.
 """
 import os
 import json
-import struct
 import time
-from collections import defaultdict
+import threading
 from text_processor import clean_and_tokenize
-from config import OUTPUT_DIR, BATCH_SIZE, PROGRESS_INTERVAL
-
+from config import OUTPUT_DIR, BATCH_SIZE, PROGRESS_INTERVAL, STORE_POSITIONS, BM25_K1, BM25_B
+from VeridiaCore.segments import (
+    SEGMENTS_DIR, manifest_lock, read_manifest, write_manifest, new_segment_name, remove_orphans,
+    segment_doc_count, segment_doc_ids, pick_merge, commit_segment, merge_segments
+)
+from VeridiaCore.snapshot import current_snapshot
+from VeridiaCore.metadata import METADATA_FILE, MetadataTable
+from VeridiaCore.memory_index import DYNAMIC_DOC_ID_START
 
-from build_barrels import build_barrels
 
 class IncrementalIndexer:
-    # ... (existing code)
-
-    def add_documents(self, documents):
-        # ... (existing code)
-        
-        print(f"\n[3/3] Rebuilding inverted index...")
-        self._rebuild_inverted_index()
-        
-        print(f"\n[4/4] Updating Barrels...")
-        build_barrels()
-        
-        # Save state
-    
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, result_cache=None, on_commit=None):
         self.data_dir = data_dir
-        self.lexicon = {}
-        self.word_id_counter = 0
+        # Search result cache to invalidate when documents are added (optional)
+        self.result_cache = result_cache
+        # Called after every segment commit or merge, e.g. SearchEngine.load_segments (optional)
+        self.on_commit = on_commit
         self.next_doc_id = 0
         self.state_file = os.path.join(self.data_dir, "indexing_state.json")
         self.indexed_docs_file = os.path.join(self.data_dir, "indexed_documents.txt")
         
         # Paths to index files
-        self.lexicon_path = os.path.join(self.data_dir, "lexicon.txt")
-        self.forward_index_path = os.path.join(self.data_dir, "forward_index.txt")
         self.metadata_path = os.path.join(self.data_dir, "document_metadata.txt")
         self.inverted_index_path = os.path.join(self.data_dir, "inverted_index.txt")
+        self.segments_dir = os.path.join(self.data_dir, SEGMENTS_DIR)
+        
+        # Segment manifest: written by commits and merges, one at a time
+        # (shared with the search engine, which commits its flushed uploads)
+        self.manifest_lock = manifest_lock(self.segments_dir)
+        self.merge_thread = None
         
         # Load existing state
         self._load_state()
+        if os.path.isdir(self.segments_dir):
+            with self.manifest_lock:
+                remove_orphans(self.segments_dir, read_manifest(self.segments_dir))
     
     def _load_state(self):
-        """Load lexicon, word counter, and indexed document IDs from existing files"""
+        """Load the next document ID: the saved one, unless the index already holds higher IDs"""
         print("[STATE] Loading indexing state...")
         
-        # Load lexicon and word counter
-        if os.path.exists(self.lexicon_path):
-            with open(self.lexicon_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split('\t')
-                    if len(parts) == 2:
-                        word = parts[0]
-                        word_id = int(parts[1])
-                        self.lexicon[word] = word_id
-                        self.word_id_counter = max(self.word_id_counter, word_id + 1)
-            print(f"  [OK] Loaded lexicon: {len(self.lexicon):,} words")
-        
-        # Load next document ID from state file
+        saved = 0
         if os.path.exists(self.state_file):
             with open(self.state_file, 'r') as f:
-                state = json.load(f)
-                self.next_doc_id = state.get('next_doc_id', 0)
-                self.word_id_counter = state.get('word_id_counter', self.word_id_counter)
-            print(f"  [OK] Loaded state: next_doc_id={self.next_doc_id}, word_ids={self.word_id_counter}")
-        else:
-            # Infer next_doc_id from existing metadata if available
-            if os.path.exists(self.metadata_path):
-                max_doc_id = -1
-                with open(self.metadata_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        parts = line.strip().split('|')
-                        if parts:
-                            try:
-                                doc_id = int(parts[0])
-                                max_doc_id = max(max_doc_id, doc_id)
-                            except:
-                                pass
-                self.next_doc_id = max_doc_id + 1
-                print(f"  [OK] Inferred next_doc_id from metadata: {self.next_doc_id}")
+                saved = json.load(f).get('next_doc_id', 0)
+        # A rebuilt base index or a lost state file must never hand out an ID in use
+        self.next_doc_id = max(saved, self.first_free_doc_id())
+        print(f"  [OK] Loaded state: next_doc_id={self.next_doc_id}")
+    
+    def first_free_doc_id(self):
+        """
+        The doc ID after the highest one of the base index (its metadata) and
+        of the segments. Flushed uploads have their own ID range and are skipped.
+        """
+        max_doc_id = -1
+        _, directory = current_snapshot(self.data_dir)
+        table_path = os.path.join(directory, METADATA_FILE)
+        text_path = os.path.join(directory, "document_metadata.txt")
+        if os.path.exists(table_path):
+            table = MetadataTable(table_path)
+            try:
+                if len(table):
+                    max_doc_id = table.doc_ids[len(table) - 1]
+            finally:
+                table.close()
+        elif os.path.exists(text_path):
+            with open(text_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        max_doc_id = max(max_doc_id, int(line.split('|', 1)[0]))
+                    except ValueError:
+                        pass
+        if os.path.isdir(self.segments_dir):
+            with self.manifest_lock:
+                for name in read_manifest(self.segments_dir)['segments']:
+                    ids = [d for d in segment_doc_ids(self.segments_dir, name) if d < DYNAMIC_DOC_ID_START]
+                    max_doc_id = max([max_doc_id] + ids)
+        return max_doc_id + 1
     
     def _save_state(self):
         """Save current indexing state to file"""
         state = {
             'next_doc_id': self.next_doc_id,
-            'word_id_counter': self.word_id_counter,
-            'timestamp': time.time(),
-            'total_words': len(self.lexicon)
+            'timestamp': time.time()
         }
         with open(self.state_file, 'w') as f:
             json.dump(state, f, indent=2)
     
-    def add_documents(self, documents):
+    def add_documents(self, documents, on_document=None):
         """
         Add new documents incrementally.
         
         Args:
             documents: List of tuples (title, full_text, authors)
                       or list of dicts with 'title', 'text', 'authors' keys
+            on_document: Optional callback (index in documents, doc_id) run as
+                      each document is tokenized; doc_id is None if it was skipped
         
         Returns:
             dict with statistics about the indexing operation
@@ -113,17 +121,13 @@ class IncrementalIndexer:
         start_time = time.time()
         stats = {
             'documents_added': 0,
-            'new_words': 0,
             'total_words_processed': 0
         }
         
-        # Append to indices instead of overwriting
-        print(f"\n[1/3] Processing new documents (starting from doc_id {self.next_doc_id})...")
+        print(f"\n[1/2] Processing new documents (starting from doc_id {self.next_doc_id})...")
         
-        # For lexicon updates
-        lexicon_updates = {}
-        forward_buffer = []
         metadata_buffer = []
+        segment_docs = []  # (doc_id, stored record, tokens) for the new segment
         
         for i, doc in enumerate(documents):
             # Parse document format
@@ -137,134 +141,128 @@ class IncrementalIndexer:
             # Clean and tokenize
             words = clean_and_tokenize(full_text)
             if not words:
+                if on_document: on_document(i, None)
                 continue
             
-            # Build word IDs (create new IDs for unknown words)
-            word_ids = []
-            for word in words:
-                if word not in self.lexicon and word not in lexicon_updates:
-                    # New word found
-                    lexicon_updates[word] = self.word_id_counter
-                    self.word_id_counter += 1
-                    stats['new_words'] += 1
-                
-                # Get the word ID (from lexicon or updates)
-                word_id = self.lexicon.get(word, lexicon_updates.get(word))
-                word_ids.append(str(word_id))
-            
-            # Add to buffers
-            forward_buffer.append(f"{self.next_doc_id}\t{' '.join(word_ids)}\n")
+            # The segment is keyed by word, so no word IDs are needed
             metadata_buffer.append(f"{self.next_doc_id}|{title}|{authors}\n")
+            segment_docs.append((self.next_doc_id,
+                                 {"title": title, "authors": authors, "text": full_text}, words))
             
             stats['documents_added'] += 1
             stats['total_words_processed'] += len(words)
+            if on_document: on_document(i, self.next_doc_id)
             self.next_doc_id += 1
             
             if (i + 1) % PROGRESS_INTERVAL == 0:
-                print(f"  Processed: {i + 1:,} documents | "
-                      f"New words: {stats['new_words']:,}")
+                print(f"  Processed: {i + 1:,} documents")
             
             # Flush buffers periodically
-            if len(forward_buffer) >= BATCH_SIZE:
-                self._flush_to_indices(forward_buffer, metadata_buffer, 'a')
-                forward_buffer.clear()
+            if len(metadata_buffer) >= BATCH_SIZE:
+                self._append_metadata(metadata_buffer)
                 metadata_buffer.clear()
         
         # Flush remaining data
-        if forward_buffer:
-            self._flush_to_indices(forward_buffer, metadata_buffer, 'a')
+        if metadata_buffer:
+            self._append_metadata(metadata_buffer)
         
-        print(f"\n[2/3] Updating lexicon with {stats['new_words']:,} new words...")
-        self._update_lexicon(lexicon_updates)
-        
-        print(f"\n[3/3] Rebuilding inverted index...")
-        self._rebuild_inverted_index()
+        print(f"\n[2/2] Writing index segment...")
+        stats['segments_written'] = 0
+        if segment_docs:
+            name = self._commit_segment(segment_docs)
+            stats['segments_written'] = 1
+            print(f"  [OK] Segment {name}: {len(segment_docs):,} documents")
         
         # Save state
         self._save_state()
+        if self.result_cache is not None and stats['documents_added']:
+            self.result_cache.bump_generation()
+        if segment_docs:
+            self._start_merges()
         
         elapsed = time.time() - start_time
         print("\n" + "=" * 60)
         print("INCREMENTAL INDEXING COMPLETE")
         print("=" * 60)
         print(f"  Documents added: {stats['documents_added']:,}")
-        print(f"  New words: {stats['new_words']:,}")
         print(f"  Total words processed: {stats['total_words_processed']:,}")
-        print(f"  Total lexicon size: {len(self.lexicon) + len(lexicon_updates):,}")
         print(f"  Time elapsed: {elapsed:.2f}s")
         
         return stats
     
-    def _flush_to_indices(self, forward_buffer, metadata_buffer, mode='a'):
-        """Append buffers to index files"""
-        with open(self.forward_index_path, mode, encoding='utf-8') as f_fwd, \
-             open(self.metadata_path, mode, encoding='utf-8') as f_meta:
-            f_fwd.writelines(forward_buffer)
+    def _append_metadata(self, metadata_buffer):
+        """Append titles and authors to document_metadata.txt (read by ingest_data.py)"""
+        with open(self.metadata_path, 'a', encoding='utf-8') as f_meta:
             f_meta.writelines(metadata_buffer)
     
-    def _update_lexicon(self, new_words_dict):
-        """Append new words to lexicon file"""
-        if new_words_dict:
-            with open(self.lexicon_path, 'a', encoding='utf-8') as f:
-                for word in sorted(new_words_dict.keys()):
-                    word_id = new_words_dict[word]
-                    f.write(f"{word}\t{word_id}\n")
-                    self.lexicon[word] = word_id
+    def _commit_segment(self, documents):
+        """Write the documents as a new segment and publish it in the manifest"""
+        return commit_segment(self.segments_dir, documents, STORE_POSITIONS, BM25_K1, BM25_B,
+                              on_commit=self._notify)
     
-    def _rebuild_inverted_index(self):
-        """
-        Rebuild the inverted index from scratch (efficient - reads forward index once).
-        This is necessary after adding new documents.
-        """
-        if not os.path.exists(self.forward_index_path):
-            print("ERROR: Forward index not found!")
-            return
-        
-        inverted_index = defaultdict(set)
-        
-        print("  Reading forward index...")
-        with open(self.forward_index_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                parts = line.strip().split('\t')
-                if len(parts) < 2:
-                    continue
-                
-                doc_id = parts[0]
-                word_ids = parts[1].split()
-                
-                for word_id in set(word_ids):
-                    inverted_index[word_id].add(doc_id)
-                
-                if line_num % PROGRESS_INTERVAL == 0:
-                    print(f"    Processed: {line_num:,} documents")
-        
-        print(f"  Writing inverted index ({len(inverted_index):,} unique words)...")
-        with open(self.inverted_index_path, 'w', encoding='utf-8') as f:
-            buffer = []
-            sorted_word_ids = sorted(inverted_index.keys(), key=lambda x: int(x))
+    def _notify(self):
+        """Tell the reader about a new manifest (called with manifest_lock held)"""
+        if self.on_commit is not None:
+            try:
+                self.on_commit()
+            except Exception as e:
+                print(f"  [ERR] Segment reload failed: {e}")
+    
+    def _start_merges(self):
+        with self.manifest_lock:
+            if self.merge_thread is None or not self.merge_thread.is_alive():
+                self.merge_thread = threading.Thread(target=self._merge_loop, daemon=True)
+                self.merge_thread.start()
+    
+    def _merge_loop(self):
+        """Background: merge segments while the tiered policy finds a full tier"""
+        while True:
+            with self.manifest_lock:
+                manifest = read_manifest(self.segments_dir)
+                names = pick_merge([(name, segment_doc_count(self.segments_dir, name))
+                                    for name in manifest['segments']])
+                if not names:
+                    self.merge_thread = None
+                    return
+                new_name = new_segment_name(manifest)
+                write_manifest(self.segments_dir, manifest)  # reserve the name
             
-            for i, word_id in enumerate(sorted_word_ids, 1):
-                doc_ids = sorted(inverted_index[word_id], key=lambda x: int(x))
-                buffer.append(f"{word_id}\t{' '.join(doc_ids)}\n")
-                
-                if len(buffer) >= BATCH_SIZE:
-                    f.writelines(buffer)
-                    buffer.clear()
-                
-                if i % PROGRESS_INTERVAL == 0:
-                    print(f"    Written: {i:,} / {len(inverted_index):,} words")
+            # The slow part runs unlocked: commits keep going meanwhile
+            start = time.time()
+            try:
+                merge_segments(self.segments_dir, names, new_name)
+            except Exception as e:
+                print(f"  [ERR] Segment merge failed: {e}")
+                with self.manifest_lock:
+                    self.merge_thread = None
+                return
             
-            if buffer:
-                f.writelines(buffer)
+            with self.manifest_lock:
+                manifest = read_manifest(self.segments_dir)
+                segments = manifest['segments']
+                at = segments.index(names[0])
+                manifest['segments'] = [n for n in segments if n not in names]
+                manifest['segments'].insert(at, new_name)
+                write_manifest(self.segments_dir, manifest)
+                self._notify()
+                remove_orphans(self.segments_dir, manifest)
+            print(f"  [OK] Merged {len(names)} segments into {new_name} in {time.time() - start:.2f}s")
+    
+    def wait_for_merges(self):
+        """Block until background merges are done (call before the process exits)"""
+        while True:
+            with self.manifest_lock:
+                thread = self.merge_thread
+            if thread is None or not thread.is_alive():
+                return
+            thread.join()
     
     def get_status(self):
         """Get current indexing status"""
         return {
             'next_doc_id': self.next_doc_id,
-            'lexicon_size': len(self.lexicon),
-            'word_id_counter': self.word_id_counter,
-            'forward_index_size': os.path.getsize(self.forward_index_path) if os.path.exists(self.forward_index_path) else 0,
-            'inverted_index_size': os.path.getsize(self.inverted_index_path) if os.path.exists(self.inverted_index_path) else 0
+            'inverted_index_size': os.path.getsize(self.inverted_index_path) if os.path.exists(self.inverted_index_path) else 0,
+            'segments': len(read_manifest(self.segments_dir)['segments'])
         }
 
 
@@ -279,4 +277,5 @@ if __name__ == "__main__":
     ]
     
     stats = indexer.add_documents(test_docs)
+    indexer.wait_for_merges()
     print("\nStatus:", indexer.get_status())
@@ -88,6 +88,7 @@ def ingest_new_data():
     if new_docs:
         print(f"Found {len(new_docs)} new documents. Indexing...")
         indexer.add_documents(new_docs)
+        indexer.wait_for_merges()
     else:
         print("No new documents found.")
 
@@ -0,0 +1,154 @@
+"""
+Veridia Search Engine - Ingestion Job Queue
+Indexes documents submitted over HTTP in the background, so requests return at once
+"""
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+
+# Finished jobs kept for /api/jobs/<id>
+MAX_FINISHED_JOBS = 1000
+
+
+class IngestJob:
+    """One submission: its documents and how far indexing them has got"""
+
+    def __init__(self, documents):
+        self.id = uuid.uuid4().hex[:12]
+        self.documents = documents  # released once indexed
+        self.num_documents = len(documents)
+        self.status = "queued"  # queued -> indexing -> done | failed
+        self.docs_tokenized = 0
+        self.doc_ids = []
+        self.segments_written = 0
+        self.visible_generation = None  # result cache generation from which searches see the docs
+        self.batch_jobs = 0  # submissions committed together with this one (itself included)
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the job is done or failed; returns False on timeout"""
+        return self.finished.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "documents": self.num_documents,
+            "docs_tokenized": self.docs_tokenized,
+            "doc_ids": self.doc_ids,
+            "segments_written": self.segments_written,
+            "visible_generation": self.visible_generation,
+            "batch_jobs": self.batch_jobs,
+            "error": self.error,
+            "queued_ms": round(((self.started_at or time.time()) - self.submitted_at) * 1000, 2),
+            "indexing_ms": round(((self.finished_at or time.time()) - self.started_at) * 1000, 2)
+                           if self.started_at else None
+        }
+
+
+class IngestionQueue:
+    """
+    Bounded queue of ingestion jobs served by one background worker.
+
+    Whatever is waiting when the worker becomes free is committed together
+    (group commit, up to max_batch_docs documents): a burst of small
+    submissions becomes a single segment instead of one per request. One
+    worker also means indexing never takes more than one thread away from
+    the searches. submit() raises queue.Full when max_jobs are waiting.
+    """
+
+    def __init__(self, indexer, max_jobs=256, max_batch_docs=5000):
+        self.indexer = indexer
+        self.max_batch_docs = max_batch_docs
+        self.pending = queue.Queue(maxsize=max_jobs)
+        self.jobs = OrderedDict()  # job id -> IngestJob, oldest first
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, documents):
+        """Queue documents (as accepted by IncrementalIndexer.add_documents) and return the job"""
+        job = IngestJob(list(documents))
+        with self.lock:
+            self.pending.put_nowait(job)
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        stats = {status: statuses.count(status) for status in ("queued", "indexing", "done", "failed")}
+        stats["capacity"] = self.pending.maxsize
+        return stats
+
+    def _next_batch(self):
+        """Block for one job, then take every waiting job that still fits in the batch"""
+        batch = [self.pending.get()]
+        size = len(batch[0].documents)
+        while size < self.max_batch_docs:
+            try:
+                job = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+            size += len(job.documents)
+            if size >= self.max_batch_docs:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self._commit(batch)
+
+    def _commit(self, batch):
+        documents = []
+        owners = []  # per document: its job
+        start = time.time()
+        for job in batch:
+            job.status = "indexing"
+            job.started_at = start
+            job.batch_jobs = len(batch)
+            documents.extend(job.documents)
+            owners.extend([job] * len(job.documents))
+
+        def on_document(i, doc_id):
+            job = owners[i]
+            job.docs_tokenized += 1
+            if doc_id is not None:
+                job.doc_ids.append(doc_id)
+
+        try:
+            stats = self.indexer.add_documents(documents, on_document=on_document)
+            cache = self.indexer.result_cache
+            for job in batch:
+                job.segments_written = stats.get('segments_written', 0)
+                job.visible_generation = cache.generation if cache is not None else None
+                job.status = "done"
+        except Exception as e:
+            print(f"  [ERR] Ingestion of {len(documents)} documents failed: {e}")
+            for job in batch:
+                job.status = "failed"
+                job.error = str(e)
+        finished = time.time()
+        for job in batch:
+            job.documents = None
+            job.finished_at = finished
+            job.finished.set()
+        self._prune()
+
+    def _prune(self):
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.finished.is_set()]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[job_id]
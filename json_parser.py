@@ -7,6 +7,26 @@ from text_processor import is_english_text, extract_title_preview
 from config import JSON_DATASET_PATH, MAX_DOCUMENTS
 
 
+def parse_document_line(line):
+    """
+    Parse one dataset line into (title, full_text, authors).
+    Raises json.JSONDecodeError for malformed lines.
+    """
+    return parse_document(json.loads(line))
+
+
+def parse_document(data):
+    """(title, full_text, authors) of one decoded dataset record"""
+    # Extract fields
+    title = data.get('title', '').replace('\n', ' ').strip()
+    abstract = data.get('abstract', '').replace('\n', ' ').strip()
+    authors = data.get('authors', '').replace('\n', ' ').strip()
+    
+    # Combine title and abstract for content
+    full_text = f"{title} {abstract}"
+    return title, full_text, authors
+
+
 def stream_json_documents(limit=MAX_DOCUMENTS):
     """
     Stream documents from JSON file with English filtering.
@@ -29,15 +49,7 @@ def stream_json_documents(limit=MAX_DOCUMENTS):
                 processed += 1
                 
                 try:
-                    data = json.loads(line)
-                    
-                    # Extract fields
-                    title = data.get('title', '').replace('\n', ' ').strip()
-                    abstract = data.get('abstract', '').replace('\n', ' ').strip()
-                    authors = data.get('authors', '').replace('\n', ' ').strip()
-                    
-                    # Combine title and abstract for content
-                    full_text = f"{title} {abstract}"
+                    title, full_text, authors = parse_document_line(line)
                     
                     # Filter non-English documents - DISABLED to ensure all files are indexed
                     # if not is_english_text(full_text):
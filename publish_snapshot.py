@@ -0,0 +1,16 @@
+"""
+Veridia Search Engine - Publish Index Snapshot
+Run after rebuilding the index: copies the built files into a new versioned
+snapshot directory and atomically makes it the one the search engine serves.
+A running server switches over with POST /api/reload, without downtime.
+"""
+import sys
+from config import OUTPUT_DIR
+from VeridiaCore.snapshot import publish_snapshot
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else OUTPUT_DIR
+    name = publish_snapshot(data_dir)
+    print(f"\nSnapshot {name} is now current in {data_dir}")
+    print("Reload a running server with: POST /api/reload")
@@ -0,0 +1,136 @@
+"""
+Veridia Search Engine - Posting Codec Tests
+Round-trips random posting lists through the compressed barrel format
+(VeridiaCore/postings.py) and checks every decoder and block lookup
+against a brute-force reference
+
+Usage: python test_postings.py   (or pytest test_postings.py)
+"""
+import struct
+import random
+import numpy as np
+from VeridiaCore.postings import (
+    IndexFormat, FORMAT_COMPRESSED, FLAG_FREQS, FLAG_BLOCK_MAX, FLAG_POSITIONS,
+    encode_posting_list, encode_positions, decode_posting_list, read_term_max,
+    read_block_directory, find_postings, find_positions, find_raw_postings,
+    encode_varints, decode_varints
+)
+
+# List lengths around the block boundaries, for the default and a tiny block size
+SIZES = [1, 2, 3, 4, 5, 8, 9, 127, 128, 129, 256, 300, 1000]
+BLOCK_SIZES = [128, 4]
+
+# Bytes written before each list, so no decoder can assume offset 0
+PREFIX = b'\xff' * 13
+
+
+def _random_postings(rng, count):
+    """Sorted unique doc IDs with small and huge gaps, tf >= 1, and positions per doc"""
+    docs, doc = [], 0
+    for _ in range(count):
+        doc += rng.choice([1, 1, 2, 7, 300, 70000, 1 << 24])
+        docs.append(doc)
+    freqs = [rng.choice([1, 1, 2, 3, 40, 200]) for _ in docs]
+    positions = [sorted(rng.sample(range(tf * 3 + 5), tf)) for tf in freqs]
+    return docs, freqs, positions
+
+
+def _encode(docs, freqs, positions, block_size, flags):
+    """(list buffer, list offset, positions buffer, format, weights) of one encoded list"""
+    fmt = IndexFormat(FORMAT_COMPRESSED, flags, block_size, 1.2, 0.75)
+    weights = None
+    if fmt.has_block_max:
+        weights = np.array(freqs, dtype=np.float32) / (np.array(freqs, dtype=np.float32) + 1.2)
+    pos_buf = b''
+    positions_offset = positions_nbytes = None
+    if fmt.has_positions:
+        data, positions_nbytes = encode_positions(positions, block_size)
+        positions_offset = len(PREFIX)
+        pos_buf = PREFIX + data
+    data = encode_posting_list(docs, block_size, freqs if fmt.has_freqs else None, weights,
+                               positions_offset, positions_nbytes)
+    return PREFIX + data, len(PREFIX), pos_buf, fmt, weights
+
+
+def _targets(rng, docs):
+    """Sorted unique lookups: about half of them in the list"""
+    present = rng.sample(docs, max(1, len(docs) // 2))
+    absent = [rng.randrange(0, docs[-1] + 10) for _ in range(len(docs) // 2 + 2)]
+    return np.array(sorted(set(present + absent)), dtype=np.uint32)
+
+
+def test_varints():
+    values = [0, 1, 127, 128, 16383, 16384, (1 << 32) - 1]
+    buf = bytes(encode_varints(values))
+    assert decode_varints(buf).tolist() == values
+    assert decode_varints(b'\x00' + buf, 1, len(buf)).tolist() == values
+
+
+def test_round_trip():
+    rng = random.Random(1)
+    for block_size in BLOCK_SIZES:
+        for count in SIZES:
+            docs, freqs, positions = _random_postings(rng, count)
+            for flags in (0, FLAG_FREQS, FLAG_FREQS | FLAG_BLOCK_MAX,
+                          FLAG_FREQS | FLAG_POSITIONS, FLAG_FREQS | FLAG_BLOCK_MAX | FLAG_POSITIONS):
+                buf, offset, _, fmt, weights = _encode(docs, freqs, positions, block_size, flags)
+                got_docs, got_freqs = decode_posting_list(buf, offset, count, fmt)
+                assert got_docs.tolist() == docs, (block_size, count, flags)
+                if fmt.has_freqs:
+                    assert got_freqs.tolist() == freqs, (block_size, count, flags)
+                else:
+                    assert got_freqs is None
+                if fmt.has_block_max:
+                    # Bounds must cover every posting of the list and of each block
+                    assert read_term_max(buf, offset) >= weights.max()
+                    directory = read_block_directory(buf, offset, count, fmt)
+                    for i, bound in enumerate(directory['max_score'].tolist()):
+                        assert bound >= weights[i * block_size:(i + 1) * block_size].max()
+
+
+def test_find_postings():
+    rng = random.Random(2)
+    for block_size in BLOCK_SIZES:
+        for count in SIZES:
+            docs, freqs, positions = _random_postings(rng, count)
+            tf_of = dict(zip(docs, freqs))
+            for flags in (0, FLAG_FREQS, FLAG_FREQS | FLAG_BLOCK_MAX | FLAG_POSITIONS):
+                buf, offset, _, fmt, _ = _encode(docs, freqs, positions, block_size, flags)
+                targets = _targets(rng, docs)
+                found, got_freqs = find_postings(buf, offset, count, fmt, targets)
+                expected = [int(t) in tf_of for t in targets]
+                assert found.tolist() == expected, (block_size, count, flags)
+                if fmt.has_freqs:
+                    assert got_freqs.tolist() == [tf_of.get(int(t), 0) for t in targets]
+                empty, _ = find_postings(buf, offset, count, fmt, np.empty(0, dtype=np.uint32))
+                assert empty.size == 0
+
+
+def test_find_positions():
+    rng = random.Random(3)
+    for block_size in BLOCK_SIZES:
+        for count in SIZES:
+            docs, freqs, positions = _random_postings(rng, count)
+            positions_of = dict(zip(docs, positions))
+            buf, offset, pos_buf, fmt, _ = _encode(docs, freqs, positions, block_size,
+                                                   FLAG_FREQS | FLAG_POSITIONS)
+            targets = _targets(rng, docs)
+            index, got = find_positions(buf, offset, count, fmt, pos_buf, targets)
+            expected = [(i, p) for i, t in enumerate(targets.tolist()) for p in positions_of.get(t, [])]
+            assert list(zip(index.tolist(), got.tolist())) == expected, (block_size, count)
+
+
+def test_raw_postings():
+    rng = random.Random(4)
+    docs, _, _ = _random_postings(rng, 300)
+    buf = PREFIX + struct.pack(f'<{len(docs)}I', *docs)
+    targets = _targets(rng, docs)
+    found, freqs = find_raw_postings(buf, len(PREFIX), len(docs), targets)
+    assert found.tolist() == [int(t) in set(docs) for t in targets]
+    assert freqs is None
+
+
+if __name__ == "__main__":
+    for test in (test_varints, test_round_trip, test_find_postings, test_find_positions, test_raw_postings):
+        test()
+        print(f"[OK] {test.__name__}")